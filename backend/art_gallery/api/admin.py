@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ArtPicture, Cart, CartItem, Order, OrderItem, Message
+from .models import ArtPicture, Cart, CartItem, Order, OrderItem, OrderStatusChange, Message
 
 @admin.register(ArtPicture)
 class ArtPictureAdmin(admin.ModelAdmin):
@@ -17,12 +17,33 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'art_picture', 'quantity', 'added_at')
     search_fields = ('cart__user__username', 'art_picture__title')
 
+class OrderStatusChangeInline(admin.TabularInline):
+    model = OrderStatusChange
+    fields = ('from_status', 'to_status', 'changed_by', 'note', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+def transition_action(to_status):
+    def action(modeladmin, request, queryset):
+        moved = queryset.transition(to_status, changed_by=request.user)
+        modeladmin.message_user(request, f'{len(moved)} orders marked {to_status}, {queryset.count() - len(moved)} skipped')
+    action.__name__ = f'mark_{to_status}'
+    action.short_description = f'Mark selected orders {to_status}'
+    return action
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'user', 'status', 'payment_method', 'total_price', 'created_at')
-    list_filter = ('status', 'payment_method', 'created_at')
+    list_filter = ('status', 'payment_method', 'needs_reconciliation', 'created_at')
     search_fields = ('order_number', 'user__username')
-    readonly_fields = ('order_number', 'created_at', 'paid_at')
+    # Status only changes through the transition actions
+    readonly_fields = ('order_number', 'status', 'created_at', 'paid_at', 'unapplied_payments')
+    inlines = [OrderStatusChangeInline]
+    actions = [transition_action(to_status) for to_status in ('shipped', 'delivered', 'cancelled')]
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'art_gallery.api' 
\ No newline at end of file
+    name = 'art_gallery.api'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,110 @@
+"""
+Versioned response cache for public catalog reads.
+
+Every cached response is keyed under the current catalog generation. Saving or
+deleting an ArtPicture bumps the generation (see signals.py), which orphans all
+previously cached entries at once instead of hunting them down key by key.
+
+The generation is a single database row (CatalogGeneration), not a cache entry,
+so a bump made by one web worker or by a management command (import_art,
+ingest_external_images, release_expired_reservations,
+generate_image_derivatives) reaches every process whatever the cache backend.
+Reading it costs one primary-key query per catalog request. With the default
+locmem backend each process still keeps its own copy of the entries; use a
+shared backend (redis, memcached) to share them between workers.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from rest_framework.response import Response
+
+from .models import CatalogGeneration
+
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def get_catalog_cache():
+    """Return the cache backend configured for catalog responses"""
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _incr(key):
+    """Increment a counter, creating it if it doesn't exist yet"""
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Counters never expire so stats survive the entry TTL
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def get_generation():
+    """Current catalog generation, starting at 1"""
+    generation = CatalogGeneration.objects.filter(pk=1).values_list('value', flat=True).first()
+    if generation is None:
+        generation = CatalogGeneration.objects.get_or_create(pk=1)[0].value
+    return generation
+
+
+def bump_generation():
+    """Invalidate every cached catalog response, in every process, in O(1)"""
+    if not CatalogGeneration.objects.filter(pk=1).update(value=F('value') + 1):
+        CatalogGeneration.objects.get_or_create(pk=1)
+        CatalogGeneration.objects.filter(pk=1).update(value=F('value') + 1)
+
+
+def get_cache_stats():
+    """Return the catalog cache hit/miss counters and current generation"""
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'generation': get_generation(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def catalog_cache_key(request, view_name):
+    """Build the cache key for a catalog request"""
+    user = request.user
+    audience = 'staff' if (user.is_staff or user.is_superuser) else 'public'
+    query = '&'.join(
+        f'{key}={value}'
+        for key in sorted(request.query_params)
+        for value in request.query_params.getlist(key)
+    )
+    # Host is part of the key because paginated responses embed absolute cursor URLs
+    digest = hashlib.sha1(f'{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+    return f'catalog:v{get_generation()}:{audience}:{view_name}:{digest}'
+
+
+def cached_catalog_response(request, view_name, render):
+    """
+    Serve a catalog response from the cache, rendering and storing it on a miss.
+
+    Only successful responses are cached; `render` is called without arguments
+    and must return a DRF Response.
+    """
+    cache = get_catalog_cache()
+    key = catalog_cache_key(request, view_name)
+
+    data = cache.get(key)
+    if data is not None:
+        _incr(HITS_KEY)
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    _incr(MISSES_KEY)
+    response = render()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,114 @@
+"""
+Anonymous shopping carts kept in the cache instead of the database.
+
+A guest cart is a small {art_picture_id: quantity} mapping stored under a random
+id carried in a signed cookie. Every change refreshes its TTL, so abandoned carts
+simply expire and browsing visitors never write to MySQL. When the visitor logs
+in, the guest cart is merged into their Cart with one bulk upsert.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .models import ArtPicture, Cart, CartItem
+
+COOKIE_SALT = 'art_gallery.api.guest_cart'
+
+
+def get_guest_cart_cache():
+    """Return the cache backend configured for guest carts"""
+    return caches[getattr(settings, 'GUEST_CART_CACHE_ALIAS', 'default')]
+
+
+def get_guest_cart_ttl():
+    return getattr(settings, 'GUEST_CART_TTL', 7 * 24 * 3600)
+
+
+def _cache_key(guest_id):
+    return f'guest_cart:{guest_id}'
+
+
+def get_guest_id(request):
+    """The guest cart id from the signed cookie, or None if absent or tampered with"""
+    return request.get_signed_cookie(
+        settings.GUEST_CART_COOKIE_NAME, default=None, salt=COOKIE_SALT, max_age=get_guest_cart_ttl()
+    )
+
+
+def new_guest_id():
+    return uuid.uuid4().hex
+
+
+def load_guest_cart(guest_id):
+    """Return (lines, version) for a guest cart; an unknown id is an empty cart"""
+    if guest_id is None:
+        return {}, 0
+    data = get_guest_cart_cache().get(_cache_key(guest_id))
+    if data is None:
+        return {}, 0
+    return data['lines'], data['version']
+
+
+def save_guest_cart(guest_id, lines, version):
+    """Store a guest cart, restarting its TTL"""
+    get_guest_cart_cache().set(
+        _cache_key(guest_id), {'lines': lines, 'version': version}, timeout=get_guest_cart_ttl()
+    )
+
+
+def delete_guest_cart(guest_id):
+    get_guest_cart_cache().delete(_cache_key(guest_id))
+
+
+def set_guest_cookie(response, guest_id):
+    response.set_signed_cookie(
+        settings.GUEST_CART_COOKIE_NAME, guest_id, salt=COOKIE_SALT,
+        max_age=get_guest_cart_ttl(), httponly=True, samesite='Lax',
+        secure=settings.SESSION_COOKIE_SECURE,
+    )
+
+
+def clear_guest_cookie(response):
+    response.delete_cookie(settings.GUEST_CART_COOKIE_NAME, samesite='Lax')
+
+
+def merge_guest_cart(user, guest_id):
+    """
+    Fold a guest cart into the user's Cart and discard it.
+
+    Quantities are added to any lines the user already has. Pictures that were
+    sold or withdrawn while the guest cart sat in the cache are dropped. Returns
+    the number of lines merged.
+    """
+    lines, version = load_guest_cart(guest_id)
+    if not lines:
+        return 0
+
+    available = set(ArtPicture.objects.filter(pk__in=list(lines), is_available=True).values_list('id', flat=True))
+    lines = {pk: quantity for pk, quantity in lines.items() if pk in available}
+
+    if lines:
+        with transaction.atomic():
+            # Writers that add lines (add_item, batch) lock the cart row too, so none of
+            # them can insert or bump a line between this read and the upsert below
+            cart, created = Cart.objects.select_for_update().get_or_create(user=user)
+            existing = dict(
+                CartItem.objects.select_for_update()
+                .filter(cart=cart, art_picture_id__in=list(lines))
+                .values_list('art_picture_id', 'quantity')
+            )
+            items = [
+                CartItem(cart=cart, art_picture_id=pk, quantity=existing.get(pk, 0) + quantity)
+                for pk, quantity in lines.items()
+            ]
+            # MySQL's ON DUPLICATE KEY UPDATE can't name a conflict target
+            unique_fields = ['cart', 'art_picture'] if connection.features.supports_update_conflicts_with_target else None
+            CartItem.objects.bulk_create(
+                items, update_conflicts=True, unique_fields=unique_fields, update_fields=['quantity'],
+            )
+            Cart.objects.filter(pk=cart.pk).refresh_summary()
+
+    delete_guest_cart(guest_id)
+    return len(lines)
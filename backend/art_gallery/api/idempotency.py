@@ -0,0 +1,127 @@
+"""
+Idempotency-Key support for endpoints that must not run twice.
+
+A client that may retry (flaky mobile connection, double submit) sends a unique
+Idempotency-Key header. The first request claims the key by inserting an
+IdempotencyKey row and, once it finishes, stores its response on that row.
+Retries with the same key get the stored response replayed instead of creating
+another order or charging the card again. Keys expire after IDEMPOTENCY_KEY_TTL
+seconds; purge_idempotency_keys deletes the expired rows. A claim whose request
+never finished (the worker died mid-request) is taken over by a retry once it is
+IDEMPOTENCY_KEY_LEASE seconds old.
+"""
+import functools
+import hashlib
+import json
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+
+def get_idempotency_key(request):
+    """The client's Idempotency-Key header, or None"""
+    return request.headers.get('Idempotency-Key') or None
+
+
+def request_fingerprint(request, scope):
+    """Hash of what the request asks for, so a key reused for a different request is rejected"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{scope}\n{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def get_lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 120))
+
+
+def claim_key(user, key, scope, fingerprint):
+    """Insert the in-progress record for a key, returning (record, created); record is None if it just vanished"""
+    now = timezone.now()
+    # An expired record no longer holds its key, nor does a claim whose request died without answering
+    IdempotencyKey.objects.filter(user=user, key=key).filter(
+        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=now - get_lease())
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, scope=scope, fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600)),
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def replay(record, fingerprint):
+    """The stored response for a retried request"""
+    if record is None or record.status_code is None:
+        response = Response(
+            {'error': 'A request with this Idempotency-Key is still being processed'},
+            status=status.HTTP_409_CONFLICT
+        )
+        if record is not None:
+            # The claim can be taken over once its lease runs out
+            remaining = record.created_at + get_lease() - timezone.now()
+            response['Retry-After'] = str(max(1, math.ceil(remaining.total_seconds())))
+        return response
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': 'This Idempotency-Key was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """
+    Honour the Idempotency-Key header on a viewset action.
+
+    Only completed responses are stored. A 5xx or an exception releases the
+    key so the client can retry. Nested idempotent actions (restore_order
+    calling create) share the outer action's key.
+    """
+    def decorator(view_method):
+        @functools.wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            key = get_idempotency_key(request)
+            if key is None or getattr(request, 'idempotency_record', None) is not None:
+                return view_method(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fingerprint = request_fingerprint(request, scope)
+            record, created = claim_key(request.user, key, scope, fingerprint)
+            if not created:
+                return replay(record, fingerprint)
+
+            request.idempotency_record = record
+            try:
+                response = view_method(view, request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                # A no-op if the request outlived its lease and a retry took the key over
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    status_code=response.status_code, response=response.data,
+                )
+            return response
+        return wrapper
+    return decorator
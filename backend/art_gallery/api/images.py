@@ -0,0 +1,156 @@
+"""
+Image derivative pipeline.
+
+Uploaded originals are resized into fixed-width derivatives (grid thumbnail,
+detail view and zoom) in JPEG and WebP. Rendering runs in a process pool off the
+request thread. Originals are read and derivatives written through
+default_storage, so they follow the configured storage backend; once a
+picture's derivatives are written, their storage names are recorded in
+ArtPicture.image_derivatives.
+"""
+import atexit
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Derivative name -> target width in pixels
+DERIVATIVE_WIDTHS = {
+    'thumbnail': 400,
+    'detail': 1200,
+    'zoom': 2400,
+}
+
+# Output format -> (file extension, Pillow save options)
+DERIVATIVE_FORMATS = {
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+}
+
+DERIVATIVES_DIR = 'art_pictures/derivatives'
+
+
+def derivative_name(source_name, size, extension):
+    """Name a derivative is saved under, e.g. art_pictures/derivatives/buddha_400.webp; the storage may rename it"""
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'{DERIVATIVES_DIR}/{stem}_{DERIVATIVE_WIDTHS[size]}.{extension}'
+
+
+def render_derivatives(source_name):
+    """
+    Render every derivative of a single image.
+
+    Runs inside a pool worker and only touches storage, returning a plain dict:
+    {size: {'width': int, 'height': int, format: storage name}}. Sizes wider
+    than the original are skipped rather than upscaled, except the thumbnail
+    which is always produced.
+    """
+    from PIL import Image, ImageOps
+
+    derivatives = {}
+    with default_storage.open(source_name, 'rb') as source:
+        data = io.BytesIO(source.read())
+
+    with Image.open(data) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+
+        for size, width in DERIVATIVE_WIDTHS.items():
+            if original.width < width and size != 'thumbnail':
+                continue
+            target_width = min(width, original.width)
+            target_height = max(1, round(original.height * target_width / original.width))
+            resized = original.resize((target_width, target_height), Image.LANCZOS)
+
+            entry = {'width': target_width, 'height': target_height}
+            for fmt, (extension, options) in DERIVATIVE_FORMATS.items():
+                output = io.BytesIO()
+                resized.save(output, **options)
+                # The storage may pick another name (e.g. the content hash), so record the one it returns
+                entry[fmt] = default_storage.save(
+                    derivative_name(source_name, size, extension), ContentFile(output.getvalue())
+                )
+            derivatives[size] = entry
+
+    return {'source': source_name, 'sizes': derivatives}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Lazily start the process pool shared by all requests in this process"""
+    global _executor
+    with _executor_lock:
+        # A crashed worker leaves the pool permanently broken, so start a fresh one
+        if _executor is None or getattr(_executor, '_broken', False):
+            # Spawned (not forked) workers never inherit the parent's DB connections or threads;
+            # they set Django up themselves so default_storage is configured there too
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+            atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def store_derivatives(picture_id, result):
+    """Record rendered derivatives on the picture, returning True if it was updated"""
+    from .cache import bump_generation
+    from .models import ArtPicture
+
+    # Only record the result if the image hasn't been replaced in the meantime
+    updated = ArtPicture.objects.filter(pk=picture_id, image=result['source']).update(image_derivatives=result)
+    if updated:
+        bump_generation()
+    return bool(updated)
+
+
+def _on_derivatives_rendered(picture_id, future):
+    """Done-callback for pool futures; runs in the pool's management thread"""
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception('Failed to render image derivatives for art picture %s', picture_id)
+        return
+
+    close_old_connections()
+    try:
+        store_derivatives(picture_id, result)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(picture):
+    """Render derivatives for a picture's uploaded image in the background"""
+    if not picture.image:
+        return None
+    future = get_executor().submit(render_derivatives, picture.image.name)
+    future.add_done_callback(lambda f, picture_id=picture.pk: _on_derivatives_rendered(picture_id, f))
+    return future
+
+
+def needs_derivatives(picture):
+    """True if the picture has an uploaded image whose derivatives are missing or stale"""
+    if not picture.image:
+        return False
+    derivatives = picture.image_derivatives or {}
+    return derivatives.get('source') != picture.image.name
+
+
+def schedule_derivatives_on_commit(picture):
+    """Schedule derivative rendering once the current transaction commits"""
+    transaction.on_commit(lambda: schedule_derivatives(picture))
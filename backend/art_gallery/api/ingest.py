@@ -0,0 +1,138 @@
+"""
+Ingestion of external `image_url` images into local storage.
+
+Downloads run on an asyncio event loop with a semaphore bounding concurrency;
+persisting the results (storage writes and database updates) happens back in
+synchronous code. Identical images are stored once, keyed by their SHA-256.
+Failed downloads are retried with exponential backoff.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import urlparse
+
+import httpx
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+BACKOFF_BASE = timedelta(minutes=5)
+BACKOFF_MAX = timedelta(days=1)
+
+
+@dataclass
+class FetchResult:
+    picture_id: int
+    url: str
+    content: bytes = None
+    content_type: str = ''
+    error: str = ''
+
+    @property
+    def ok(self):
+        return self.content is not None
+
+
+async def _fetch_one(client, semaphore, picture_id, url):
+    async with semaphore:
+        try:
+            async with client.stream('GET', url) as response:
+                if response.status_code != 200:
+                    return FetchResult(picture_id, url, error=f'HTTP {response.status_code}')
+                content_type = response.headers.get('content-type', '').split(';')[0].strip()
+                if not content_type.startswith('image/'):
+                    return FetchResult(picture_id, url, error=f'Not an image ({content_type or "no content type"})')
+
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > MAX_IMAGE_BYTES:
+                        return FetchResult(picture_id, url, error='Image too large')
+                    chunks.append(chunk)
+                return FetchResult(picture_id, url, content=b''.join(chunks), content_type=content_type)
+        except httpx.HTTPError as e:
+            return FetchResult(picture_id, url, error=f'{type(e).__name__}: {e}'[:255])
+
+
+async def fetch_images(items, concurrency=8, timeout=20.0):
+    """Download [(picture id, url)] with at most `concurrency` requests in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True) as client:
+        return await asyncio.gather(*(
+            _fetch_one(client, semaphore, picture_id, url) for picture_id, url in items
+        ))
+
+
+def image_storage_name(url, content_type, digest):
+    """Storage name for a downloaded image, e.g. art_pictures/ingested/3f2a...9c.jpg"""
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    if not extension or len(extension) > 5:
+        extension = mimetypes.guess_extension(content_type) or '.jpg'
+    return f'art_pictures/ingested/{digest}{extension}'
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts"""
+    delay = min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def ingest_pictures(pictures, concurrency=8, timeout=20.0):
+    """
+    Download and store the external images of the given pictures.
+
+    Returns (ingested, failed) counts. Pictures are updated with
+    QuerySet.update() so no save signals fire per row.
+    """
+    from .models import ArtPicture
+
+    results = asyncio.run(fetch_images(
+        [(picture.pk, picture.image_url) for picture in pictures], concurrency, timeout
+    ))
+    attempts = {picture.pk: picture.image_fetch_attempts for picture in pictures}
+
+    digests = {result.picture_id: hashlib.sha256(result.content).hexdigest() for result in results if result.ok}
+    # Reuse files already stored for identical content instead of writing duplicates
+    stored = dict(
+        ArtPicture.objects.filter(image_sha256__in=set(digests.values()))
+        .exclude(image='').exclude(image__isnull=True)
+        .values_list('image_sha256', 'image')
+    )
+
+    ingested = failed = 0
+    now = timezone.now()
+    for result in results:
+        if not result.ok:
+            failed += 1
+            attempt = attempts[result.picture_id] + 1
+            ArtPicture.objects.filter(pk=result.picture_id).update(
+                image_fetch_attempts=attempt,
+                image_fetch_error=result.error[:255],
+                image_fetch_retry_at=now + backoff_delay(attempt),
+            )
+            continue
+
+        digest = digests[result.picture_id]
+        name = stored.get(digest)
+        if name is None:
+            name = default_storage.save(
+                image_storage_name(result.url, result.content_type, digest), ContentFile(result.content)
+            )
+            stored[digest] = name
+        ArtPicture.objects.filter(pk=result.picture_id).update(
+            image=name,
+            image_sha256=digest,
+            image_fetch_error='',
+            image_fetch_retry_at=None,
+            updated_at=now,
+        )
+        ingested += 1
+
+    return ingested, failed
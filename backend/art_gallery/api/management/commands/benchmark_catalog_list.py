@@ -0,0 +1,82 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from art_gallery.api.images import derivative_name, DERIVATIVE_FORMATS
+from art_gallery.api.models import ArtPicture
+from art_gallery.api.serializers import ArtPictureSerializer, ArtPictureListSerializer
+
+
+def sample_pictures(count):
+    """Unsaved pictures cycling through the image states the serializers handle differently"""
+    pictures = []
+    for i in range(count):
+        image = f'art_pictures/bench_{i}.jpg' if i % 3 else ''
+        derivatives = {}
+        if i % 3 == 1:
+            derivatives = {'source': image, 'sizes': {'thumbnail': {
+                'width': 400, 'height': 300,
+                **{fmt: derivative_name(image, 'thumbnail', extension) for fmt, (extension, options) in DERIVATIVE_FORMATS.items()},
+            }}}
+        pictures.append(ArtPicture(
+            title=f'Benchmark picture {i}',
+            description='Oil on canvas. ' * 10,
+            price=Decimal('10.00') + i % 500,
+            image=image,
+            image_url='' if i % 2 else f'https://example.com/{i}.jpg',
+            image_derivatives=derivatives,
+            stock=i % 4,
+        ))
+    return pictures
+
+
+class Command(BaseCommand):
+    help = (
+        'Times catalog list rendering with ArtPictureSerializer and the .values() based ArtPictureListSerializer '
+        'on generated rows, checks the output is byte-identical, and rolls the rows back afterwards'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Catalog sizes to time')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the fastest is reported')
+
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get('/api/art-pictures/'))
+        context = {'request': request}
+        renderer = JSONRenderer()
+
+        def render_models(queryset):
+            return renderer.render(ArtPictureSerializer(list(queryset), many=True, context=context).data)
+
+        def render_values(queryset):
+            rows = queryset.values(*ArtPictureListSerializer.get_values_fields())
+            return renderer.render(ArtPictureListSerializer(rows, context=context).data)
+
+        for count in options['rows']:
+            with transaction.atomic():
+                ArtPicture.objects.bulk_create(sample_pictures(count), batch_size=1000)
+                queryset = ArtPicture.objects.filter(title__startswith='Benchmark picture ').order_by('-created_at', '-id')
+                if render_models(queryset) != render_values(queryset):
+                    raise CommandError(f'Serializers disagree on {count} rows')
+
+                timings = {}
+                for name, render in (('ArtPictureSerializer', render_models), ('ArtPictureListSerializer', render_values)):
+                    runs = []
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        render(queryset)
+                        runs.append(time.perf_counter() - started)
+                    timings[name] = min(runs) * 1000
+
+                self.stdout.write(
+                    f'{count} rows: ArtPictureSerializer {timings["ArtPictureSerializer"]:.0f} ms, '
+                    f'ArtPictureListSerializer {timings["ArtPictureListSerializer"]:.0f} ms '
+                    f'({timings["ArtPictureSerializer"] / timings["ArtPictureListSerializer"]:.1f}x)'
+                )
+                # Leave the catalog as it was
+                transaction.set_rollback(True)
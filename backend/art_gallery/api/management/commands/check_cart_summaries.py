@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from art_gallery.api.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Finds carts whose stored item count/total drifted from their items (e.g. after raw SQL edits) and repairs them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted carts')
+        parser.add_argument('--batch-size', type=int, default=500, help='Carts repaired per transaction')
+
+    def handle(self, *args, **options):
+        drifted = Cart.objects.with_computed_summary().filter(
+            ~Q(item_count=F('computed_item_count')) | ~Q(total_price=F('computed_total_price'))
+        ).order_by('id')
+
+        repaired = 0
+        last_id = 0
+        while True:
+            batch = list(drifted.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            for cart in batch:
+                self.stdout.write(
+                    f'Cart {cart.pk}: stored {cart.item_count} items / {cart.total_price}, '
+                    f'actual {cart.computed_item_count} items / {cart.computed_total_price}'
+                )
+            if options['dry_run']:
+                repaired += len(batch)
+                continue
+
+            # One UPDATE recomputing each cart from its items, so concurrent item changes aren't lost
+            repaired += Cart.objects.filter(pk__in=[cart.pk for cart in batch]).refresh_summary()
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {repaired} drifted carts'))
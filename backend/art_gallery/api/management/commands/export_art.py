@@ -0,0 +1,70 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from art_gallery.api.management.commands.import_art import IMPORT_FIELDS
+from art_gallery.api.models import ArtPicture
+
+EXPORT_FIELDS = IMPORT_FIELDS + ['created_at', 'updated_at']
+
+
+class Command(BaseCommand):
+    help = 'Streams all art pictures to a CSV or JSONL file that import_art can read back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, or "-" to write to stdout')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Output format (default: from file extension)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+        parser.add_argument('--available-only', action='store_true', help='Only export available pictures')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        queryset = ArtPicture.objects.all()
+        if options['available_only']:
+            queryset = queryset.filter(is_available=True)
+        rows = self.iter_rows(queryset, options['chunk_size'])
+
+        if path == '-':
+            stream = sys.stdout
+        else:
+            try:
+                stream = open(path, 'w', newline='', encoding='utf-8')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        exported = 0
+        try:
+            if fmt == 'csv':
+                writer = csv.writer(stream)
+                writer.writerow(EXPORT_FIELDS)
+                for row in rows:
+                    writer.writerow(['' if value is None else value for value in row])
+                    exported += 1
+            else:
+                for row in rows:
+                    record = dict(zip(EXPORT_FIELDS, row))
+                    record['price'] = str(record['price'])
+                    record['created_at'] = record['created_at'].isoformat()
+                    record['updated_at'] = record['updated_at'].isoformat()
+                    stream.write(json.dumps(record) + '\n')
+                    exported += 1
+        finally:
+            if path != '-':
+                stream.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(f'Exported {exported} art pictures to {path}'))
+
+    def iter_rows(self, queryset, chunk_size):
+        """Yield rows in id order using keyset chunks, so memory stays constant on any backend"""
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*EXPORT_FIELDS)[:chunk_size])
+            if not chunk:
+                return
+            yield from chunk
+            last_id = chunk[-1][0]
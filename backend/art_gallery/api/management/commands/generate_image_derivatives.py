@@ -0,0 +1,49 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from art_gallery.api.images import get_executor, needs_derivatives, render_derivatives, store_derivatives
+from art_gallery.api.models import ArtPicture
+
+
+class Command(BaseCommand):
+    help = 'Renders thumbnail/detail/zoom derivatives (JPEG and WebP) for existing art pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render derivatives even for pictures that already have them',
+        )
+
+    def handle(self, *args, **options):
+        pictures = ArtPicture.objects.exclude(image='').exclude(image__isnull=True).only(
+            'id', 'image', 'image_derivatives'
+        )
+        pending = [p for p in pictures.iterator() if options['force'] or needs_derivatives(p)]
+
+        if not pending:
+            self.stdout.write(self.style.SUCCESS('All art pictures already have derivatives'))
+            return
+
+        self.stdout.write(f'Rendering derivatives for {len(pending)} art pictures...')
+        executor = get_executor()
+        futures = {
+            executor.submit(render_derivatives, picture.image.name): picture
+            for picture in pending
+        }
+
+        rendered = 0
+        failed = 0
+        for done, future in enumerate(as_completed(futures), start=1):
+            picture = futures[future]
+            try:
+                store_derivatives(picture.pk, future.result())
+                rendered += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'Failed to render "{picture.image.name}" (id {picture.pk}): {e}')
+            if done % 50 == 0 or done == len(futures):
+                self.stdout.write(f'  {done}/{len(futures)} processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives for {rendered} art pictures ({failed} failed)'))
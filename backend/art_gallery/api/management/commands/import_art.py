@@ -0,0 +1,188 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from art_gallery.api.cache import bump_generation
+from art_gallery.api.models import ArtPicture, Cart
+
+# Columns that may be imported; `id` is optional and turns the row into an upsert
+IMPORT_FIELDS = ['id', 'title', 'description', 'price', 'image', 'image_url', 'is_available', 'stock']
+# Stock is only set on insert: re-importing an export must not undo sales made since
+UPDATE_FIELDS = ['title', 'description', 'price', 'image', 'image_url', 'is_available', 'updated_at']
+
+
+def read_csv(stream):
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        yield line_number, row
+
+
+def read_jsonl(stream):
+    # Lines are decoded by build_picture so a malformed line is reported like any other invalid row
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def build_picture(row):
+    """Build an unsaved ArtPicture from an import row (dict or JSON text), raising ValueError if invalid"""
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'invalid JSON: {e.msg} at column {e.colno}')
+    if not isinstance(row, dict):
+        raise ValueError('each row must be a JSON object')
+    title = str(row.get('title') or '').strip()
+    if not title:
+        raise ValueError('title is required')
+    try:
+        price = Decimal(str(row.get('price', '')).strip())
+    except InvalidOperation:
+        raise ValueError(f'invalid price "{row.get("price")}"')
+    if not price.is_finite():
+        raise ValueError(f'invalid price "{row.get("price")}"')
+    if price < 0:
+        raise ValueError('price must not be negative')
+    try:
+        price = price.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        # More digits than the decimal context holds
+        raise ValueError('price is too large')
+    if price >= Decimal('100000000'):
+        raise ValueError('price is too large')
+
+    try:
+        stock = int(row['stock']) if row.get('stock') not in (None, '') else 1
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError(f'invalid stock "{row.get("stock")}"')
+    if stock < 0:
+        raise ValueError('stock must not be negative')
+
+    picture_id = row.get('id')
+    try:
+        picture_id = int(picture_id) if picture_id not in (None, '') else None
+    except (ValueError, TypeError, OverflowError):
+        raise ValueError(f'invalid id "{row.get("id")}"')
+    return ArtPicture(
+        id=picture_id,
+        title=title[:200],
+        description=row.get('description') or '',
+        price=price,
+        image=row.get('image') or None,
+        image_url=row.get('image_url') or None,
+        is_available=parse_bool(row.get('is_available', True)),
+        stock=stock,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams art pictures from a CSV or JSONL file and upserts them in batches. '
+        'Rows with an id update the existing picture, rows without one are inserted. '
+        'Run generate_image_derivatives afterwards for rows with uploaded images.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or "-" to read from stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from file extension)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk statement and transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the input without writing anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if path == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        reader = read_jsonl(stream) if fmt == 'jsonl' else read_csv(stream)
+        started = time.monotonic()
+        processed = 0
+        written = 0
+        errors = []
+        batch = []
+
+        try:
+            for line_number, row in reader:
+                try:
+                    batch.append(build_picture(row))
+                except (ValueError, TypeError) as e:
+                    errors.append((line_number, str(e)))
+                    continue
+
+                if len(batch) >= batch_size:
+                    written += self.flush(batch, dry_run)
+                    processed += len(batch)
+                    batch = []
+                    self.report_progress(processed, started)
+
+            if batch:
+                written += self.flush(batch, dry_run)
+                processed += len(batch)
+        except csv.Error as e:
+            raise CommandError(f'Malformed input after {processed} rows: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if written:
+            bump_generation()
+
+        for line_number, message in errors[:50]:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if len(errors) > 50:
+            self.stderr.write(f'... and {len(errors) - 50} more invalid rows')
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else processed
+        verb = 'Validated' if dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {processed} art pictures in {elapsed:.1f}s ({rate:,.0f} rows/s), {len(errors)} invalid rows skipped'
+        ))
+
+    def flush(self, batch, dry_run):
+        """Write one batch in its own transaction, returning the number of rows written"""
+        if dry_run:
+            return 0
+
+        upserts = [picture for picture in batch if picture.id is not None]
+        inserts = [picture for picture in batch if picture.id is None]
+        with transaction.atomic():
+            if upserts:
+                # MySQL's ON DUPLICATE KEY UPDATE can't name a conflict target
+                unique_fields = ['id'] if connection.features.supports_update_conflicts_with_target else None
+                ArtPicture.objects.bulk_create(
+                    upserts,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=UPDATE_FIELDS,
+                )
+                # Upserts may have repriced pictures already in carts
+                Cart.objects.holding(picture.id for picture in upserts).refresh_summary()
+            if inserts:
+                ArtPicture.objects.bulk_create(inserts)
+        return len(batch)
+
+    def report_progress(self, processed, started):
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else processed
+        self.stdout.write(f'  {processed} rows ({rate:,.0f} rows/s)')
@@ -0,0 +1,51 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from art_gallery.api.cache import bump_generation
+from art_gallery.api.ingest import ingest_pictures
+from art_gallery.api.models import ArtPicture
+
+
+class Command(BaseCommand):
+    help = 'Downloads external image_url images into local storage so pages stop hot-linking third-party hosts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help='Maximum downloads in flight')
+        parser.add_argument('--batch-size', type=int, default=100, help='Pictures downloaded per batch')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Give up on a URL after this many failures')
+        parser.add_argument('--timeout', type=float, default=20.0, help='Per-request timeout in seconds')
+        parser.add_argument('--skip-derivatives', action='store_true', help="Don't render derivatives afterwards")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        candidates = ArtPicture.objects.filter(
+            Q(image='') | Q(image__isnull=True),
+            Q(image_fetch_retry_at__isnull=True) | Q(image_fetch_retry_at__lte=now),
+            image_url__isnull=False,
+            image_fetch_attempts__lt=options['max_attempts'],
+        ).exclude(image_url='').only('id', 'image_url', 'image_fetch_attempts').order_by('id')
+
+        total_ingested = total_failed = 0
+        last_id = 0
+        while True:
+            batch = list(candidates.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            ingested, failed = ingest_pictures(batch, options['concurrency'], options['timeout'])
+            total_ingested += ingested
+            total_failed += failed
+            self.stdout.write(f'  {total_ingested + total_failed} processed ({total_failed} failed)')
+
+        if total_ingested:
+            bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {total_ingested} external images ({total_failed} failed, will be retried with backoff)'
+        ))
+
+        if total_ingested and not options['skip_derivatives']:
+            call_command('generate_image_derivatives', stdout=self.stdout, stderr=self.stderr)
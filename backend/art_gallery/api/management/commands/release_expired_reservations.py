@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from art_gallery.api.models import Reservation
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancels pending orders whose stock reservations expired and returns the stock to the catalog. '
+        'Run it every minute or so from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders released per transaction')
+
+    def handle(self, *args, **options):
+        released = 0
+        while True:
+            count = Reservation.objects.release_expired(limit=options['batch_size'])
+            if not count:
+                break
+            released += count
+
+        self.stdout.write(self.style.SUCCESS(f'Released the reservations of {released} expired orders'))
@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from art_gallery.api.order_restore import read_ndjson, restore_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Restores orders from an NDJSON file, one order per line in the restore_order format. '
+        'Orders are inserted in chunked bulk transactions; invalid lines are reported and skipped. '
+        'Lines with an order_number that already exists are skipped, so an interrupted run can be repeated.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to restore, or "-" to read from stdin')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders per bulk insert and transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(path, encoding='utf-8')
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+        started = time.monotonic()
+        try:
+            report = restore_orders(read_ndjson(stream), batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in report.errors[:50]:
+            self.stderr.write(f'Line {error["line"]}: {error["error"]}')
+        if len(report.errors) > 50:
+            self.stderr.write(f'... and {len(report.errors) - 50} more invalid lines')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Restored {len(report.restored)} orders in {elapsed:.1f}s, {len(report.errors)} lines skipped'
+        ))
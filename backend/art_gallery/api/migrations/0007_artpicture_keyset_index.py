@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_orderuserview'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='artpicture',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='artpicture',
+            index=models.Index(fields=['is_available', '-created_at', '-id'], name='artpicture_avail_created_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:31
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FULLTEXT indexes are MySQL specific; other backends use the in-process search index
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX artpicture_fulltext_idx ON api_artpicture (title, description)'
+    )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX artpicture_fulltext_idx ON api_artpicture')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_artpicture_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
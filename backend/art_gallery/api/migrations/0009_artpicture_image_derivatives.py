@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_artpicture_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpicture',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, editable=False, help_text='Resized JPEG/WebP renditions of the uploaded image', null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_artpicture_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpicture',
+            name='image_fetch_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artpicture',
+            name='image_fetch_error',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='artpicture',
+            name='image_fetch_retry_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='artpicture',
+            name='image_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
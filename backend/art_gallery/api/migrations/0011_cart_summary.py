@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:33
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_summaries(apps, schema_editor):
+    Cart = apps.get_model('api', 'Cart')
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    carts = Cart.objects.annotate(
+        computed_item_count=Coalesce(Sum('cartitem__quantity'), Value(0)),
+        computed_total_price=Coalesce(
+            Sum(F('cartitem__quantity') * F('cartitem__art_picture__price'), output_field=money),
+            Value(Decimal('0.00')),
+            output_field=money,
+        ),
+    )
+    updated = []
+    for cart in carts:
+        cart.item_count = cart.computed_item_count
+        cart.total_price = cart.computed_total_price
+        updated.append(cart)
+    Cart.objects.bulk_update(updated, ['item_count', 'total_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_artpicture_image_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_cart_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:35
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartItem = apps.get_model('api', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'art_picture_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for line in duplicates:
+        CartItem.objects.filter(pk=line['keep_id']).update(quantity=line['total'])
+        CartItem.objects.filter(
+            cart_id=line['cart_id'], art_picture_id=line['art_picture_id'],
+        ).exclude(pk=line['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_cart_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'art_picture'), name='cartitem_cart_picture_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpicture',
+            name='stock',
+            field=models.PositiveIntegerField(default=1, help_text='Copies left to sell; 1 for an original, more for limited-edition prints'),
+        ),
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('art_picture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.artpicture')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.order')),
+            ],
+        ),
+    ]
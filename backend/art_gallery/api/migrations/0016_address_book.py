@@ -0,0 +1,83 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:05
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+ADDRESS_FIELDS = ('street', 'city', 'state', 'zipcode', 'country')
+
+
+def address_hash(fields):
+    # Same normalization as api.models.address_hash at the time of this migration
+    content = '\x1f'.join(' '.join(str(fields[name]).split()).casefold() for name in ADDRESS_FIELDS)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def collapse_duplicate_addresses(apps, schema_editor):
+    Address = apps.get_model('api', 'Address')
+    Order = apps.get_model('api', 'Order')
+
+    # Addresses had no owner; take it from the orders that use them
+    owners = {}
+    for user_id, shipping_id, billing_id in Order.objects.values_list(
+        'user_id', 'shipping_address_obj_id', 'billing_address_obj_id'
+    ).iterator():
+        for address_id in (shipping_id, billing_id):
+            if address_id is not None:
+                owners.setdefault(address_id, user_id)
+
+    keep = {}
+    duplicates = defaultdict(list)
+    addresses = []
+    for address in Address.objects.order_by('pk').only('id', *ADDRESS_FIELDS).iterator():
+        address.user_id = owners.get(address.pk)
+        address.content_hash = address_hash({name: getattr(address, name) for name in ADDRESS_FIELDS})
+        key = (address.user_id, address.content_hash)
+        if key in keep:
+            duplicates[keep[key]].append(address.pk)
+        else:
+            keep[key] = address.pk
+            addresses.append(address)
+
+    Address.objects.bulk_update(addresses, ['user', 'content_hash'], batch_size=1000)
+    for keep_id, duplicate_ids in duplicates.items():
+        Order.objects.filter(shipping_address_obj_id__in=duplicate_ids).update(shipping_address_obj_id=keep_id)
+        Order.objects.filter(billing_address_obj_id__in=duplicate_ids).update(billing_address_obj_id=keep_id)
+    duplicate_ids = [pk for ids in duplicates.values() for pk in ids]
+    for start in range(0, len(duplicate_ids), 1000):
+        Address.objects.filter(pk__in=duplicate_ids[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0015_order_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='addresses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='content_hash',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='address',
+            name='is_archived',
+            field=models.BooleanField(default=False, help_text='Removed from the address book but kept for past orders'),
+        ),
+        migrations.RunPython(collapse_duplicate_addresses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='address',
+            constraint=models.UniqueConstraint(fields=('user', 'content_hash'), name='address_user_hash_uniq'),
+        ),
+    ]
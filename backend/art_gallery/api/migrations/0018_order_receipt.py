@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_order_status_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='receipt',
+            field=models.JSONField(blank=True, editable=False, help_text="Stored receipt: {'html': storage name, 'status': status it shows}", null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_order_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='needs_reconciliation',
+            field=models.BooleanField(db_index=True, default=False, help_text='A late payment could not be refunded automatically'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unapplied_payments',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Late payments and the outcome of refunding them'),
+        ),
+    ]
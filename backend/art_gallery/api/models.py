@@ -1,8 +1,39 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+import hashlib
 import uuid
 
+from .receipts import RECEIPT_STATUSES, schedule_receipts_on_commit
+
+class ArtPictureQuerySet(models.QuerySet):
+    def adjust_stock(self, changes):
+        """
+        Add stock to (positive amounts) or take it from (negative amounts) many
+        pictures in one UPDATE. Pictures taken to zero leave the catalog and
+        pictures coming back from zero return to it.
+        """
+        availability = []
+        stock = []
+        for pk, amount in changes.items():
+            stock.append(When(pk=pk, then=F('stock') + amount))
+            if amount < 0:
+                availability.append(When(pk=pk, stock__lte=-amount, then=Value(False)))
+            else:
+                availability.append(When(pk=pk, stock=0, then=Value(True)))
+        return self.filter(pk__in=list(changes)).update(
+            # Assigned before stock: MySQL evaluates SET left to right, so this must see the old stock
+            is_available=Case(*availability, default=F('is_available')),
+            stock=Case(*stock, default=F('stock'), output_field=models.PositiveIntegerField()),
+            updated_at=timezone.now(),
+        )
+
 class ArtPicture(models.Model):
     """Model for art pictures that can be sold on the website"""
     title = models.CharField(max_length=200)
@@ -10,38 +41,121 @@ class ArtPicture(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='art_pictures/', null=True, blank=True)
     image_url = models.URLField(blank=True, null=True, help_text="URL to the image if no file is uploaded")
+    image_derivatives = models.JSONField(blank=True, null=True, editable=False, help_text="Resized JPEG/WebP renditions of the uploaded image")
+    
+    # State of downloading image_url into local storage (see ingest.py)
+    image_sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    image_fetch_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    image_fetch_error = models.CharField(max_length=255, blank=True, editable=False)
+    image_fetch_retry_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_available = models.BooleanField(default=True)
+    stock = models.PositiveIntegerField(default=1, help_text="Copies left to sell; 1 for an original, more for limited-edition prints")
+    
+    objects = ArtPictureQuerySet.as_manager()
     
     def __str__(self):
         return self.title
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Backs keyset pagination of the public catalog (is_available filter + cursor ordering)
+            models.Index(fields=['is_available', '-created_at', '-id'], name='artpicture_avail_created_idx'),
+        ]
         
     @property
     def get_image_url(self):
-        """Get the image URL, whether from uploaded file or external URL"""
+        """Get the image URL, preferring the local (uploaded or ingested) copy over the external URL"""
         if self.image and hasattr(self.image, 'url'):
             return self.image.url
         elif self.image_url:
             return self.image_url
         return None
 
+def cart_total_expression(prefix=''):
+    """Sum(quantity * price) over cart items, computed by the database"""
+    return Coalesce(
+        Sum(
+            F(f'{prefix}quantity') * F(f'{prefix}art_picture__price'),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        ),
+        Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+class CartQuerySet(models.QuerySet):
+    def with_computed_summary(self):
+        """Annotate each cart with its item count and total recomputed from the items"""
+        return self.annotate(
+            computed_item_count=Coalesce(Sum('cartitem__quantity'), Value(0)),
+            computed_total_price=cart_total_expression('cartitem__'),
+        )
+    
+    def holding(self, art_picture_ids):
+        """Carts with a line for any of these pictures"""
+        return self.filter(pk__in=CartItem.objects.filter(art_picture_id__in=list(art_picture_ids)).values('cart_id'))
+    
+    def refresh_summary(self):
+        """
+        Recompute the item count and total of every cart in the queryset from its
+        items at current prices, bumping versions, in one UPDATE.
+        """
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        return self.update(
+            item_count=Coalesce(Subquery(items.annotate(count=Sum('quantity')).values('count')), Value(0)),
+            total_price=Coalesce(
+                Subquery(items.annotate(total=cart_total_expression()).values('total')),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+    
+    def reset_summary(self, cart_id):
+        """Zero a cart's summary after all of its items were removed"""
+        return self.filter(pk=cart_id).update(
+            item_count=0,
+            total_price=Decimal('0.00'),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+
 class Cart(models.Model):
     """Model for shopping cart"""
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized summary, recomputed in the same transaction as every item or price change
+    item_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    version = models.PositiveIntegerField(default=0)
+    
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"Cart of {self.user.username}"
-    
-    @property
-    def total_price(self):
-        """Calculate total price of all items in cart"""
-        return sum(item.subtotal for item in self.cartitem_set.all())
+
+class CartItemQuerySet(models.QuerySet):
+    def add_quantity(self, cart_id, art_picture_id, quantity):
+        """Add quantity to a cart line, creating it if needed, without a read-modify-write race"""
+        with transaction.atomic():
+            # Adds to one cart queue on the cart row. Otherwise two first adds of a
+            # line both take InnoDB gap locks on the missing key and their INSERTs deadlock
+            list(Cart.objects.select_for_update().filter(pk=cart_id).values_list('pk', flat=True))
+            lines = self.filter(cart_id=cart_id, art_picture_id=art_picture_id)
+            if lines.update(quantity=F('quantity') + quantity):
+                return
+            try:
+                with transaction.atomic():
+                    self.create(cart_id=cart_id, art_picture_id=art_picture_id, quantity=quantity)
+            except IntegrityError:
+                # A writer that doesn't take the cart lock (e.g. a batch) created the
+                # line first; the unique constraint rejected ours, so increment theirs
+                lines.update(quantity=F('quantity') + quantity)
 
 class CartItem(models.Model):
     """Model for items in shopping cart"""
@@ -50,6 +164,13 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CartItemQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'art_picture'], name='cartitem_cart_picture_uniq'),
+        ]
+    
     def __str__(self):
         return f"{self.quantity} x {self.art_picture.title}"
     
@@ -58,15 +179,50 @@ class CartItem(models.Model):
         """Calculate subtotal for this item"""
         return self.art_picture.price * self.quantity
 
+ADDRESS_FIELDS = ('street', 'city', 'state', 'zipcode', 'country')
+
+def normalize_address(data):
+    """Address field values from a dict, with whitespace collapsed; country defaults to United States"""
+    fields = {name: ' '.join(str(data.get(name) or '').split()) for name in ADDRESS_FIELDS}
+    fields['country'] = fields['country'] or 'United States'
+    return fields
+
+def address_hash(fields):
+    """Hash of an address's content, ignoring case and spacing, used to spot duplicates"""
+    content = '\x1f'.join(' '.join(str(fields[name]).split()).casefold() for name in ADDRESS_FIELDS)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+class AddressQuerySet(models.QuerySet):
+    def for_user(self, user, data):
+        """The user's address with this content, saving it to their address book if it's new"""
+        fields = normalize_address(data)
+        address, created = self.get_or_create(user=user, content_hash=address_hash(fields), defaults=fields)
+        return address
+
 class Address(models.Model):
     """Model for structured addresses"""
+    # Orders point at their addresses, so a saved address is never edited in place
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='addresses')
     street = models.CharField(max_length=255)
     city = models.CharField(max_length=100)
     state = models.CharField(max_length=100)
     zipcode = models.CharField(max_length=20)
     country = models.CharField(max_length=100, default='United States')
+    content_hash = models.CharField(max_length=64, editable=False)
+    is_archived = models.BooleanField(default=False, help_text="Removed from the address book but kept for past orders")
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = AddressQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='address_user_hash_uniq'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.content_hash = address_hash({name: getattr(self, name) for name in ADDRESS_FIELDS})
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.street}, {self.city}, {self.state} {self.zipcode}, {self.country}"
     
@@ -75,6 +231,60 @@ class Address(models.Model):
         """Return the full address as a string"""
         return self.__str__()
 
+# Status changes an order may go through; anything else is refused
+ORDER_TRANSITIONS = {
+    'pending': {'paid', 'cancelled'},
+    'paid': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+
+class OrderQuerySet(models.QuerySet):
+    def transition(self, to_status, changed_by=None, note='', **fields):
+        """
+        Move every order in the queryset that is allowed to go to `to_status`,
+        returning {order_id: from_status} for the orders that moved.
+        
+        Rows are locked in primary key order and each source status is applied
+        with one UPDATE ... WHERE status=<from_status>, so a webhook or admin
+        that changed an order first is never overwritten. Every move is logged
+        in OrderStatusChange. Paying drops the order's stock holds and
+        cancelling a pending order puts its held stock back.
+        """
+        sources = [status for status, targets in ORDER_TRANSITIONS.items() if to_status in targets]
+        if to_status == 'paid':
+            fields.setdefault('paid_at', timezone.now())
+        
+        with transaction.atomic():
+            current = dict(
+                self.filter(status__in=sources).select_for_update().order_by('pk').values_list('id', 'status')
+            )
+            moved = {}
+            for from_status in sources:
+                ids = [pk for pk, status in current.items() if status == from_status]
+                if ids and Order.objects.filter(pk__in=ids, status=from_status).update(status=to_status, **fields):
+                    moved.update(dict.fromkeys(ids, from_status))
+            if not moved:
+                return moved
+            
+            if to_status == 'paid':
+                Reservation.objects.filter(order_id__in=list(moved)).delete()
+            elif to_status == 'cancelled':
+                Reservation.objects.release([pk for pk, status in moved.items() if status == 'pending'])
+            OrderStatusChange.objects.bulk_create([
+                OrderStatusChange(
+                    order_id=pk, from_status=from_status, to_status=to_status, changed_by=changed_by, note=note,
+                )
+                for pk, from_status in moved.items()
+            ])
+            if to_status in RECEIPT_STATUSES:
+                # An order cancelled before it was paid has no receipt
+                schedule_receipts_on_commit(
+                    pk for pk, from_status in moved.items() if to_status == 'paid' or from_status != 'pending'
+                )
+        return moved
+
 class Order(models.Model):
     """Model for customer orders"""
     STATUS_CHOICES = (
@@ -107,15 +317,77 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    receipt = models.JSONField(blank=True, null=True, editable=False, help_text="Stored receipt: {'html': storage name, 'status': status it shows}")
+    
+    # Payments that arrived after the order was cancelled or paid by another request
+    unapplied_payments = models.JSONField(default=list, blank=True, editable=False, help_text="Late payments and the outcome of refunding them")
+    needs_reconciliation = models.BooleanField(default=False, db_index=True, help_text="A late payment could not be refunded automatically")
+    
+    objects = OrderQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Back keyset pagination of order history, per user and for admins
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.order_number}"
     
-    def mark_as_paid(self):
-        """Mark order as paid and record the timestamp"""
-        self.status = 'paid'
-        self.paid_at = timezone.now()
-        self.save()
+    @property
+    def next_statuses(self):
+        """Statuses this order may move to next"""
+        return sorted(ORDER_TRANSITIONS.get(self.status, ()))
+    
+    def transition(self, to_status, changed_by=None, note='', **fields):
+        """
+        Move this order to `to_status` if it is still in the status it was
+        loaded with. Returns False if the move isn't allowed or another request
+        changed the order first.
+        """
+        if to_status not in ORDER_TRANSITIONS.get(self.status, ()):
+            return False
+        if to_status == 'paid':
+            fields.setdefault('paid_at', timezone.now())
+        moved = Order.objects.filter(pk=self.pk, status=self.status).transition(
+            to_status, changed_by=changed_by, note=note, **fields
+        )
+        if not moved:
+            return False
+        self.status = to_status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+    
+    def mark_as_paid(self, changed_by=None):
+        """Mark order as paid with its payment details; its stock holds become sales"""
+        return self.transition(
+            'paid', changed_by=changed_by, payment_id=self.payment_id, payment_details=self.payment_details,
+        )
+    
+    def record_unapplied_payment(self, refund_status, refund_id=None, error=''):
+        """
+        Keep this order's payment_id/payment_details as a payment that could not
+        be applied, with the outcome of refunding it. A refund that failed flags
+        the order for reconciliation.
+        """
+        entry = {
+            'payment_id': self.payment_id,
+            'payment_details': self.payment_details,
+            'refund_status': refund_status,
+            'refund_id': refund_id,
+            'error': error,
+            'recorded_at': timezone.now().isoformat(),
+        }
+        with transaction.atomic():
+            order = Order.objects.select_for_update().only('unapplied_payments', 'needs_reconciliation').get(pk=self.pk)
+            order.unapplied_payments = [*(order.unapplied_payments or []), entry]
+            order.needs_reconciliation = order.needs_reconciliation or refund_status == 'failed'
+            order.save(update_fields=['unapplied_payments', 'needs_reconciliation'])
+        self.unapplied_payments = order.unapplied_payments
+        self.needs_reconciliation = order.needs_reconciliation
+        return entry
 
 class OrderItem(models.Model):
     """Model for items in an order"""
@@ -132,6 +404,96 @@ class OrderItem(models.Model):
         """Calculate subtotal for this item"""
         return self.price * self.quantity
 
+class ReservationQuerySet(models.QuerySet):
+    def hold_for_payment(self, order):
+        """
+        Extend an order's unexpired holds for the duration of a payment, so the
+        sweeper can't release stock that is being paid for. Returns False if the
+        order had holds and they have all expired.
+        """
+        now = timezone.now()
+        holds = self.filter(order=order)
+        if holds.filter(expires_at__gt=now).update(expires_at=now + reservation_ttl()):
+            return True
+        return not holds.exists()
+    
+    def release(self, order_ids):
+        """Put the stock held for these orders back and drop their holds"""
+        from .cache import bump_generation
+        
+        holds = self.filter(order_id__in=order_ids)
+        released = {}
+        for art_picture_id, quantity in holds.values_list('art_picture_id', 'quantity'):
+            released[art_picture_id] = released.get(art_picture_id, 0) + quantity
+        if released:
+            ArtPicture.objects.adjust_stock(released)
+            # Stock went back with .update(), which doesn't fire the catalog signals
+            transaction.on_commit(bump_generation)
+        holds.delete()
+    
+    def release_expired(self, limit=500):
+        """
+        Cancel up to `limit` pending orders whose holds expired and put their
+        stock back, returning the number of orders processed.
+        """
+        now = timezone.now()
+        order_ids = set(self.filter(expires_at__lte=now).values_list('order_id', flat=True)[:limit])
+        if not order_ids:
+            return 0
+        with transaction.atomic():
+            # Orders being paid or processed by another sweeper are skipped
+            orders = Order.objects.filter(pk__in=order_ids)
+            if connection.features.has_select_for_update_skip_locked:
+                orders = orders.select_for_update(skip_locked=True)
+            else:
+                orders = orders.select_for_update()
+            statuses = dict(orders.values_list('id', 'status'))
+            if not statuses:
+                return 0
+            
+            # Cancelling puts the held stock back
+            Order.objects.filter(pk__in=[pk for pk, status in statuses.items() if status == 'pending']).transition(
+                'cancelled', note='Stock reservation expired'
+            )
+            # Holds left on orders that moved on some other way are dropped:
+            # cancelled ones give their stock back, any other status already
+            # counts as sold
+            self.release([pk for pk, status in statuses.items() if status == 'cancelled'])
+            self.filter(order_id__in=list(statuses)).delete()
+        return len(statuses)
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'RESERVATION_TTL_MINUTES', 15))
+
+class Reservation(models.Model):
+    """Stock held for a pending order until it is paid or the hold expires"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    art_picture = models.ForeignKey(ArtPicture, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    objects = ReservationQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.art_picture_id} held for order {self.order_id}"
+
+class OrderStatusChange(models.Model):
+    """Append-only log of order status transitions"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='orderstatus_order_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
+
 class Message(models.Model):
     """Model for messages between admin and users"""
     TYPE_CHOICES = (
@@ -159,6 +521,32 @@ class Message(models.Model):
         ordering = ['-created_at']
 
 
+class IdempotencyKey(models.Model):
+    """First response to a request sent with an Idempotency-Key header, replayed to retries until it expires"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the request, to catch key reuse
+    status_code = models.PositiveSmallIntegerField(null=True)  # null while the first request is running
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotencykey_user_key_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.user_id})"
+
+class CatalogGeneration(models.Model):
+    """Single-row counter bumped on every catalog change; cached catalog responses are keyed by it (see cache.py)"""
+    value = models.PositiveBigIntegerField(default=1)
+    
+    def __str__(self):
+        return f"Catalog generation {self.value}"
+
 class OrderUserView(models.Model):
     """Database view that joins orders with user information"""
     id = models.BigAutoField(primary_key=True)
@@ -0,0 +1,295 @@
+"""
+Bulk restore of orders from a backup or another system.
+
+Each row is one order in the shape restore_order accepts (user, items,
+shipping/billing address data, status, payment fields, total_price), plus an
+optional order_number, created_at and paid_at that keep a historical order's
+identity. Rows are processed in chunks: the users and pictures a chunk refers
+to are loaded with one in_bulk each, and its addresses, orders and items are
+written with bulk_create in one transaction per chunk. Invalid rows are
+reported and skipped rather than failing the whole stream. Stock is left
+alone, since a restored order was already sold once.
+"""
+import json
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.parsers import BaseParser
+
+from .models import Address, ArtPicture, Order, OrderItem, address_hash, normalize_address
+
+STATUSES = {value for value, label in Order.STATUS_CHOICES}
+PAYMENT_METHODS = {value for value, label in Order.PAYMENT_METHOD_CHOICES}
+
+
+def read_ndjson(lines):
+    """Yield (line_number, text) for each non-blank line; rows are decoded later so a bad line is just a bad row"""
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON lazily, one order per line"""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_ndjson(stream)
+
+
+@dataclass
+class RestoreReport:
+    restored: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'restored': len(self.restored),
+            'failed': len(self.errors),
+            'orders': self.restored,
+            'errors': self.errors,
+        }
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_decimal(value, name):
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'invalid {name} "{value}"')
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f'{name} must be a non-negative number')
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_timestamp(value, name):
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError(f'invalid {name} "{value}"')
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_address(data):
+    """Normalized address fields from an address dict, or None if it has none filled in"""
+    if not isinstance(data, dict):
+        return None
+    fields = normalize_address(data)
+    if not any(fields[name] for name in ('street', 'city', 'state', 'zipcode')):
+        return None
+    return fields
+
+
+def decode_row(row):
+    if isinstance(row, (str, bytes)):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError('each row must be a JSON object')
+    return row
+
+
+def build_order(row, users, pictures):
+    """
+    Build an unsaved order from a row, raising ValueError if it is invalid.
+
+    Returns (order, items, shipping_fields, billing_fields, created_at).
+    """
+    user = users.get(parse_id(row.get('user')))
+    if user is None:
+        raise ValueError(f'user {row.get("user")!r} not found')
+
+    items = []
+    raw_items = row.get('items') or []
+    if not isinstance(raw_items, list):
+        raise ValueError('items must be a list')
+    for item in raw_items:
+        if not isinstance(item, dict):
+            raise ValueError('each item must be an object')
+        picture = pictures.get(parse_id(item.get('art_picture_id')))
+        if picture is None:
+            raise ValueError(f'art picture {item.get("art_picture_id")!r} not found')
+        quantity = parse_id(item.get('quantity', 1))
+        if quantity is None or quantity < 1:
+            raise ValueError(f'invalid quantity {item.get("quantity")!r} for art picture {picture.pk}')
+        price = item.get('price')
+        items.append(OrderItem(
+            art_picture_id=picture.pk,
+            quantity=quantity,
+            price=parse_decimal(price, 'price') if price not in (None, '') else picture.price,
+        ))
+
+    order_status = row.get('status') or 'pending'
+    if order_status not in STATUSES:
+        raise ValueError(f'invalid status "{order_status}"')
+    payment_method = row.get('payment_method') or 'credit_card'
+    if payment_method not in PAYMENT_METHODS:
+        raise ValueError(f'invalid payment_method "{payment_method}"')
+
+    total_price = row.get('total_price')
+    if total_price in (None, ''):
+        total_price = sum((item.price * item.quantity for item in items), Decimal('0.00'))
+    else:
+        total_price = parse_decimal(total_price, 'total_price')
+
+    order = Order(
+        user=user,
+        status=order_status,
+        payment_method=payment_method,
+        payment_id=row.get('payment_id') or '',
+        payment_details=row.get('payment_details'),
+        shipping_address=row.get('shipping_address') or '',
+        billing_address=row.get('billing_address') or '',
+        total_price=total_price,
+        paid_at=parse_timestamp(row.get('paid_at'), 'paid_at'),
+    )
+    if row.get('order_number'):
+        try:
+            order.order_number = uuid.UUID(str(row['order_number']))
+        except ValueError:
+            raise ValueError(f'invalid order_number "{row["order_number"]}"')
+
+    shipping = parse_address(row.get('shipping_address_data'))
+    billing = parse_address(row.get('billing_address_data'))
+    # Flat address strings kept for backwards compatibility
+    if shipping:
+        order.shipping_address = Address(**shipping).full_address
+    if billing:
+        order.billing_address = Address(**billing).full_address
+    return order, items, shipping, billing, parse_timestamp(row.get('created_at'), 'created_at')
+
+
+def save_addresses(wanted):
+    """Find or insert the {(user_id, content_hash): fields} addresses, returning their ids by key"""
+    if not wanted:
+        return {}
+    lookup = Address.objects.filter(
+        user_id__in={user_id for user_id, content_hash in wanted},
+        content_hash__in={content_hash for user_id, content_hash in wanted},
+    ).values_list('user_id', 'content_hash', 'id')
+    found = {(user_id, content_hash): pk for user_id, content_hash, pk in lookup}
+    missing = [
+        Address(user_id=user_id, content_hash=content_hash, **fields)
+        for (user_id, content_hash), fields in wanted.items() if (user_id, content_hash) not in found
+    ]
+    if missing:
+        # bulk_create can't return ids on MySQL, so read them back
+        Address.objects.bulk_create(missing, ignore_conflicts=True)
+        found = {(user_id, content_hash): pk for user_id, content_hash, pk in lookup.all()}
+    return found
+
+
+def restore_chunk(chunk, report):
+    """Validate and insert one chunk of (line_number, row) pairs in a single transaction"""
+    rows = []
+    for line_number, row in chunk:
+        try:
+            rows.append((line_number, decode_row(row)))
+        except ValueError as e:
+            report.errors.append({'line': line_number, 'error': str(e)})
+
+    users = User.objects.in_bulk({parse_id(row.get('user')) for line_number, row in rows} - {None})
+    pictures = ArtPicture.objects.only('id', 'price').in_bulk({
+        parse_id(item.get('art_picture_id'))
+        for line_number, row in rows
+        for item in (row.get('items') if isinstance(row.get('items'), list) else [])
+        if isinstance(item, dict)
+    } - {None})
+
+    built = []
+    for line_number, row in rows:
+        try:
+            built.append((line_number, *build_order(row, users, pictures)))
+        except (ValueError, TypeError) as e:
+            report.errors.append({'line': line_number, 'error': str(e)})
+
+    # An order number may only be restored once
+    numbers = [order.order_number for line_number, order, *rest in built]
+    taken = set(Order.objects.filter(order_number__in=numbers).values_list('order_number', flat=True))
+    valid = []
+    for entry in built:
+        line_number, order = entry[0], entry[1]
+        if order.order_number in taken:
+            report.errors.append({'line': line_number, 'error': f'order_number {order.order_number} already exists'})
+        else:
+            taken.add(order.order_number)
+            valid.append(entry)
+    if not valid:
+        return
+
+    wanted = {}
+    for line_number, order, items, shipping, billing, created_at in valid:
+        for fields in (shipping, billing):
+            if fields:
+                wanted[(order.user_id, address_hash(fields))] = fields
+
+    try:
+        with transaction.atomic():
+            addresses = save_addresses(wanted)
+            for line_number, order, items, shipping, billing, created_at in valid:
+                if shipping:
+                    order.shipping_address_obj_id = addresses[(order.user_id, address_hash(shipping))]
+                if billing:
+                    order.billing_address_obj_id = addresses[(order.user_id, address_hash(billing))]
+
+            orders = [order for line_number, order, *rest in valid]
+            Order.objects.bulk_create(orders)
+            # bulk_create can't return ids on MySQL, so read them back by order number
+            ids = dict(
+                Order.objects.filter(order_number__in=[order.order_number for order in orders])
+                .values_list('order_number', 'id')
+            )
+            dated = []
+            all_items = []
+            for line_number, order, items, shipping, billing, created_at in valid:
+                order.pk = ids[order.order_number]
+                if created_at:
+                    # auto_now_add overwrote it on insert
+                    order.created_at = created_at
+                    dated.append(order)
+                for item in items:
+                    item.order_id = order.pk
+                all_items.extend(items)
+            if dated:
+                Order.objects.bulk_update(dated, ['created_at'])
+            OrderItem.objects.bulk_create(all_items)
+    except DatabaseError as e:
+        report.errors.extend({'line': entry[0], 'error': str(e)} for entry in valid)
+        return
+
+    report.restored.extend(
+        {'line': line_number, 'id': order.pk, 'order_number': str(order.order_number)}
+        for line_number, order, *rest in valid
+    )
+
+
+def restore_orders(rows, batch_size=500):
+    """Restore orders from an iterable of (line_number, row) pairs, returning a RestoreReport"""
+    report = RestoreReport()
+    chunk = []
+    for line_number, row in rows:
+        chunk.append((line_number, row))
+        if len(chunk) >= batch_size:
+            restore_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        restore_chunk(chunk, report)
+    report.errors.sort(key=lambda error: error['line'])
+    return report
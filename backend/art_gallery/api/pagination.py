@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ArtPictureCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the art pictures catalog.
+
+    Pages are addressed by opaque next/previous cursors over (-created_at, -id),
+    so a deep page costs the same index range scan as the first one.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class OrderCursorPagination(CursorPagination):
+    """Keyset pagination for order history, newest first"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
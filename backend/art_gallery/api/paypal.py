@@ -0,0 +1,164 @@
+"""
+PayPal REST client shared by every request in a process.
+
+One httpx.Client keeps connections to PayPal alive between payments, and the
+OAuth access token is cached until shortly before its `expires_in` instead of
+being fetched for every payment. All calls have connect/read timeouts, so a slow
+PayPal can't hold a worker indefinitely. Connection errors, timeouts, 429s and
+5xx responses are retried a bounded number of times with jittered exponential
+backoff. PAYPAL_API_BASE can point the client at a local fake server.
+"""
+import atexit
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+SANDBOX_API_BASE = 'https://api-m.sandbox.paypal.com'
+LIVE_API_BASE = 'https://api-m.paypal.com'
+
+# Refresh the token this many seconds before PayPal would expire it
+TOKEN_REFRESH_MARGIN = 60
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 2.0
+
+
+class PayPalError(Exception):
+    """PayPal could not be reached or rejected the request"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def transient(self):
+        """True if PayPal was unreachable or overloaded, rather than rejecting the request itself"""
+        return self.status_code is None or self.status_code in RETRY_STATUSES or self.status_code >= 500
+
+
+def completed_capture_ids(order_data):
+    """Ids of the captured payments of a PayPal checkout order (none while it is only approved)"""
+    return [
+        capture['id']
+        for unit in order_data.get('purchase_units') or []
+        for capture in (unit.get('payments') or {}).get('captures') or []
+        if capture.get('status') == 'COMPLETED'
+    ]
+
+
+def retry_delay(attempt):
+    """Full-jitter exponential backoff before retry number `attempt` (0-based)"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class PayPalClient:
+    def __init__(self, client_id, client_secret, base_url, connect_timeout=5.0, read_timeout=15.0,
+                 max_retries=2, max_connections=10, transport=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_retries = max_retries
+        self._http = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={'Accept': 'application/json', 'Accept-Language': 'en_US'},
+            transport=transport,
+        )
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def close(self):
+        self._http.close()
+
+    def get_access_token(self):
+        """A cached OAuth token, fetched again only when it is about to expire"""
+        with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            response = self._send(
+                'POST', '/v1/oauth2/token',
+                auth=(self.client_id, self.client_secret), data={'grant_type': 'client_credentials'},
+            )
+            if response.is_error:
+                raise PayPalError(f'PayPal authentication failed ({response.status_code})', response.status_code)
+            payload = response.json()
+            self._token = payload['access_token']
+            lifetime = int(payload.get('expires_in', 0)) - TOKEN_REFRESH_MARGIN
+            self._token_expires_at = time.monotonic() + max(lifetime, 0)
+            return self._token
+
+    def invalidate_token(self, token):
+        """Forget a token PayPal no longer accepts (unless another thread already replaced it)"""
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    def request(self, method, path, **kwargs):
+        """An authorized API call, returning the response; raises PayPalError on failure"""
+        headers = kwargs.pop('headers', {})
+        token = self.get_access_token()
+        response = self._send(method, path, headers={**headers, 'Authorization': f'Bearer {token}'}, **kwargs)
+        if response.status_code == 401:
+            # Revoked before its expiry: fetch a fresh token once
+            self.invalidate_token(token)
+            token = self.get_access_token()
+            response = self._send(method, path, headers={**headers, 'Authorization': f'Bearer {token}'}, **kwargs)
+        if response.is_error:
+            raise PayPalError(
+                f'PayPal {method} {path} failed ({response.status_code}): {response.text[:200]}',
+                response.status_code,
+            )
+        return response
+
+    def get_order(self, order_id):
+        """The PayPal checkout order, as returned by /v2/checkout/orders/<id>"""
+        return self.request('GET', f'/v2/checkout/orders/{order_id}').json()
+
+    def refund_capture(self, capture_id):
+        """Refund a captured payment in full, returning the refund id"""
+        response = self.request(
+            'POST', f'/v2/payments/captures/{capture_id}/refund',
+            # Makes a retried refund of the same capture a no-op on PayPal's side
+            json={}, headers={'PayPal-Request-Id': f'refund-{capture_id}'},
+        )
+        return response.json().get('id')
+
+    def _send(self, method, path, **kwargs):
+        """Send a request, retrying transport errors and retryable statuses with backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise PayPalError(f'PayPal is unreachable: {e}') from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+            time.sleep(retry_delay(attempt))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_paypal_client():
+    """Lazily create the PayPal client shared by all requests in this process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            sandbox = getattr(settings, 'PAYPAL_SANDBOX', True)
+            _client = PayPalClient(
+                client_id=getattr(settings, 'PAYPAL_CLIENT_ID', 'sb'),
+                client_secret=getattr(settings, 'PAYPAL_CLIENT_SECRET', ''),
+                base_url=getattr(settings, 'PAYPAL_API_BASE', '') or (SANDBOX_API_BASE if sandbox else LIVE_API_BASE),
+                connect_timeout=getattr(settings, 'PAYPAL_CONNECT_TIMEOUT', 5.0),
+                read_timeout=getattr(settings, 'PAYPAL_READ_TIMEOUT', 15.0),
+                max_retries=getattr(settings, 'PAYPAL_MAX_RETRIES', 2),
+            )
+            atexit.register(_client.close)
+    return _client
@@ -0,0 +1,127 @@
+"""
+Pre-rendered order receipts.
+
+A receipt is a printable HTML page (parchment styled, ready to share over
+WhatsApp or email) rendered once when an order is paid, and again only when its
+status or items change. Rendering runs in a thread pool off the request thread.
+The result is stored content-addressed in RECEIPT_ROOT, outside the public
+media directory, and its storage name is recorded in Order.receipt. Serving a
+receipt is then one file read, and the content hash doubles as its ETag.
+"""
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+RECEIPTS_DIR = 'receipts'
+
+# Statuses that have a receipt, for orders that were paid (paid_at is set):
+# a paid order cancelled later keeps its receipt, one cancelled unpaid never had one
+RECEIPT_STATUSES = ('paid', 'shipped', 'delivered', 'cancelled')
+
+
+def has_receipt(order):
+    """True if the order was paid and is in a status that shows a receipt"""
+    return order.status in RECEIPT_STATUSES and order.paid_at is not None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_receipt_storage():
+    return ContentAddressedStorage(location=settings.RECEIPT_ROOT)
+
+
+def get_executor():
+    """Lazily start the thread pool shared by all requests in this process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RECEIPT_WORKERS', 2), thread_name_prefix='receipts',
+            )
+            atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def render_receipt(order):
+    """The receipt HTML for an order whose items, pictures and addresses are loaded"""
+    items = [
+        {'title': item.art_picture.title, 'price': item.price, 'quantity': item.quantity, 'subtotal': item.subtotal}
+        for item in order.orderitem_set.all()
+    ]
+    return render_to_string('api/receipt.html', {
+        'order': order,
+        'items': items,
+        'shipping_address': order.shipping_address_obj.full_address if order.shipping_address_obj else order.shipping_address,
+    })
+
+
+def build_receipt(order_id):
+    """Render and store the receipt of one order, returning its storage name (None if it has no receipt)"""
+    from .models import Order, OrderItem
+
+    order = (
+        Order.objects.select_related('user', 'shipping_address_obj')
+        .prefetch_related(Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('art_picture').order_by('pk')))
+        .filter(pk=order_id, status__in=RECEIPT_STATUSES, paid_at__isnull=False)
+        .first()
+    )
+    if order is None:
+        return None
+
+    html = render_receipt(order)
+    # Same content, same name: an unchanged receipt isn't written again
+    name = get_receipt_storage().save(os.path.join(RECEIPTS_DIR, 'receipt.html'), ContentFile(html.encode('utf-8')))
+    # Record it only if nothing changed the order while it rendered; that change scheduled its own render
+    Order.objects.filter(pk=order_id, status=order.status).update(receipt={'html': name, 'status': order.status})
+    return name
+
+
+def _build_in_worker(order_id):
+    close_old_connections()
+    try:
+        return build_receipt(order_id)
+    except Exception:
+        logger.exception('Failed to render the receipt of order %s', order_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_receipts(order_ids):
+    """Render receipts for these orders in the background"""
+    executor = get_executor()
+    return [executor.submit(_build_in_worker, order_id) for order_id in order_ids]
+
+
+def schedule_receipts_on_commit(order_ids):
+    """Schedule receipt rendering once the current transaction commits"""
+    order_ids = list(order_ids)
+    if order_ids:
+        transaction.on_commit(lambda: schedule_receipts(order_ids))
+
+
+def read_receipt(name):
+    """The stored receipt's bytes, or None if the file is gone"""
+    storage = get_receipt_storage()
+    if not name or not storage.exists(name):
+        return None
+    with storage.open(name, 'rb') as receipt:
+        return receipt.read()
+
+
+def receipt_etag(name):
+    """Strong ETag from the receipt's content-addressed name"""
+    return '"%s"' % os.path.splitext(os.path.basename(name))[0]
@@ -0,0 +1,206 @@
+"""
+Full-text search over ArtPicture titles and descriptions.
+
+On MySQL the search runs against the FULLTEXT index created in migration 0008
+using MATCH ... AGAINST in natural language mode. Other databases (SQLite during
+development and test runs) fall back to an in-process inverted index that is
+rebuilt lazily whenever a watermark read from the database (latest updated_at
+and row counts) changes, so changes made by other processes are noticed too.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, Max, Q
+from django.db.models.expressions import RawSQL
+
+from .models import ArtPicture
+
+# Price facet buckets as (lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    (Decimal('0'), Decimal('100')),
+    (Decimal('100'), Decimal('250')),
+    (Decimal('250'), Decimal('500')),
+    (Decimal('500'), Decimal('1000')),
+    (Decimal('1000'), None),
+]
+
+# Matches in the title count more than matches in the description
+TITLE_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+
+def bucket_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def _bucket_index(price):
+    for i, (low, high) in enumerate(PRICE_BUCKETS):
+        if price >= low and (high is None or price < high):
+            return i
+    return None
+
+
+def _bucket_filter(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def _price_filter(min_price, max_price):
+    q = Q()
+    if min_price is not None:
+        q &= Q(price__gte=min_price)
+    if max_price is not None:
+        q &= Q(price__lte=max_price)
+    return q
+
+
+class InvertedIndex:
+    """In-memory inverted index of token -> {picture id: weight}"""
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)
+        self.docs = {}
+        for pk, title, description, price, is_available in rows:
+            self.docs[pk] = (price, is_available, _bucket_index(price))
+            for weight, text in ((TITLE_WEIGHT, title), (DESCRIPTION_WEIGHT, description)):
+                for token in tokenize(text):
+                    postings = self.postings[token]
+                    postings[pk] = postings.get(pk, 0) + weight
+
+    @classmethod
+    def from_database(cls):
+        rows = ArtPicture.objects.values_list('id', 'title', 'description', 'price', 'is_available').iterator()
+        return cls(rows)
+
+    def score(self, query):
+        """Return {picture id: relevance} for documents matching any query token"""
+        scores = defaultdict(float)
+        total = len(self.docs) or 1
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for pk, weight in postings.items():
+                scores[pk] += weight * idf
+        return scores
+
+
+_index_lock = threading.Lock()
+_index = None
+_index_watermark = None
+
+
+def catalog_watermark():
+    """Fingerprint of the catalog in one aggregate query: latest change, row count and available count"""
+    watermark = ArtPicture.objects.aggregate(
+        changed=Max('updated_at'),
+        count=Count('id'),
+        available=Count('id', filter=Q(is_available=True)),
+    )
+    return watermark['changed'], watermark['count'], watermark['available']
+
+
+def get_inverted_index():
+    """Return the process-wide inverted index, rebuilding it if the catalog changed"""
+    global _index, _index_watermark
+    watermark = catalog_watermark()
+    if _index is None or _index_watermark != watermark:
+        with _index_lock:
+            if _index is None or _index_watermark != watermark:
+                _index = InvertedIndex.from_database()
+                _index_watermark = watermark
+    return _index
+
+
+def _mysql_search(query, available_only, min_price, max_price, is_available, limit):
+    queryset = ArtPicture.objects.annotate(
+        relevance=RawSQL(
+            'MATCH (title, description) AGAINST (%s IN NATURAL LANGUAGE MODE)', (query,)
+        )
+    ).filter(relevance__gt=0)
+    if available_only:
+        queryset = queryset.filter(is_available=True)
+
+    price_q = _price_filter(min_price, max_price)
+    availability_q = Q() if is_available is None else Q(is_available=is_available)
+
+    # Each facet is counted without its own filter so the client can widen it
+    price_facets = queryset.filter(availability_q).aggregate(**{
+        f'bucket_{i}': Count('id', filter=_bucket_filter(low, high))
+        for i, (low, high) in enumerate(PRICE_BUCKETS)
+    })
+    availability_facets = queryset.filter(price_q).aggregate(
+        available=Count('id', filter=Q(is_available=True)),
+        unavailable=Count('id', filter=Q(is_available=False)),
+    )
+
+    matches = queryset.filter(price_q & availability_q)
+    count = matches.count()
+    ranked = list(matches.order_by('-relevance', '-created_at', '-id').values_list('id', 'relevance')[:limit])
+
+    facets = {
+        'price': [
+            {'range': bucket_label(low, high), 'min': low, 'max': high, 'count': price_facets[f'bucket_{i}']}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'availability': availability_facets,
+    }
+    return ranked, count, facets
+
+
+def _index_search(query, available_only, min_price, max_price, is_available, limit):
+    index = get_inverted_index()
+    scores = index.score(query)
+
+    price_counts = [0] * len(PRICE_BUCKETS)
+    availability_counts = {'available': 0, 'unavailable': 0}
+    matches = []
+    for pk, relevance in scores.items():
+        price, available, bucket = index.docs[pk]
+        if available_only and not available:
+            continue
+        price_ok = (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+        availability_ok = is_available is None or available == is_available
+        if availability_ok and bucket is not None:
+            price_counts[bucket] += 1
+        if price_ok:
+            availability_counts['available' if available else 'unavailable'] += 1
+        if price_ok and availability_ok:
+            matches.append((pk, relevance))
+
+    # Newer pictures (higher ids) win ties, mirroring the catalog ordering
+    matches.sort(key=lambda match: (-match[1], -match[0]))
+
+    facets = {
+        'price': [
+            {'range': bucket_label(low, high), 'min': low, 'max': high, 'count': price_counts[i]}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'availability': availability_counts,
+    }
+    return matches[:limit], len(matches), facets
+
+
+def search_art_pictures(query, available_only=True, min_price=None, max_price=None, is_available=None, limit=24):
+    """
+    Search art pictures by title and description.
+
+    Returns a tuple of (ranked [(picture id, relevance)] truncated to `limit`,
+    total number of matches, facet counts).
+    """
+    backend = _mysql_search if connection.vendor == 'mysql' else _index_search
+    return backend(query, available_only, min_price, max_price, is_available, limit)
@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from rest_framework.utils.serializer_helpers import ReturnList
 from django.contrib.auth.models import User
-from .models import ArtPicture, Cart, CartItem, Order, OrderItem, Message, Address, OrderUserView
+from django.core.files.storage import default_storage
+from .models import ArtPicture, Cart, CartItem, Order, OrderItem, OrderStatusChange, Message, Address, OrderUserView
+from .images import DERIVATIVE_FORMATS
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model"""
@@ -24,13 +27,84 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/800x600?text=No+Image+Available"
+
+# Compact representations selectable with ?view=
+ART_PICTURE_VIEWS = {
+    'grid': ['id', 'title', 'price', 'thumbnail'],
+    # Default for pictures nested in order lists
+    'summary': ['id', 'title', 'thumbnail'],
+}
+
+# Model fields read by each ArtPictureSerializer output field, used to narrow the SELECT
+ART_PICTURE_FIELD_SOURCES = {
+    'id': ['id'],
+    'title': ['title'],
+    'description': ['description'],
+    'price': ['price'],
+    'image': ['image'],
+    'image_url': ['image_url'],
+    'image_full_url': ['image', 'image_url'],
+    'image_srcset': ['image', 'image_derivatives'],
+    'thumbnail': ['image', 'image_url', 'image_derivatives'],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at'],
+    'is_available': ['is_available'],
+    'stock': ['stock'],
+}
+
+
+def get_art_picture_fields(request):
+    """
+    Return the art picture fields requested with ?fields=a,b or ?view=grid,
+    or None for the full representation.
+    """
+    if request is None:
+        return None
+    view = request.query_params.get('view')
+    fields = request.query_params.get('fields')
+    
+    if view:
+        if view not in ART_PICTURE_VIEWS:
+            raise serializers.ValidationError({'view': f'Unknown view "{view}". Choose from: {", ".join(ART_PICTURE_VIEWS)}'})
+        return ART_PICTURE_VIEWS[view]
+    if fields:
+        requested = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in ART_PICTURE_FIELD_SOURCES]
+        if unknown:
+            raise serializers.ValidationError({'fields': f'Unknown fields: {", ".join(unknown)}'})
+        # Always include the id so clients can key rows
+        return ['id'] + [name for name in requested if name != 'id']
+    return None
+
+
+def get_art_picture_only(fields, prefix='', required=()):
+    """Model field names (optionally prefixed for a relation) to pass to .only()"""
+    names = list(required)
+    for field in fields:
+        for source in ART_PICTURE_FIELD_SOURCES[field]:
+            if source not in names:
+                names.append(source)
+    return [prefix + name for name in names]
+
+
 class ArtPictureSerializer(serializers.ModelSerializer):
     """Serializer for ArtPicture model"""
     image_full_url = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
     
     class Meta:
         model = ArtPicture
-        fields = ['id', 'title', 'description', 'price', 'image', 'image_url', 'image_full_url', 'created_at', 'updated_at', 'is_available']
+        fields = ['id', 'title', 'description', 'price', 'image', 'image_url', 'image_full_url', 'image_srcset', 'thumbnail', 'created_at', 'updated_at', 'is_available', 'stock']
+    
+    def get_fields(self):
+        """Narrow to the sparse fieldset requested through the serializer context, if any"""
+        fields = super().get_fields()
+        requested = self.context.get('art_picture_fields')
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
     
     def get_image_full_url(self, obj):
         """Get the full image URL, either from the uploaded file or external URL"""
@@ -44,7 +118,158 @@ class ArtPictureSerializer(serializers.ModelSerializer):
             return obj.image_url
         
         # Return a placeholder image URL if no image is available
-        return "https://via.placeholder.com/800x600?text=No+Image+Available"
+        return PLACEHOLDER_IMAGE_URL
+    
+    def get_image_srcset(self, obj):
+        """Map of derivative size -> {width, height, jpeg, webp} URLs, or None until rendered"""
+        request = self.context.get('request')
+        absolute = request.build_absolute_uri if request else None
+        return build_image_srcset(obj.image_derivatives, obj.image.name if obj.image else None, absolute)
+    
+    def get_thumbnail(self, obj):
+        """Grid-sized JPEG rendition, falling back to the full image URL"""
+        srcset = self.get_image_srcset(obj)
+        if srcset and 'thumbnail' in srcset:
+            return srcset['thumbnail']['jpeg']
+        return self.get_image_full_url(obj)
+
+
+def build_image_srcset(derivatives, image_name, absolute=None):
+    """Build the image_srcset representation from stored derivatives"""
+    if not derivatives or derivatives.get('source') != (image_name or None):
+        return None
+    
+    srcset = {}
+    for size, entry in derivatives['sizes'].items():
+        urls = {'width': entry['width'], 'height': entry['height']}
+        for fmt in DERIVATIVE_FORMATS:
+            url = default_storage.url(entry[fmt])
+            urls[fmt] = absolute(url) if absolute else url
+        srcset[size] = urls
+    return srcset
+
+
+class ArtPictureListSerializer:
+    """
+    Read-only fast path for listing art pictures.
+    
+    Produces exactly the same output as ArtPictureSerializer(many=True), but from
+    `.values()` rows instead of model instances, and resolves the absolute media
+    URL prefix once per request instead of once per row. Honours the same
+    `art_picture_fields` sparse fieldset context.
+    """
+    _fields = None
+    
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+    
+    @classmethod
+    def model_fields(cls):
+        """Fields of ArtPictureSerializer, reused so formatting and ordering stay identical"""
+        if cls._fields is None:
+            cls._fields = ArtPictureSerializer().fields
+        return cls._fields
+    
+    @classmethod
+    def get_values_fields(cls, fields=None, required=()):
+        """Columns to pass to .values() for the given sparse fieldset"""
+        return get_art_picture_only(fields or list(cls.model_fields()), required=required)
+    
+    def get_absolute(self):
+        request = self.context.get('request')
+        if not request:
+            return None
+        # Storage URLs are root-relative, so only the scheme and host need prefixing
+        scheme_host = request.build_absolute_uri('/')[:-1]
+        return lambda url: scheme_host + url if url.startswith('/') else request.build_absolute_uri(url)
+    
+    @property
+    def data(self):
+        fields = self.model_fields()
+        requested = self.context.get('art_picture_fields')
+        names = [name for name in fields if requested is None or name in requested]
+        wanted = set(names)
+        price = fields['price'].to_representation
+        created_at = fields['created_at'].to_representation
+        updated_at = fields['updated_at'].to_representation
+        absolute = self.get_absolute()
+        storage_url = default_storage.url
+        needs_image = bool(wanted & {'image', 'image_full_url', 'image_srcset', 'thumbnail'})
+        
+        data = []
+        for row in self.rows:
+            values = {}
+            if needs_image:
+                image_name = row['image']
+                if image_name:
+                    image = storage_url(image_name)
+                    if absolute:
+                        image = absolute(image)
+                    image_full_url = image
+                else:
+                    image = None
+                    image_full_url = row.get('image_url') or PLACEHOLDER_IMAGE_URL
+                values['image'] = image
+                values['image_full_url'] = image_full_url
+                if wanted & {'image_srcset', 'thumbnail'}:
+                    srcset = build_image_srcset(row['image_derivatives'], image_name, absolute)
+                    values['image_srcset'] = srcset
+                    values['thumbnail'] = (
+                        srcset['thumbnail']['jpeg'] if srcset and 'thumbnail' in srcset else image_full_url
+                    )
+            
+            item = {}
+            for name in names:
+                if name in values:
+                    item[name] = values[name]
+                elif name == 'price':
+                    item[name] = price(row['price'])
+                elif name == 'created_at':
+                    item[name] = created_at(row['created_at'])
+                elif name == 'updated_at':
+                    item[name] = updated_at(row['updated_at'])
+                else:
+                    item[name] = row[name]
+            data.append(item)
+        return ReturnList(data, serializer=self)
+
+class ArtPictureBulkUpdateSerializer(serializers.Serializer):
+    """One entry of a bulk art picture update; only the provided fields are changed"""
+    id = serializers.IntegerField()
+    title = serializers.CharField(max_length=200, required=False)
+    description = serializers.CharField(required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    image_url = serializers.URLField(required=False, allow_null=True, allow_blank=True)
+    is_available = serializers.BooleanField(required=False)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError('At least one field besides id must be provided')
+        return attrs
+
+class CartOperationSerializer(serializers.Serializer):
+    """One operation of a batch cart mutation, applied in request order"""
+    OPS = ('add', 'set_quantity', 'remove', 'clear')
+    
+    op = serializers.ChoiceField(choices=OPS)
+    art_picture_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, attrs):
+        op = attrs['op']
+        if op != 'clear' and 'art_picture_id' not in attrs:
+            raise serializers.ValidationError(f'art_picture_id is required for {op}')
+        if op == 'set_quantity' and 'quantity' not in attrs:
+            raise serializers.ValidationError('quantity is required for set_quantity')
+        if op == 'add':
+            attrs.setdefault('quantity', 1)
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    """Body of a batch cart mutation: {"operations": [...]}"""
+    operations = CartOperationSerializer(many=True)
 
 class CartItemSerializer(serializers.ModelSerializer):
     """Serializer for CartItem model"""
@@ -59,11 +284,25 @@ class CartItemSerializer(serializers.ModelSerializer):
 class CartSerializer(serializers.ModelSerializer):
     """Serializer for Cart model"""
     items = CartItemSerializer(source='cartitem_set', many=True, read_only=True)
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'created_at', 'updated_at', 'items', 'total_price']
+        fields = ['id', 'user', 'created_at', 'updated_at', 'items', 'item_count', 'total_price', 'version']
+        read_only_fields = ['item_count', 'total_price', 'version']
+
+class GuestCartItemSerializer(serializers.Serializer):
+    """A guest cart line; guests have no CartItem rows, so the line id is the picture id"""
+    id = serializers.IntegerField(source='art_picture.id')
+    art_picture = ArtPictureSerializer()
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class GuestCartSerializer(serializers.Serializer):
+    """Cache-backed cart of an anonymous visitor, shaped like CartSerializer"""
+    items = GuestCartItemSerializer(many=True)
+    item_count = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    version = serializers.IntegerField()
 
 class AddressSerializer(serializers.ModelSerializer):
     """Serializer for Address model"""
@@ -93,6 +332,9 @@ class OrderSerializer(serializers.ModelSerializer):
     user_first_name = serializers.ReadOnlyField(source='user.first_name')
     user_last_name = serializers.ReadOnlyField(source='user.last_name')
     
+    # Status only changes through Order.transition
+    next_statuses = serializers.ReadOnlyField()
+    
     # Fields for creating an order
     shipping_address_data = serializers.JSONField(write_only=True, required=False)
     billing_address_data = serializers.JSONField(write_only=True, required=False)
@@ -101,16 +343,25 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = [
             'id', 'user', 'user_username', 'user_email', 'user_first_name', 'user_last_name',
-            'order_number', 'status', 'payment_method', 'payment_id',
+            'order_number', 'status', 'next_statuses', 'payment_method', 'payment_id',
             'shipping_address', 'billing_address', 
             'shipping_address_structured', 'billing_address_structured',
             'shipping_address_data', 'billing_address_data',
             'total_price', 'created_at', 'paid_at', 'items'
         ]
-        read_only_fields = ['order_number', 'created_at', 'paid_at', 
+        read_only_fields = ['order_number', 'status', 'created_at', 'paid_at', 
                            'shipping_address_structured', 'billing_address_structured',
                            'user_username', 'user_email', 'user_first_name', 'user_last_name']
 
+class OrderStatusChangeSerializer(serializers.ModelSerializer):
+    """Serializer for OrderStatusChange model"""
+    changed_by_username = serializers.ReadOnlyField(source='changed_by.username')
+    
+    class Meta:
+        model = OrderStatusChange
+        fields = ['id', 'from_status', 'to_status', 'changed_by', 'changed_by_username', 'note', 'created_at']
+        read_only_fields = fields
+
 class MessageSerializer(serializers.ModelSerializer):
     """Serializer for Message model"""
     sender_username = serializers.ReadOnlyField(source='sender.username')
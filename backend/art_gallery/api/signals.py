@@ -0,0 +1,50 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import ArtPicture, Cart, Order, OrderItem
+from .cache import bump_generation
+from .images import needs_derivatives, schedule_derivatives_on_commit
+from .receipts import RECEIPT_STATUSES, schedule_receipts_on_commit
+
+
+@receiver(post_save, sender=ArtPicture)
+@receiver(post_delete, sender=ArtPicture)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Any change to the catalog invalidates all cached catalog responses"""
+    bump_generation()
+
+
+@receiver(post_save, sender=ArtPicture)
+def reprice_carts(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Carts holding a repriced picture get their stored totals recomputed"""
+    if not created and not raw and (update_fields is None or 'price' in update_fields):
+        Cart.objects.holding([instance.pk]).refresh_summary()
+
+
+@receiver(pre_delete, sender=ArtPicture)
+def remember_carts_holding(sender, instance, **kwargs):
+    """The cascade removes the picture's cart lines, so note their carts before it runs"""
+    instance._cart_ids = list(Cart.objects.holding([instance.pk]).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=ArtPicture)
+def refresh_carts_after_delete(sender, instance, **kwargs):
+    if getattr(instance, '_cart_ids', None):
+        Cart.objects.filter(pk__in=instance._cart_ids).refresh_summary()
+
+
+@receiver(post_save, sender=ArtPicture)
+def render_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Render thumbnails and responsive sizes for newly uploaded images"""
+    if not raw and needs_derivatives(instance):
+        schedule_derivatives_on_commit(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def rerender_receipt(sender, instance, raw=False, **kwargs):
+    """A paid order's receipt lists its items, so changing them renders it again"""
+    if not raw and Order.objects.filter(
+        pk=instance.order_id, status__in=RECEIPT_STATUSES, paid_at__isnull=False,
+    ).exists():
+        schedule_receipts_on_commit([instance.order_id])
@@ -0,0 +1,108 @@
+"""
+Content-addressed media storage and offloaded media serving.
+
+Files are named by the SHA-256 of their bytes, so identical uploads are stored
+once and a URL always refers to the same content. That makes media URLs safe to
+cache forever (`Cache-Control: immutable`). `serve_media` hands the actual byte
+streaming to the front proxy via X-Accel-Redirect (nginx) or X-Sendfile
+(Apache/lighttpd) when configured, so WSGI workers never stream images.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.static import serve
+
+CONTENT_HASH_RE = re.compile(r'[0-9a-f]{64}')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names every saved file by the SHA-256 of its content"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest.hexdigest() + extension).replace('\\', '/')
+
+        # Same bytes, same name: the file is already stored
+        if self.exists(name):
+            return name
+        try:
+            return super().save(name, content, max_length=max_length)
+        except FileExistsError:
+            # Stored by a concurrent save since the check above
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content, so an existing file with this name is identical.
+        # Never pick another name: FileSystemStorage._save would retry it forever.
+        if os.path.lexists(self.path(name)):
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            # A concurrent save of the same bytes created the file first
+            return name
+
+
+def is_immutable(path):
+    """True for content-addressed files (and derivatives named after them)"""
+    return bool(CONTENT_HASH_RE.search(os.path.basename(path)))
+
+
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with long-lived caching headers.
+
+    With MEDIA_ACCEL_REDIRECT_PREFIX or MEDIA_SENDFILE set, only headers are
+    returned and the front proxy streams the file; otherwise Django serves it
+    (development).
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid media path')
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    use_sendfile = getattr(settings, 'MEDIA_SENDFILE', False)
+
+    if accel_prefix or use_sendfile:
+        if not os.path.isfile(full_path):
+            raise Http404('Media file not found')
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response = HttpResponse(content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if accel_prefix:
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path.lstrip('/'))
+        else:
+            response['X-Sendfile'] = full_path
+    else:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if is_immutable(path) else DEFAULT_CACHE_CONTROL
+    return response
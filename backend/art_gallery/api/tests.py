@@ -0,0 +1,1296 @@
+"""
+Regression tests for the API.
+
+Run with `python manage.py test art_gallery.api`.
+"""
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+import stripe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from .models import Address, ArtPicture, Cart, CartItem, CatalogGeneration, IdempotencyKey, Order, OrderItem, Reservation
+from .cache import bump_generation, get_generation
+from .images import DERIVATIVE_FORMATS
+from .ingest import BACKOFF_BASE
+from .paypal import PayPalClient, PayPalError
+from .serializers import ART_PICTURE_VIEWS, ArtPictureListSerializer, ArtPictureSerializer
+from .management.commands.benchmark_catalog_list import sample_pictures
+from .storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save('art_pictures/a.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('art_pictures/b.JPG', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.jpg'))
+
+    def test_concurrent_save_of_identical_content_returns_its_name(self):
+        name = self.storage.save('receipts/receipt.html', ContentFile(b'<p>paid</p>'))
+        # The second writer passed the exists() check before the first created the file
+        with mock.patch.object(self.storage, 'exists', return_value=False):
+            self.assertEqual(self.storage.save('receipts/receipt.html', ContentFile(b'<p>paid</p>')), name)
+
+
+class CartSummaryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=5)
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        data = self.client.get('/api/carts/summary/').data
+        return data['item_count'], data['total_price']
+
+    def test_remove_after_bulk_reprice(self):
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.picture.pk, 'quantity': 1}, format='json')
+        self.client.force_authenticate(self.admin)
+        self.client.post('/api/art-pictures/bulk_update/', [{'id': self.picture.pk, 'price': '150.00'}], format='json')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.summary(), (1, '150.00'))
+
+        item_id = self.client.get('/api/carts/my_cart/').data['items'][0]['id']
+        self.client.post('/api/carts/remove_item/', {'item_id': item_id}, format='json')
+        self.assertEqual(self.summary(), (0, '0.00'))
+
+    def test_update_quantity_after_reprice(self):
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.picture.pk, 'quantity': 2}, format='json')
+        self.picture.price = Decimal('80.00')
+        self.picture.save()
+        self.assertEqual(self.summary(), (2, '160.00'))
+
+        item_id = self.client.get('/api/carts/my_cart/').data['items'][0]['id']
+        self.client.post('/api/carts/update_item_quantity/', {'item_id': item_id, 'quantity': 3}, format='json')
+        self.assertEqual(self.summary(), (3, '240.00'))
+        self.assertFalse(Cart.objects.with_computed_summary().exclude(total_price=F('computed_total_price')).exists())
+
+
+class GuestCartMergeTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.harbour = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=5)
+        self.orchard = ArtPicture.objects.create(title='Orchard', description='', price=Decimal('40.00'), stock=5)
+
+    def add_as_guest(self, picture, quantity):
+        response = self.client.post('/api/guest-cart/add_item/', {'art_picture_id': picture.pk, 'quantity': quantity}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def log_in(self):
+        response = self.client.post('/api/token/', {'username': 'buyer', 'password': 'pw'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def lines(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('art_picture_id', 'quantity'))
+
+    def test_merge_into_a_new_cart(self):
+        self.add_as_guest(self.harbour, 2)
+        self.add_as_guest(self.orchard, 1)
+        response = self.log_in()
+
+        self.assertEqual(self.lines(), {self.harbour.pk: 2, self.orchard.pk: 1})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.total_price), (3, Decimal('240.00')))
+        # The guest cart is gone with its cookie
+        self.assertEqual(response.cookies[settings.GUEST_CART_COOKIE_NAME].value, '')
+
+    def test_overlapping_lines_add_up(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, art_picture=self.harbour, quantity=3)
+        Cart.objects.filter(pk=cart.pk).refresh_summary()
+        self.add_as_guest(self.harbour, 2)
+        self.add_as_guest(self.orchard, 1)
+        self.log_in()
+
+        self.assertEqual(self.lines(), {self.harbour.pk: 5, self.orchard.pk: 1})
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.total_price), (6, Decimal('540.00')))
+
+    def test_pictures_sold_while_in_the_guest_cart_are_dropped(self):
+        self.add_as_guest(self.harbour, 1)
+        self.add_as_guest(self.orchard, 1)
+        ArtPicture.objects.filter(pk=self.orchard.pk).update(is_available=False)
+        self.log_in()
+        self.assertEqual(self.lines(), {self.harbour.pk: 1})
+
+
+class CartRevalidationTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'pw'))
+        self.harbour = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=5)
+        self.orchard = ArtPicture.objects.create(title='Orchard', description='', price=Decimal('40.00'), stock=5)
+
+    def test_unchanged_cart_answers_304(self):
+        first = self.client.get('/api/carts/my_cart/')
+        etag = first['ETag']
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+
+        repeat = self.client.get('/api/carts/my_cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((repeat.status_code, repeat['ETag']), (304, etag))
+
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.harbour.pk}, format='json')
+        changed = self.client.get('/api/carts/my_cart/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        # The nested pictures are part of the response, so a catalog change revalidates too
+        etag = changed['ETag']
+        self.harbour.title = 'Harbour at dawn'
+        self.harbour.save()
+        self.assertEqual(self.client.get('/api/carts/my_cart/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_mutations_answer_with_a_delta(self):
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.harbour.pk}, format='json')
+        response = self.client.post('/api/carts/add_item/?delta=1', {'art_picture_id': self.orchard.pk, 'quantity': 2}, format='json')
+        self.assertEqual(sorted(response.data), ['item_count', 'items', 'removed', 'total_price', 'version'])
+        self.assertEqual([(item['art_picture']['id'], item['quantity']) for item in response.data['items']], [(self.orchard.pk, 2)])
+        self.assertEqual((response.data['item_count'], response.data['total_price'], response.data['removed']), (3, '180.00', []))
+
+        item_id = CartItem.objects.get(art_picture=self.harbour).pk
+        response = self.client.post('/api/carts/remove_item/?delta=1', {'item_id': item_id}, format='json')
+        self.assertEqual((response.data['items'], response.data['removed']), ([], [item_id]))
+        self.assertEqual((response.data['item_count'], response.data['total_price']), (2, '80.00'))
+
+
+class CartBatchTests(APITestCase):
+    def setUp(self):
+        self.picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=5)
+
+    def test_operations_are_applied_in_order(self):
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'pw'))
+        response = self.client.post('/api/carts/batch/', {'operations': [
+            {'op': 'add', 'art_picture_id': self.picture.pk, 'quantity': 2},
+            {'op': 'set_quantity', 'art_picture_id': self.picture.pk, 'quantity': 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['quantity'] for item in response.data['items']], [3])
+
+    def test_body_must_be_an_object(self):
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'pw'))
+        operations = [{'op': 'add', 'art_picture_id': self.picture.pk}]
+        for path in ('/api/carts/batch/', '/api/guest-cart/batch/'):
+            for body in (operations, {'operations': 'add'}, {}):
+                with self.subTest(path=path, body=body):
+                    self.assertEqual(self.client.post(path, body, format='json').status_code, 400)
+
+
+class BulkUpdateTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.print_run = ArtPicture.objects.create(title='Print run', description='', price=Decimal('30.00'), stock=4)
+        self.sold_out = ArtPicture.objects.create(
+            title='Sold out', description='', price=Decimal('30.00'), stock=0, is_available=False,
+        )
+
+    def bulk_update(self, updates):
+        return self.client.post('/api/art-pictures/bulk_update/', updates, format='json')
+
+    def test_stock_drives_availability(self):
+        response = self.bulk_update([{'id': self.print_run.pk, 'stock': 0}, {'id': self.sold_out.pk, 'stock': 2}])
+        self.assertEqual(response.status_code, 200)
+        self.print_run.refresh_from_db()
+        self.sold_out.refresh_from_db()
+        self.assertEqual((self.print_run.stock, self.print_run.is_available), (0, False))
+        self.assertEqual((self.sold_out.stock, self.sold_out.is_available), (2, True))
+
+    def test_explicit_withdrawal_is_kept_when_restocking(self):
+        self.bulk_update([{'id': self.sold_out.pk, 'stock': 2, 'is_available': False}])
+        self.sold_out.refresh_from_db()
+        self.assertEqual((self.sold_out.stock, self.sold_out.is_available), (2, False))
+
+    def test_available_without_stock_is_rejected(self):
+        for update in ({'id': self.print_run.pk, 'stock': 0, 'is_available': True}, {'id': self.sold_out.pk, 'is_available': True}):
+            with self.subTest(update=update):
+                response = self.bulk_update([update])
+                self.assertEqual(response.status_code, 400)
+        self.print_run.refresh_from_db()
+        self.assertEqual((self.print_run.stock, self.print_run.is_available), (4, True))
+
+    def test_updates_many_pictures_at_once(self):
+        before = self.print_run.updated_at
+        response = self.bulk_update([
+            {'id': self.print_run.pk, 'price': '35.00', 'title': 'Print run II'},
+            {'id': self.sold_out.pk, 'description': 'Restocking soon'},
+        ])
+        self.assertEqual(response.data, {'updated': 2})
+        self.print_run.refresh_from_db()
+        self.sold_out.refresh_from_db()
+        self.assertEqual((self.print_run.title, self.print_run.price), ('Print run II', Decimal('35.00')))
+        self.assertGreater(self.print_run.updated_at, before)
+        self.assertEqual((self.sold_out.description, self.sold_out.price), ('Restocking soon', Decimal('30.00')))
+
+    def test_duplicate_and_missing_ids_change_nothing(self):
+        missing = self.sold_out.pk + 100
+        for updates, expected_status, expected_error in (
+            ([{'id': self.print_run.pk, 'price': '1.00'}, {'id': self.print_run.pk, 'price': '2.00'}], 400, f'Duplicate ids in request: [{self.print_run.pk}]'),
+            ([{'id': self.print_run.pk, 'price': '1.00'}, {'id': missing, 'price': '2.00'}], 404, f'Art pictures not found: [{missing}]'),
+        ):
+            with self.subTest(updates=updates):
+                response = self.bulk_update(updates)
+                self.assertEqual((response.status_code, response.data['error']), (expected_status, expected_error))
+        self.assertEqual(self.bulk_update([{'id': self.print_run.pk}]).status_code, 400)
+        self.print_run.refresh_from_db()
+        self.assertEqual(self.print_run.price, Decimal('30.00'))
+
+    def test_admin_only(self):
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'pw'))
+        self.assertEqual(self.bulk_update([{'id': self.print_run.pk, 'price': '1.00'}]).status_code, 403)
+
+
+class ImmediateExecutor:
+    """Stands in for the derivative process pool, rendering in the test's own process and settings"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class ImageDerivativeTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        for target, value in (('get_executor', ImmediateExecutor), ('close_old_connections', lambda: None)):
+            patcher = mock.patch(f'art_gallery.api.images.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def upload(self, width, height):
+        from PIL import Image
+
+        image = io.BytesIO()
+        Image.new('RGB', (width, height), 'teal').save(image, format='JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/art-pictures/', {
+                'title': 'Estuary', 'description': 'Oil on board', 'price': '80.00',
+                'image': SimpleUploadedFile('estuary.jpg', image.getvalue(), content_type='image/jpeg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return ArtPicture.objects.get(pk=response.data['id'])
+
+    def test_upload_renders_derivatives_into_storage(self):
+        picture = self.upload(1600, 1000)
+
+        derivatives = picture.image_derivatives
+        self.assertEqual(derivatives['source'], picture.image.name)
+        # Narrower than the zoom width, so only the thumbnail and detail sizes are rendered
+        self.assertEqual(sorted(derivatives['sizes']), ['detail', 'thumbnail'])
+        self.assertEqual((derivatives['sizes']['thumbnail']['width'], derivatives['sizes']['thumbnail']['height']), (400, 250))
+        for entry in derivatives['sizes'].values():
+            for fmt in DERIVATIVE_FORMATS:
+                self.assertTrue(default_storage.exists(entry[fmt]), entry[fmt])
+        self.assertTrue(os.path.isfile(os.path.join(settings.MEDIA_ROOT, derivatives['sizes']['detail']['webp'])))
+
+        response = self.client.get(f'/api/art-pictures/{picture.pk}/')
+        self.assertEqual(response.data['thumbnail'], f'http://testserver/media/{derivatives["sizes"]["thumbnail"]["jpeg"]}')
+
+
+class CatalogPaginationTests(APITestCase):
+    def setUp(self):
+        self.pictures = [
+            ArtPicture.objects.create(title=f'Print {i}', description='', price=Decimal('10.00'))
+            for i in range(7)
+        ]
+        # Bulk imports stamp many rows with one created_at; the id breaks the tie
+        ArtPicture.objects.filter(pk__in=[picture.pk for picture in self.pictures[2:5]]).update(
+            created_at=self.pictures[2].created_at,
+        )
+
+    def ids(self, response):
+        return [picture['id'] for picture in response.data['results']]
+
+    def test_pages_do_not_shift_when_pictures_are_added(self):
+        first = self.client.get('/api/art-pictures/', {'page_size': 3})
+        seen = self.ids(first)
+        # New pictures land at the head of the catalog while the client pages on
+        ArtPicture.objects.create(title='Newest', description='', price=Decimal('10.00'))
+        next_url = first.data['next']
+        while next_url:
+            page = self.client.get(next_url)
+            seen += self.ids(page)
+            next_url = page.data['next']
+
+        self.assertEqual(seen, [picture.pk for picture in reversed(self.pictures)])
+
+    def test_page_size_is_capped(self):
+        ArtPicture.objects.bulk_create(
+            ArtPicture(title=f'Bulk {i}', description='', price=Decimal('10.00')) for i in range(110)
+        )
+        self.assertEqual(len(self.client.get('/api/art-pictures/', {'page_size': 500}).data['results']), 100)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.picture = ArtPicture.objects.create(
+            title='Harbour', description='Oil on canvas', price=Decimal('100.00'), image_url='https://example.com/harbour.jpg',
+        )
+
+    def test_grid_view(self):
+        response = self.client.get('/api/art-pictures/', {'view': 'grid'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{
+            'id': self.picture.pk, 'title': 'Harbour', 'price': '100.00', 'thumbnail': 'https://example.com/harbour.jpg',
+        }])
+
+    def test_fields_always_include_the_id(self):
+        response = self.client.get(f'/api/art-pictures/{self.picture.pk}/', {'fields': 'price,title'})
+        self.assertEqual(response.data, {'id': self.picture.pk, 'title': 'Harbour', 'price': '100.00'})
+
+    def test_nested_cart_pictures_follow_the_fieldset(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(user)
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.picture.pk}, format='json')
+        response = self.client.get('/api/carts/my_cart/', {'view': 'summary'})
+        self.assertEqual(response.data['items'][0]['art_picture'], {
+            'id': self.picture.pk, 'title': 'Harbour', 'thumbnail': 'https://example.com/harbour.jpg',
+        })
+
+    def test_unknown_fields_and_views_are_rejected(self):
+        for params in ({'fields': 'title,secret'}, {'view': 'poster'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/art-pictures/', params).status_code, 400)
+
+
+class ArtPictureListSerializerTests(APITestCase):
+    """The .values() fast path renders the catalog byte for byte like ArtPictureSerializer"""
+
+    def setUp(self):
+        pictures = sample_pictures(12)
+        # Derivatives left over from a replaced image must not be served
+        pictures[4].image_derivatives = {**pictures[1].image_derivatives, 'source': 'art_pictures/old.jpg'}
+        ArtPicture.objects.bulk_create(pictures)
+
+    def render_both(self, path, fields=None):
+        request = Request(APIRequestFactory().get(path))
+        context = {'request': request, 'art_picture_fields': fields}
+        queryset = ArtPicture.objects.order_by('-id')
+        rows = queryset.values(*ArtPictureListSerializer.get_values_fields(fields))
+        renderer = JSONRenderer()
+        return (
+            renderer.render(ArtPictureSerializer(queryset, many=True, context=context).data),
+            renderer.render(ArtPictureListSerializer(rows, context=context).data),
+        )
+
+    def test_full_representation_is_identical(self):
+        expected, actual = self.render_both('/api/art-pictures/')
+        self.assertEqual(actual, expected)
+        self.assertIn(b'http://testserver/media/art_pictures/derivatives/bench_1_400.webp', actual)
+
+    def test_sparse_fieldsets_are_identical(self):
+        for fields in [*ART_PICTURE_VIEWS.values(), ['id', 'price', 'updated_at'], ['id', 'image_full_url']]:
+            with self.subTest(fields=fields):
+                expected, actual = self.render_both('/api/art-pictures/', fields)
+                self.assertEqual(actual, expected)
+
+
+class CartQueryCountTests(APITestCase):
+    """Loading or changing a cart takes the same number of queries however many lines it has"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.pictures = [
+            ArtPicture.objects.create(title=f'Print {i}', description='', price=Decimal('10.00'), stock=5)
+            for i in range(31)
+        ]
+        self.extra = self.pictures.pop()
+
+    def fill(self, size):
+        CartItem.objects.filter(cart=self.cart).delete()
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, art_picture=picture) for picture in self.pictures[:size])
+        Cart.objects.filter(pk=self.cart.pk).refresh_summary()
+
+    def test_query_counts_do_not_grow_with_the_cart(self):
+        # my_cart: cart, catalog generation (ETag), items with pictures
+        # list: carts, items with pictures
+        # add_item: cart, picture, the cart lock, upserted line and summary inside savepoints, then the reloaded cart and items
+        for size in (1, 10, 30):
+            self.fill(size)
+            with self.subTest(size=size):
+                with self.assertNumQueries(3):
+                    self.assertEqual(len(self.client.get('/api/carts/my_cart/').data['items']), size)
+                with self.assertNumQueries(2):
+                    self.client.get('/api/carts/')
+                with self.assertNumQueries(14):
+                    response = self.client.post('/api/carts/add_item/', {'art_picture_id': self.extra.pk}, format='json')
+                self.assertEqual(len(response.data['items']), size + 1)
+
+
+SHIPPING_ADDRESS = {'street': '1 Quay St', 'city': 'Bristol', 'state': 'Avon', 'zipcode': 'BS1'}
+
+
+class CheckoutMixin:
+    def check_out(self, client, picture, quantity=1):
+        """Put the picture in the client's cart and check out, returning the response"""
+        client.post('/api/carts/add_item/', {'art_picture_id': picture.pk, 'quantity': quantity}, format='json')
+        return client.post(
+            '/api/orders/checkout/', {'shipping_address_data': SHIPPING_ADDRESS, 'same_as_shipping': True}, format='json',
+        )
+
+
+class CheckoutTests(CheckoutMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.user)
+        self.harbour = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=3)
+        self.orchard = ArtPicture.objects.create(title='Orchard', description='', price=Decimal('40.00'), stock=1)
+
+    def test_checkout_turns_the_cart_into_a_pending_order(self):
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.orchard.pk}, format='json')
+        response = self.check_out(self.client, self.harbour, quantity=2)
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual((order.user, order.status, order.total_price), (self.user, 'pending', Decimal('240.00')))
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('art_picture_id', 'quantity', 'price')),
+            [(self.harbour.pk, 2, Decimal('100.00')), (self.orchard.pk, 1, Decimal('40.00'))],
+        )
+        self.assertIn('1 Quay St', order.shipping_address)
+        self.assertEqual(order.billing_address_obj, order.shipping_address_obj)
+
+        # Stock is held for the order; the last copy leaves the catalog
+        self.harbour.refresh_from_db()
+        self.orchard.refresh_from_db()
+        self.assertEqual((self.harbour.stock, self.harbour.is_available), (1, True))
+        self.assertEqual((self.orchard.stock, self.orchard.is_available), (0, False))
+        self.assertEqual(sorted(Reservation.objects.filter(order=order).values_list('art_picture_id', 'quantity')),
+                         [(self.harbour.pk, 2), (self.orchard.pk, 1)])
+
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.total_price), (0, Decimal('0.00')))
+        self.assertFalse(CartItem.objects.filter(cart=cart).exists())
+
+    def test_insufficient_stock_changes_nothing(self):
+        response = self.check_out(self.client, self.harbour, quantity=4)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['art_picture_ids'], [self.harbour.pk])
+
+        self.harbour.refresh_from_db()
+        self.assertEqual(self.harbour.stock, 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.get(user=self.user).item_count, 4)
+
+    def test_empty_cart_and_missing_address_are_rejected(self):
+        empty = self.client.post(
+            '/api/orders/checkout/', {'shipping_address_data': SHIPPING_ADDRESS, 'same_as_shipping': True}, format='json',
+        )
+        self.assertEqual(empty.status_code, 400)
+        self.client.post('/api/carts/add_item/', {'art_picture_id': self.harbour.pk}, format='json')
+        self.assertEqual(self.client.post('/api/orders/checkout/', {}, format='json').status_code, 400)
+
+
+class AddressBookTests(CheckoutMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.user)
+
+    def test_saving_an_address_twice_returns_the_saved_one(self):
+        first = self.client.post('/api/addresses/', SHIPPING_ADDRESS, format='json')
+        self.assertEqual(first.status_code, 201)
+        # Case and spacing don't make a new address
+        again = self.client.post('/api/addresses/', {**SHIPPING_ADDRESS, 'street': ' 1  QUAY st '}, format='json')
+        self.assertEqual(again.data['id'], first.data['id'])
+        self.assertEqual(Address.objects.filter(user=self.user).count(), 1)
+
+        # Another user gets their own copy
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client.force_authenticate(other)
+        self.assertNotEqual(self.client.post('/api/addresses/', SHIPPING_ADDRESS, format='json').data['id'], first.data['id'])
+
+    def test_deleted_address_leaves_the_book_but_not_past_orders(self):
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=2)
+        order = Order.objects.get(pk=self.check_out(self.client, picture).data['id'])
+        address = order.shipping_address_obj
+        self.assertEqual([row['id'] for row in self.client.get('/api/addresses/').data], [address.pk])
+
+        self.assertEqual(self.client.delete(f'/api/addresses/{address.pk}/').status_code, 204)
+        self.assertEqual(self.client.get('/api/addresses/').data, [])
+        order.refresh_from_db()
+        self.assertEqual(order.shipping_address_obj, address)
+
+        # Checking out to it again reuses the archived row and brings it back
+        self.assertEqual(self.client.post('/api/addresses/', SHIPPING_ADDRESS, format='json').data['id'], address.pk)
+        self.assertEqual(Order.objects.get(pk=self.check_out(self.client, picture).data['id']).shipping_address_obj, address)
+
+    def test_migration_collapses_duplicates_onto_the_first_address(self):
+        migration = importlib.import_module('art_gallery.api.migrations.0016_address_book')
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        # Pre-0016 rows: no owner, one per order
+        kept = Address.objects.create(**SHIPPING_ADDRESS)
+        duplicate = Address.objects.create(**{**SHIPPING_ADDRESS, 'city': 'BRISTOL '})
+        others = Address.objects.create(**SHIPPING_ADDRESS)
+        first = Order.objects.create(user=self.user, total_price=Decimal('1.00'), shipping_address_obj=kept)
+        second = Order.objects.create(
+            user=self.user, total_price=Decimal('1.00'), shipping_address_obj=duplicate, billing_address_obj=duplicate,
+        )
+        third = Order.objects.create(user=other, total_price=Decimal('1.00'), shipping_address_obj=others)
+
+        migration.collapse_duplicate_addresses(apps, None)
+
+        self.assertFalse(Address.objects.filter(pk=duplicate.pk).exists())
+        second.refresh_from_db()
+        self.assertEqual((second.shipping_address_obj_id, second.billing_address_obj_id), (kept.pk, kept.pk))
+        self.assertEqual(Address.objects.get(pk=kept.pk).user, self.user)
+        # The same address on another user's order stays theirs
+        self.assertEqual(Address.objects.get(pk=others.pk).user, other)
+        first.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.shipping_address_obj_id, third.shipping_address_obj_id), (kept.pk, others.pk))
+
+
+class OrderHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.picture = ArtPicture.objects.create(
+            title='Harbour', description='Oil on canvas', price=Decimal('100.00'), image_url='https://example.com/harbour.jpg',
+        )
+        self.orders = []
+        for i in range(25):
+            order = Order.objects.create(user=self.user, total_price=Decimal('100.00'))
+            OrderItem.objects.create(order=order, art_picture=self.picture, price=Decimal('100.00'))
+            self.orders.append(order)
+        Order.objects.create(user=other, total_price=Decimal('5.00'))
+        self.client.force_authenticate(self.user)
+
+    def test_history_is_paged_newest_first(self):
+        with self.assertNumQueries(2):
+            first = self.client.get('/api/orders/')
+        self.assertEqual(len(first.data['results']), 20)
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(second.data['next'])
+        ids = [order['id'] for order in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, [order.pk for order in reversed(self.orders)])
+
+    def test_list_nests_picture_summaries(self):
+        item = self.client.get('/api/orders/', {'page_size': 1}).data['results'][0]['items'][0]
+        self.assertEqual(item['art_picture'], {
+            'id': self.picture.pk, 'title': 'Harbour', 'thumbnail': 'https://example.com/harbour.jpg',
+        })
+        # A single order still carries the full picture
+        detail = self.client.get(f'/api/orders/{self.orders[0].pk}/').data['items'][0]['art_picture']
+        self.assertEqual(detail['description'], 'Oil on canvas')
+
+
+class LatePaymentTests(CheckoutMixin, APITestCase):
+    """A payment that lands after the order was cancelled is kept and refunded"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=1)
+        self.client.force_authenticate(self.user)
+        self.order = Order.objects.get(pk=self.check_out(self.client, picture).data['id'])
+
+    def pay_while_cancelled(self, refund):
+        def charge(**kwargs):
+            # The expiry sweeper cancels the order while Stripe is charging the card
+            Order.objects.filter(pk=self.order.pk).transition('cancelled')
+            return mock.Mock(id='ch_late')
+
+        with mock.patch('stripe.Charge.create', side_effect=charge), mock.patch('stripe.Refund.create', refund):
+            response = self.client.post(f'/api/orders/{self.order.pk}/process_payment/', {'token': 'tok'}, format='json')
+        self.order.refresh_from_db()
+        return response
+
+    def test_charge_is_refunded_and_recorded(self):
+        refund = mock.Mock(return_value=mock.Mock(id='re_1'))
+        response = self.pay_while_cancelled(refund)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['refund_status'], 'refunded')
+        refund.assert_called_once_with(charge='ch_late', idempotency_key='refund-ch_late')
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual(self.order.unapplied_payments[0]['payment_id'], 'ch_late')
+        self.assertEqual(self.order.unapplied_payments[0]['refund_id'], 're_1')
+        self.assertFalse(self.order.needs_reconciliation)
+
+    def test_failed_refund_flags_order_for_reconciliation(self):
+        response = self.pay_while_cancelled(mock.Mock(side_effect=RuntimeError('Stripe is down')))
+
+        self.assertEqual(response.data['refund_status'], 'failed')
+        self.assertEqual(self.order.unapplied_payments[0]['payment_id'], 'ch_late')
+        self.assertTrue(self.order.needs_reconciliation)
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.picture = ArtPicture.objects.create(title='Lighthouse at dusk', description='', price=Decimal('90.00'))
+
+    def test_withdrawn_elsewhere_is_not_returned(self):
+        self.assertEqual(self.client.get('/api/art-pictures/search/?q=lighthouse').data['count'], 1)
+        # Another process withdraws the picture without bumping this process's catalog generation
+        ArtPicture.objects.filter(pk=self.picture.pk).update(is_available=False)
+
+        response = self.client.get('/api/art-pictures/search/?q=lighthouse&limit=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_ids_missing_from_the_catalog_are_skipped(self):
+        ranked = [(self.picture.pk + 1000, 2.0), (self.picture.pk, 1.0)]
+        with mock.patch('art_gallery.api.views.search_art_pictures', return_value=(ranked, 2, {})):
+            response = self.client.get('/api/art-pictures/search/?q=dusk')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.data['results']], [self.picture.pk])
+
+    def test_limit_is_clamped_and_bad_parameters_are_rejected(self):
+        ArtPicture.objects.create(title='Lighthouse at dawn', description='', price=Decimal('95.00'))
+        for limit, expected in (('-1', 1), ('0', 1), ('1000', 2)):
+            with self.subTest(limit=limit):
+                response = self.client.get('/api/art-pictures/search/', {'q': 'lighthouse', 'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual((response.data['count'], len(response.data['results'])), (2, expected))
+        for params in ({'limit': 'ten'}, {'limit': '2.5'}, {'min_price': 'NaN'}, {'max_price': 'Infinity'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/art-pictures/search/', {'q': 'lighthouse', **params})
+                self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTests(APITestCase):
+    def test_bump_from_another_process_invalidates_cached_pages(self):
+        bump_generation()
+        ArtPicture.objects.create(title='Orchard', description='', price=Decimal('40.00'))
+        self.assertEqual(self.client.get('/api/art-pictures/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/art-pictures/')['X-Cache'], 'HIT')
+
+        # What a management command's bump_generation() does, without touching this process's cache
+        ArtPicture.objects.update(is_available=False)
+        CatalogGeneration.objects.filter(pk=1).update(value=F('value') + 1)
+
+        response = self.client.get('/api/art-pictures/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+
+class ReceiptTests(CheckoutMixin, APITestCase):
+    def setUp(self):
+        receipt_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, receipt_root, ignore_errors=True)
+        settings_override = override_settings(RECEIPT_ROOT=receipt_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=2)
+        self.client.force_authenticate(self.user)
+        self.order_id = self.check_out(self.client, picture).data['id']
+
+    def test_order_cancelled_before_payment_has_no_receipt(self):
+        with mock.patch('art_gallery.api.models.schedule_receipts_on_commit') as schedule:
+            self.client.force_authenticate(self.admin)
+            self.client.patch(f'/api/orders/{self.order_id}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(Order.objects.get(pk=self.order_id).status, 'cancelled')
+        self.assertEqual(list(schedule.call_args.args[0]), [])
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(f'/api/orders/{self.order_id}/receipt/').status_code, 409)
+
+    def test_paid_order_receipt_is_served_with_etag(self):
+        with mock.patch('stripe.Charge.create', return_value=mock.Mock(id='ch_1')):
+            self.client.post(f'/api/orders/{self.order_id}/process_payment/', {'token': 'tok'}, format='json')
+
+        response = self.client.get(f'/api/orders/{self.order_id}/receipt/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Receipt of Purchase', response.content)
+        cached = self.client.get(f'/api/orders/{self.order_id}/receipt/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+
+class OrderRestoreTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'))
+        self.client.force_authenticate(self.admin)
+
+    def restore(self, **row):
+        row.setdefault('items', [{'art_picture_id': self.picture.pk, 'quantity': 2}])
+        return self.client.post('/api/orders/restore_order/', row, format='json')
+
+    def test_order_without_user_goes_to_the_requesting_admin(self):
+        response = self.restore(status='paid')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual((order.user, order.status, order.total_price), (self.admin, 'paid', Decimal('200.00')))
+
+    def test_order_for_a_named_user(self):
+        response = self.restore(user=self.buyer.pk)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get(pk=response.data['id']).user, self.buyer)
+        self.assertEqual(self.restore(user=self.buyer.pk + 100).status_code, 400)
+
+    def test_bulk_restore_reports_bad_lines_and_keeps_the_rest(self):
+        number = '3f1c1e0e-8a1b-4c55-9a57-2f0d0b7d1a11'
+        row = {
+            'user': self.buyer.pk, 'order_number': number, 'status': 'delivered',
+            'created_at': '2024-03-01T12:00:00Z', 'shipping_address_data': SHIPPING_ADDRESS,
+            'items': [{'art_picture_id': self.picture.pk, 'quantity': 1, 'price': '80.00'}],
+        }
+        body = '\n'.join([
+            json.dumps(row),
+            json.dumps({**row, 'order_number': None, 'user': self.buyer.pk + 100}),
+            '{"user": ',
+            '',
+            json.dumps(row),
+            json.dumps({'user': self.buyer.pk, 'items': [{'art_picture_id': self.picture.pk}]}),
+        ])
+        response = self.client.post('/api/orders/bulk_restore/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['restored'], response.data['failed']), (2, 3))
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3, 5])
+        self.assertIn('not found', response.data['errors'][0]['error'])
+        self.assertIn('already exists', response.data['errors'][2]['error'])
+
+        self.assertEqual([order['line'] for order in response.data['orders']], [1, 6])
+        restored = Order.objects.get(order_number=number)
+        self.assertEqual((restored.user, restored.status, restored.total_price), (self.buyer, 'delivered', Decimal('80.00')))
+        self.assertEqual(restored.created_at.year, 2024)
+        self.assertEqual(restored.shipping_address_obj.user, self.buyer)
+        self.assertEqual(Order.objects.get(pk=response.data['orders'][1]['id']).total_price, Decimal('100.00'))
+
+    def test_bulk_restore_takes_a_json_array_from_admins_only(self):
+        rows = [
+            {'user': self.buyer.pk, 'items': [{'art_picture_id': self.picture.pk}]},
+            {'user': self.buyer.pk, 'status': 'lost'},
+        ]
+        response = self.client.post('/api/orders/bulk_restore/', rows, format='json')
+        self.assertEqual((response.data['restored'], response.data['errors']), (1, [{'line': 2, 'error': 'invalid status "lost"'}]))
+
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.post('/api/orders/bulk_restore/', rows, format='json').status_code, 403)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class CancellationTests(CheckoutMixin, APITestCase):
+    def test_cancelling_returns_stock_and_invalidates_the_catalog(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=1)
+        self.client.force_authenticate(user)
+        order_id = self.check_out(self.client, picture).data['id']
+        picture.refresh_from_db()
+        self.assertFalse(picture.is_available)
+
+        generation = get_generation()
+        # What the admin's "Mark selected orders cancelled" action runs
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(pk=order_id).transition('cancelled')
+
+        picture.refresh_from_db()
+        self.assertEqual((picture.stock, picture.is_available), (1, True))
+        self.assertGreater(get_generation(), generation)
+
+
+class PaymentRetryTests(CheckoutMixin, APITestCase):
+    """Transient payment provider failures must leave the Idempotency-Key free for a retry"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('100.00'), stock=1)
+        self.client.force_authenticate(self.user)
+        self.order_id = self.check_out(self.client, picture).data['id']
+
+    def pay(self):
+        return self.client.post(
+            f'/api/orders/{self.order_id}/process_payment/', {'token': 'tok'}, format='json',
+            HTTP_IDEMPOTENCY_KEY='pay-1',
+        )
+
+    def test_retry_after_transient_stripe_errors(self):
+        failures = [
+            (stripe.error.APIConnectionError('connection reset'), 502),
+            (stripe.error.RateLimitError('too many requests'), 503),
+        ]
+        for error, expected_status in failures:
+            with mock.patch('stripe.Charge.create', side_effect=error):
+                self.assertEqual(self.pay().status_code, expected_status)
+
+        with mock.patch('stripe.Charge.create', return_value=mock.Mock(id='ch_1')) as charge:
+            self.assertEqual(self.pay().status_code, 200)
+        self.assertEqual(charge.call_args.kwargs['idempotency_key'], f'order-{self.order_id}-pay-1')
+        self.assertEqual(Order.objects.get(pk=self.order_id).status, 'paid')
+
+    def test_card_errors_are_final(self):
+        error = stripe.error.CardError('card declined', param=None, code='card_declined')
+        with mock.patch('stripe.Charge.create', side_effect=error):
+            self.assertEqual(self.pay().status_code, 400)
+        with mock.patch('stripe.Charge.create', return_value=mock.Mock(id='ch_1')) as charge:
+            self.assertEqual(self.pay().status_code, 400)
+        charge.assert_not_called()
+
+    def test_claim_left_by_a_dead_request_is_taken_over_after_its_lease(self):
+        # The worker handling the first attempt was killed before it answered
+        orphan = IdempotencyKey.objects.create(
+            user=self.user, key='pay-1', scope='orders.process_payment', fingerprint='',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        response = self.pay()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '120')
+
+        IdempotencyKey.objects.filter(pk=orphan.pk).update(created_at=timezone.now() - timedelta(seconds=121))
+        with mock.patch('stripe.Charge.create', return_value=mock.Mock(id='ch_1')):
+            self.assertEqual(self.pay().status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get(key='pay-1').status_code, 200)
+
+
+class FakePayPal(ThreadingHTTPServer):
+    """
+    Local stand-in for the PayPal REST API that counts TCP connections, token
+    requests and API requests, so tests can measure the round trips the
+    client saves. `failures` queues statuses to answer API requests with,
+    `delay` stalls API responses and `revoke` makes the next API request
+    reject its (valid) token once.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.token_requests = 0
+        self.api_requests = 0
+        self.expires_in = 32400
+        self.order_status = 'COMPLETED'
+        self.failures = []
+        self.delay = 0
+        self.revoke = False
+        self.tokens = set()
+        super().__init__(('127.0.0.1', 0), FakePayPalHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def handle_error(self, request, client_address):
+        # The client hung up on a stalled response; that is what the timeout tests want
+        pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakePayPalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so reused connections can be counted
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status_code, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/v1/oauth2/token':
+            self.server.token_requests += 1
+            token = f'token-{self.server.token_requests}'
+            self.server.tokens.add(token)
+            return self.reply(200, {'access_token': token, 'expires_in': self.server.expires_in})
+        self.server.api_requests += 1
+        self.reply(201, {'id': 'refund-1', 'status': 'COMPLETED'})
+
+    def do_GET(self):
+        server = self.server
+        server.api_requests += 1
+        if server.delay:
+            time.sleep(server.delay)
+        if server.failures:
+            return self.reply(server.failures.pop(0), {'name': 'SERVICE_UNAVAILABLE'})
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        if server.revoke:
+            server.revoke = False
+            server.tokens.discard(token)
+        if token not in server.tokens:
+            return self.reply(401, {'error': 'invalid_token'})
+        self.reply(200, {'id': self.path.rsplit('/', 1)[-1], 'status': server.order_status})
+
+
+@mock.patch('art_gallery.api.paypal.retry_delay', return_value=0)
+class PayPalClientTests(SimpleTestCase):
+    def setUp(self):
+        self.paypal = FakePayPal()
+        self.addCleanup(self.paypal.stop)
+
+    def make_client(self, **kwargs):
+        client = PayPalClient('client-id', 'secret', self.paypal.url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_connection_and_token_are_reused(self, retry_delay):
+        client = self.make_client()
+        for i in range(20):
+            self.assertEqual(client.get_order(f'ORDER-{i}')['status'], 'COMPLETED')
+        # One token request and one TCP connection instead of 20 of each
+        self.assertEqual(self.paypal.token_requests, 1)
+        self.assertEqual(self.paypal.api_requests, 20)
+        self.assertEqual(self.paypal.connections, 1)
+
+    def test_token_is_refreshed_before_it_expires(self, retry_delay):
+        self.paypal.expires_in = 30  # inside the refresh margin: never worth caching
+        client = self.make_client()
+        client.get_order('ORDER-1')
+        client.get_order('ORDER-2')
+        self.assertEqual(self.paypal.token_requests, 2)
+
+    def test_server_errors_are_retried(self, retry_delay):
+        self.paypal.failures = [503, 500]
+        self.assertEqual(self.make_client(max_retries=2).get_order('ORDER-1')['status'], 'COMPLETED')
+        self.assertEqual(self.paypal.api_requests, 3)
+        self.assertEqual(retry_delay.call_count, 2)
+
+    def test_retries_are_bounded(self, retry_delay):
+        self.paypal.failures = [429] * 5
+        with self.assertRaises(PayPalError) as raised:
+            self.make_client(max_retries=2).get_order('ORDER-1')
+        self.assertEqual(raised.exception.status_code, 429)
+        self.assertTrue(raised.exception.transient)
+        self.assertEqual(self.paypal.api_requests, 3)
+
+    def test_revoked_token_is_replaced_once(self, retry_delay):
+        client = self.make_client()
+        client.get_order('ORDER-1')
+        self.paypal.revoke = True
+        self.assertEqual(client.get_order('ORDER-2')['status'], 'COMPLETED')
+        self.assertEqual(self.paypal.token_requests, 2)
+
+    def test_read_timeout(self, retry_delay):
+        self.paypal.delay = 1
+        client = self.make_client(read_timeout=0.2, max_retries=1)
+        started = time.monotonic()
+        with self.assertRaises(PayPalError) as raised:
+            client.get_order('ORDER-1')
+        self.assertTrue(raised.exception.transient)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+@override_settings(PAYPAL_SIMULATION_MODE=False, PAYPAL_CLIENT_SECRET='secret')
+@mock.patch('art_gallery.api.paypal.retry_delay', return_value=0)
+class PayPalPaymentTests(CheckoutMixin, APITestCase):
+    def setUp(self):
+        self.paypal = FakePayPal()
+        self.addCleanup(self.paypal.stop)
+        client = PayPalClient('client-id', 'secret', self.paypal.url)
+        self.addCleanup(client.close)
+        client_patch = mock.patch('art_gallery.api.views.get_paypal_client', return_value=client)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        self.client.force_authenticate(self.user)
+        self.pictures = [
+            ArtPicture.objects.create(title=f'Print {i}', description='', price=Decimal('20.00'), stock=1)
+            for i in range(3)
+        ]
+
+    def pay(self, picture, key):
+        order_id = self.check_out(self.client, picture).data['id']
+        Order.objects.filter(pk=order_id).update(payment_method='paypal')
+        response = self.client.post(
+            f'/api/orders/{order_id}/process_payment/',
+            {'token': 'tok', 'paypalDetails': {'orderID': f'PP-{order_id}'}}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+        return order_id, response
+
+    def test_payments_share_one_token_and_connection(self, retry_delay):
+        for i, picture in enumerate(self.pictures):
+            order_id, response = self.pay(picture, f'pay-{i}')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.paypal.token_requests, self.paypal.api_requests, self.paypal.connections), (1, 3, 1))
+
+    def test_paypal_still_rate_limiting_after_retries_is_retryable(self, retry_delay):
+        self.paypal.failures = [429] * 3
+        order_id, response = self.pay(self.pictures[0], 'pay-1')
+        self.assertEqual(response.status_code, 502)
+
+        retry = self.client.post(
+            f'/api/orders/{order_id}/process_payment/',
+            {'token': 'tok', 'paypalDetails': {'orderID': f'PP-{order_id}'}}, format='json',
+            HTTP_IDEMPOTENCY_KEY='pay-1',
+        )
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'paid')
+
+    def test_unapproved_order_is_rejected(self, retry_delay):
+        self.paypal.order_status = 'PAYER_ACTION_REQUIRED'
+        order_id, response = self.pay(self.pictures[0], 'pay-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'pending')
+
+
+def run_concurrently(count, func):
+    """
+    Call func(i) from `count` threads released at the same moment and return
+    the results in order. Each thread closes its own database connection.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(i):
+        try:
+            barrier.wait()
+            results[i] = func(i)
+        except Exception as e:
+            results[i] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+# Threads need a database that takes row locks; SQLite's test database reports "table is locked"
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentAddItemTests(TransactionTestCase):
+    """Threads adding the same picture to one cart end up with one line holding every unit"""
+
+    def test_parallel_adds_are_not_lost(self):
+        user = User.objects.create_user('buyer', 'buyer@example.com', 'pw')
+        picture = ArtPicture.objects.create(title='Harbour', description='', price=Decimal('10.00'), stock=5)
+        Cart.objects.create(user=user)
+
+        def add(i):
+            client = APIClient()
+            client.force_authenticate(user)
+            return [
+                client.post('/api/carts/add_item/', {'art_picture_id': picture.pk, 'quantity': 2}, format='json').status_code
+                for _ in range(10)
+            ]
+
+        results = run_concurrently(8, add)
+        self.assertEqual(results, [[200] * 10] * 8)
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [160])
+        cart = Cart.objects.get(user=user)
+        self.assertEqual((cart.item_count, cart.total_price), (160, Decimal('1600.00')))
+
+
+# SQLite has no row locks: racing checkouts fail with "database is locked" instead of queueing
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Buyers racing for the last copies of a print can't check out more than the stock"""
+
+    def test_parallel_checkouts_never_oversell(self):
+        stock, buyers = 3, 8
+        picture = ArtPicture.objects.create(title='Edition print', description='', price=Decimal('50.00'), stock=stock)
+        clients = []
+        for i in range(buyers):
+            client = APIClient()
+            client.force_authenticate(User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pw'))
+            client.post('/api/carts/add_item/', {'art_picture_id': picture.pk, 'quantity': 1}, format='json')
+            clients.append(client)
+
+        results = run_concurrently(buyers, lambda i: clients[i].post(
+            '/api/orders/checkout/', {'shipping_address_data': SHIPPING_ADDRESS, 'same_as_shipping': True}, format='json',
+        ).status_code)
+
+        self.assertEqual(Counter(results), {201: stock, 409: buyers - stock})
+        picture.refresh_from_db()
+        self.assertEqual((picture.stock, picture.is_available), (0, False))
+        self.assertEqual(Order.objects.count(), stock)
+        self.assertEqual(sum(Reservation.objects.values_list('quantity', flat=True)), stock)
+
+
+class FakeImageHost(ThreadingHTTPServer):
+    """
+    Local stand-in for the third-party hosts behind image_url. Each path is
+    answered from `files` as (status, content type, body) after `delay`
+    seconds; the peak number of requests in flight is recorded.
+    """
+    daemon_threads = True
+
+    def __init__(self, files, delay=0.1):
+        self.files = files
+        self.delay = delay
+        self.requests = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), FakeImageHostHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_port}{path}'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeImageHostHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests[self.path] += 1
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            status_code, content_type, body = server.files.get(self.path, (404, 'text/plain', b'not found'))
+            self.send_response(status_code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class IngestExternalImagesTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.host = FakeImageHost({
+            **{f'/same-{i}.jpg': (200, 'image/jpeg', b'identical jpeg bytes') for i in range(6)},
+            '/other.png': (200, 'image/png', b'different png bytes'),
+            '/page.html': (200, 'text/html', b'<html></html>'),
+        })
+        self.addCleanup(self.host.stop)
+        self.paths = [*(f'/same-{i}.jpg' for i in range(6)), '/other.png', '/page.html', '/gone.jpg']
+        self.pictures = {
+            path: ArtPicture.objects.create(title=path, description='', price=Decimal('10.00'), image_url=self.host.url(path))
+            for path in self.paths
+        }
+
+    def ingest(self, **options):
+        call_command('ingest_external_images', '--skip-derivatives', stdout=StringIO(), **options)
+        return {path: ArtPicture.objects.get(pk=picture.pk) for path, picture in self.pictures.items()}
+
+    def test_downloads_are_bounded_and_deduplicated(self):
+        pictures = self.ingest(concurrency=3)
+
+        self.assertEqual(self.host.peak_in_flight, 3)
+        self.assertEqual(set(self.host.requests.values()), {1})
+        # Six URLs with the same bytes share one stored file
+        same = {pictures[f'/same-{i}.jpg'].image.name for i in range(6)}
+        self.assertEqual(len(same), 1)
+        self.assertNotEqual(pictures['/other.png'].image.name, same.pop())
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'art_pictures', 'ingested'))), 2)
+
+    def test_failures_back_off(self):
+        before = timezone.now()
+        pictures = self.ingest(concurrency=4)
+
+        for path, error in (('/page.html', 'Not an image (text/html)'), ('/gone.jpg', 'HTTP 404')):
+            picture = pictures[path]
+            self.assertFalse(picture.image)
+            self.assertEqual((picture.image_fetch_attempts, picture.image_fetch_error), (1, error))
+            self.assertGreaterEqual(picture.image_fetch_retry_at, before + BACKOFF_BASE * 0.8)
+            self.assertLessEqual(picture.image_fetch_retry_at, timezone.now() + BACKOFF_BASE * 1.2)
+
+        # Nothing is due yet, so a second run makes no requests
+        self.ingest()
+        self.assertEqual(sum(self.host.requests.values()), len(self.paths))
+
+        # Once the delay has passed the failures are retried and back off further
+        ArtPicture.objects.filter(image_fetch_attempts=1).update(image_fetch_retry_at=timezone.now())
+        pictures = self.ingest()
+        self.assertEqual(self.host.requests['/gone.jpg'], 2)
+        self.assertEqual(pictures['/gone.jpg'].image_fetch_attempts, 2)
+        self.assertGreaterEqual(pictures['/gone.jpg'].image_fetch_retry_at, timezone.now() + BACKOFF_BASE * 1.6 - timedelta(seconds=5))
+
+
+class ImportArtTests(APITestCase):
+    def import_lines(self, *lines):
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_art', path, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_rows_that_are_not_objects_are_skipped_per_line(self):
+        stdout, stderr = self.import_lines(
+            json.dumps({'title': 'Harbour', 'price': '100.00'}),
+            '[1, 2]',
+            '"Harbour"',
+            json.dumps({'title': 12, 'price': '5'}),
+            json.dumps({'title': 'Orchard', 'price': '40.00', 'stock': 3}),
+        )
+        self.assertIn('Line 2: each row must be a JSON object', stderr)
+        self.assertIn('Line 3: each row must be a JSON object', stderr)
+        self.assertIn('2 invalid rows skipped', stdout)
+        self.assertEqual(
+            sorted(ArtPicture.objects.values_list('title', 'price', 'stock')),
+            [('12', Decimal('5.00'), 1), ('Harbour', Decimal('100.00'), 1), ('Orchard', Decimal('40.00'), 3)],
+        )
+
+    def test_malformed_and_non_finite_rows_are_reported_with_their_line(self):
+        stdout, stderr = self.import_lines(
+            json.dumps({'title': 'Harbour', 'price': '100.00'}),
+            '{"title": "Broken", "price": ',
+            json.dumps({'title': 'Nothing', 'price': 'NaN'}),
+            json.dumps({'title': 'Everything', 'price': 'Infinity'}),
+            '{"title": "Float", "price": NaN}',
+            json.dumps({'title': 'Huge', 'price': '1e40'}),
+            json.dumps({'title': 'Orchard', 'price': '40.00'}),
+        )
+        self.assertIn('Line 2: invalid JSON: Expecting value at column 29', stderr)
+        self.assertIn('Line 3: invalid price "NaN"', stderr)
+        self.assertIn('Line 4: invalid price "Infinity"', stderr)
+        self.assertIn('Line 5: invalid price "nan"', stderr)
+        self.assertIn('Line 6: price is too large', stderr)
+        self.assertIn('Imported 2 art pictures', stdout)
+        self.assertIn('5 invalid rows skipped', stdout)
+        self.assertEqual(sorted(ArtPicture.objects.values_list('title', flat=True)), ['Harbour', 'Orchard'])
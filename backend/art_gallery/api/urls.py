@@ -1,10 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from .views import (
-    UserViewSet, ArtPictureViewSet, CartViewSet, 
-    OrderViewSet, MessageViewSet, OrderUserViewSet
+    UserViewSet, ArtPictureViewSet, CartViewSet, GuestCartViewSet,
+    OrderViewSet, AddressViewSet, MessageViewSet, OrderUserViewSet, GuestCartTokenObtainPairView
 )
 
 # Create a router and register our viewsets with it
@@ -12,7 +12,9 @@ router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'art-pictures', ArtPictureViewSet)
 router.register(r'carts', CartViewSet, basename='cart')
+router.register(r'guest-cart', GuestCartViewSet, basename='guest-cart')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'addresses', AddressViewSet, basename='address')
 router.register(r'order-user-view', OrderUserViewSet, basename='order-user-view')
 router.register(r'messages', MessageViewSet, basename='message')
 
@@ -22,6 +24,6 @@ urlpatterns = [
     path('', include(router.urls)),
     
     # JWT authentication
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', GuestCartTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ] 
\ No newline at end of file
@@ -1,18 +1,45 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, HttpResponseNotModified
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch, Sum, Value, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.http import parse_etags
+from decimal import Decimal, InvalidOperation
+from collections import Counter
+import hashlib
 
 import stripe
 from django.conf import settings
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import ArtPicture, Cart, CartItem, Order, OrderItem, Message, Address, OrderUserView
+from .models import (
+    ArtPicture, Cart, CartItem, Order, OrderItem, Message, Address, OrderUserView, Reservation, ORDER_TRANSITIONS,
+    cart_total_expression, reservation_ttl
+)
 from .serializers import (
-    UserSerializer, ArtPictureSerializer, CartSerializer, CartItemSerializer,
-    OrderSerializer, OrderItemSerializer, MessageSerializer, OrderUserViewSerializer
+    UserSerializer, ArtPictureSerializer, ArtPictureListSerializer, ArtPictureBulkUpdateSerializer, CartSerializer, CartItemSerializer, CartOperationSerializer,
+    CartBatchSerializer, GuestCartSerializer, GuestCartItemSerializer,
+    OrderSerializer, OrderItemSerializer, OrderStatusChangeSerializer, AddressSerializer, MessageSerializer, OrderUserViewSerializer,
+    get_art_picture_fields, get_art_picture_only, ART_PICTURE_VIEWS
+)
+from .pagination import ArtPictureCursorPagination, OrderCursorPagination
+from .cache import cached_catalog_response, get_cache_stats, bump_generation, get_generation
+from .search import search_art_pictures
+from .idempotency import idempotent, get_idempotency_key
+from .order_restore import NDJSONParser, restore_orders
+from .receipts import build_receipt, has_receipt, read_receipt, receipt_etag
+from .paypal import PayPalError, completed_capture_ids, get_paypal_client
+from .guest_cart import (
+    get_guest_id, new_guest_id, load_guest_cart, save_guest_cart, set_guest_cookie, clear_guest_cookie,
+    merge_guest_cart
 )
 
 # Configure Stripe API key
@@ -68,24 +95,231 @@ class ArtPictureViewSet(viewsets.ModelViewSet):
     queryset = ArtPicture.objects.all()
     serializer_class = ArtPictureSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = ArtPictureCursorPagination
     
     def get_permissions(self):
         """Allow unauthenticated access to list and retrieve"""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             return [AllowAny()]
+        if self.action == 'cache_stats':
+            return [IsAdminOrSuperuser()]
         return [IsAdminOrReadOnly()]
     
     def get_queryset(self):
         queryset = ArtPicture.objects.all()
         if not (self.request.user.is_staff or self.request.user.is_superuser):
             queryset = queryset.filter(is_available=True)
+        fields = self.get_art_picture_fields()
+        if fields is not None:
+            # Only load the columns the requested fieldset needs (plus the cursor columns)
+            queryset = queryset.only(*get_art_picture_only(fields, required=('id', 'created_at')))
         return queryset
     
+    def get_art_picture_fields(self):
+        """Sparse fieldset requested with ?fields= or ?view= (reads only)"""
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        return get_art_picture_fields(self.request)
+    
     def get_serializer_context(self):
         """Add request to serializer context for proper image URL generation"""
         context = super().get_serializer_context()
         context['request'] = self.request
+        context['art_picture_fields'] = self.get_art_picture_fields()
         return context
+    
+    def list(self, request, *args, **kwargs):
+        """List art pictures, served from the catalog cache when possible"""
+        def render():
+            # Model-free fast path: rows come straight from .values() tuples
+            # The cursor needs id and created_at even if the fieldset leaves them out
+            values_fields = ArtPictureListSerializer.get_values_fields(
+                self.get_art_picture_fields(), required=('id', 'created_at')
+            )
+            queryset = self.filter_queryset(self.get_queryset()).values(*values_fields)
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = ArtPictureListSerializer(page, context=self.get_serializer_context())
+                return self.get_paginated_response(serializer.data)
+            serializer = ArtPictureListSerializer(queryset, context=self.get_serializer_context())
+            return Response(serializer.data)
+        
+        return cached_catalog_response(request, 'list', render)
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve an art picture, served from the catalog cache when possible"""
+        return cached_catalog_response(
+            request, 'retrieve', lambda: super(ArtPictureViewSet, self).retrieve(request, *args, **kwargs)
+        )
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Full-text search over titles and descriptions with price/availability facets"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'Search query (q) is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            min_price = request.query_params.get('min_price')
+            max_price = request.query_params.get('max_price')
+            min_price = Decimal(min_price) if min_price not in (None, '') else None
+            max_price = Decimal(max_price) if max_price not in (None, '') else None
+            limit = max(1, min(int(request.query_params.get('limit', 24)), 100))
+            if any(price is not None and not price.is_finite() for price in (min_price, max_price)):
+                raise InvalidOperation
+        except (InvalidOperation, ValueError):
+            return Response(
+                {'error': 'Invalid price range or limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        is_available = request.query_params.get('is_available')
+        if is_available is not None:
+            is_available = is_available.lower() in ('true', '1')
+        available_only = not (request.user.is_staff or request.user.is_superuser)
+        
+        def render():
+            ranked, count, facets = search_art_pictures(
+                query,
+                available_only=available_only,
+                min_price=min_price,
+                max_price=max_price,
+                is_available=is_available,
+                limit=limit,
+            )
+            pictures = self.get_queryset().in_bulk([pk for pk, relevance in ranked])
+            results = []
+            for pk, relevance in ranked:
+                if pk not in pictures:
+                    # Deleted or withdrawn since the index was read
+                    continue
+                data = self.get_serializer(pictures[pk]).data
+                data['relevance'] = round(float(relevance), 4)
+                results.append(data)
+            return Response({'count': count, 'results': results, 'facets': facets})
+        
+        return cached_catalog_response(request, 'search', render)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_update(self, request):
+        """Update price/availability/etc. of many art pictures in one transaction (admin only)"""
+        serializer = ArtPictureBulkUpdateSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        updates = serializer.validated_data
+        
+        ids = [update['id'] for update in updates]
+        duplicates = sorted(pk for pk, count in Counter(ids).items() if count > 1)
+        if duplicates:
+            return Response(
+                {'error': f'Duplicate ids in request: {duplicates}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            pictures = ArtPicture.objects.select_for_update().in_bulk(ids)
+            missing = [pk for pk in ids if pk not in pictures]
+            if missing:
+                return Response(
+                    {'error': f'Art pictures not found: {missing}'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            
+            # Pictures with no stock can't be sold, whatever the request says
+            sold_out = sorted(
+                update['id'] for update in updates
+                if update.get('is_available') and update.get('stock', pictures[update['id']].stock) == 0
+            )
+            if sold_out:
+                return Response(
+                    {'error': f'Art pictures without stock cannot be made available: {sold_out}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # bulk_update skips auto_now, so stamp updated_at explicitly
+            now = timezone.now()
+            update_fields = {'updated_at'}
+            for update in updates:
+                picture = pictures[update['id']]
+                if 'stock' in update and 'is_available' not in update:
+                    # Same rule as adjust_stock: sold out leaves the catalog, restocked returns to it
+                    if update['stock'] == 0:
+                        update['is_available'] = False
+                    elif picture.stock == 0:
+                        update['is_available'] = True
+                for field, value in update.items():
+                    if field != 'id':
+                        setattr(picture, field, value)
+                        update_fields.add(field)
+                picture.updated_at = now
+            
+            ArtPicture.objects.bulk_update(pictures.values(), sorted(update_fields), batch_size=500)
+            if 'price' in update_fields:
+                Cart.objects.holding(pictures).refresh_summary()
+            transaction.on_commit(bump_generation)
+        
+        return Response({'updated': len(pictures)}, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Catalog cache hit/miss counters (admin/superuser only)"""
+        return Response(get_cache_stats())
+
+def fold_cart_operations(quantities, operations):
+    """Apply validated cart operations in order to a {art_picture_id: quantity} mapping, returning a new one"""
+    quantities = dict(quantities)
+    for op in operations:
+        if op['op'] == 'clear':
+            quantities.clear()
+        elif op['op'] == 'remove':
+            quantities.pop(op['art_picture_id'], None)
+        elif op['op'] == 'add':
+            quantities[op['art_picture_id']] = quantities.get(op['art_picture_id'], 0) + op['quantity']
+        else:
+            quantities[op['art_picture_id']] = op['quantity']
+    return quantities
+
+def unavailable_pictures(operations):
+    """Ids of pictures being added or set by the operations that can't be bought, checked in one query"""
+    wanted = {op['art_picture_id'] for op in operations if op['op'] in ('add', 'set_quantity')}
+    if not wanted:
+        return {}, []
+    prices = dict(ArtPicture.objects.filter(pk__in=wanted, is_available=True).values_list('id', 'price'))
+    return prices, sorted(wanted - prices.keys())
+
+def cart_etag(request, owner, version):
+    """
+    Weak ETag of a cart response. The cart version changes with every line
+    change; the catalog generation covers edits to the nested pictures; the
+    query string covers sparse fieldsets.
+    """
+    key = f'{owner}:{version}:{get_generation()}:{request.get_full_path()}'
+    return 'W/"%s"' % hashlib.sha1(key.encode()).hexdigest()[:20]
+
+def etag_matches(request, etag):
+    """Whether If-None-Match names this ETag (weak comparison)"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag.removeprefix('W/') for candidate in candidates)
+
+def conditional_cart_response(request, etag, render):
+    """304 if the client's copy is current, otherwise the rendered cart, tagged with its ETag"""
+    if etag_matches(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = render()
+    response['ETag'] = etag
+    # Cart contents are per user: cache privately and revalidate every time
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def wants_delta(request):
+    """Cart mutations answer with a compact delta instead of the whole cart when ?delta=1 is passed"""
+    return request.query_params.get('delta') in ('1', 'true')
 
 class CartViewSet(viewsets.ModelViewSet):
     """API endpoint for shopping carts"""
@@ -93,14 +327,66 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).prefetch_related(self.get_items_prefetch())
+    
+    def get_serializer_context(self):
+        """Pass the sparse fieldset for the nested art pictures (?fields= / ?view=)"""
+        context = super().get_serializer_context()
+        context['art_picture_fields'] = get_art_picture_fields(self.request)
+        return context
+    
+    def get_items_queryset(self):
+        """Cart lines with their pictures, narrowed to the requested fieldset"""
+        items = CartItem.objects.select_related('art_picture')
+        fields = get_art_picture_fields(self.request)
+        if fields is not None:
+            # Price is always needed for subtotals and the cart total
+            items = items.only(
+                'id', 'cart', 'art_picture', 'quantity', 'added_at',
+                *get_art_picture_only(fields, prefix='art_picture__', required=('id', 'price'))
+            )
+        return items
+    
+    def get_items_prefetch(self):
+        return Prefetch('cartitem_set', queryset=self.get_items_queryset())
+    
+    def get_cart(self, user):
+        """Get or create the user's cart with its items loaded in constant queries"""
+        cart, created = Cart.objects.get_or_create(user=user)
+        prefetch_related_objects([cart], self.get_items_prefetch())
+        return cart
+    
+    def delta_response(self, cart_id, changed_pictures=(), removed_ids=()):
+        """Compact mutation result: the changed lines, ids of removed lines and the cart's new totals and version"""
+        items = self.get_items_queryset().filter(cart_id=cart_id, art_picture_id__in=list(changed_pictures)) if changed_pictures else []
+        summary = Cart.objects.filter(pk=cart_id).values('item_count', 'total_price', 'version').get()
+        return Response({
+            'items': CartItemSerializer(items, many=True, context=self.get_serializer_context()).data,
+            'removed': list(removed_ids),
+            'item_count': summary['item_count'],
+            'total_price': f"{summary['total_price']:.2f}",
+            'version': summary['version'],
+        })
     
     @action(detail=False, methods=['get'])
     def my_cart(self, request):
-        """Get or create the current user's cart"""
+        """Get or create the current user's cart; 304 when If-None-Match names the current version"""
         cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        
+        def render():
+            prefetch_related_objects([cart], self.get_items_prefetch())
+            return Response(self.get_serializer(cart).data)
+        
+        return conditional_cart_response(request, cart_etag(request, f'user:{cart.pk}', cart.version), render)
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Item count, total and version of the current user's cart in a single-row read"""
+        summary = Cart.objects.filter(user=request.user).values('id', 'item_count', 'total_price', 'version').first()
+        if summary is None:
+            summary = {'id': None, 'item_count': 0, 'total_price': Decimal('0.00'), 'version': 0}
+        summary['total_price'] = f"{summary['total_price']:.2f}"
+        return Response(summary)
     
     @action(detail=False, methods=['post'])
     def add_item(self, request):
@@ -109,6 +395,12 @@ class CartViewSet(viewsets.ModelViewSet):
         art_picture_id = request.data.get('art_picture_id')
         quantity = int(request.data.get('quantity', 1))
         
+        if quantity <= 0:
+            return Response(
+                {'error': 'Quantity must be positive'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
             art_picture = ArtPicture.objects.get(pk=art_picture_id, is_available=True)
         except ArtPicture.DoesNotExist:
@@ -117,17 +409,15 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            art_picture=art_picture,
-            defaults={'quantity': quantity}
-        )
+        with transaction.atomic():
+            CartItem.objects.add_quantity(cart.pk, art_picture.pk, quantity)
+            Cart.objects.filter(pk=cart.pk).refresh_summary()
         
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        if wants_delta(request):
+            return self.delta_response(cart.pk, changed_pictures=[art_picture.pk])
         
-        serializer = CartSerializer(cart)
+        cart = self.get_cart(request.user)
+        serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
@@ -137,8 +427,13 @@ class CartViewSet(viewsets.ModelViewSet):
         item_id = request.data.get('item_id')
         
         try:
-            cart_item = CartItem.objects.get(pk=item_id, cart=cart)
-            cart_item.delete()
+            with transaction.atomic():
+                cart_item = CartItem.objects.get(pk=item_id, cart=cart)
+                removed_id = cart_item.pk
+                cart_item.delete()
+                Cart.objects.filter(pk=cart.pk).refresh_summary()
+            if wants_delta(request):
+                return self.delta_response(cart.pk, removed_ids=[removed_id])
             return Response(
                 {'success': 'Item removed from cart'},
                 status=status.HTTP_200_OK
@@ -163,11 +458,15 @@ class CartViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            cart_item = CartItem.objects.get(pk=item_id, cart=cart)
-            cart_item.quantity = quantity
-            cart_item.save()
+            with transaction.atomic():
+                cart_item = CartItem.objects.select_for_update().select_related('art_picture').get(pk=item_id, cart=cart)
+                cart_item.quantity = quantity
+                cart_item.save()
+                Cart.objects.filter(pk=cart.pk).refresh_summary()
             
-            serializer = CartItemSerializer(cart_item)
+            if wants_delta(request):
+                return self.delta_response(cart.pk, changed_pictures=[cart_item.art_picture_id])
+            serializer = CartItemSerializer(cart_item, context=self.get_serializer_context())
             return Response(serializer.data)
         except CartItem.DoesNotExist:
             return Response(
@@ -175,21 +474,283 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply an ordered list of add/set_quantity/remove/clear operations in one transaction"""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+        
+        # Pictures being added must be available; removals may reference anything
+        prices, unavailable = unavailable_pictures(operations)
+        if unavailable:
+            return Response(
+                {'error': f'Art pictures not found or not available: {unavailable}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        with transaction.atomic():
+            # The cart lock queues this behind add_item and a guest cart merge adding the same lines
+            cart, created = Cart.objects.select_for_update().get_or_create(user=request.user)
+            lines = {item.art_picture_id: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+            
+            before = {pk: item.quantity for pk, item in lines.items()}
+            after = fold_cart_operations(before, operations)
+            
+            removed = [pk for pk in before if pk not in after]
+            created_items = [
+                CartItem(cart=cart, art_picture_id=pk, quantity=quantity)
+                for pk, quantity in after.items() if pk not in before
+            ]
+            changed = []
+            for pk, quantity in after.items():
+                if pk in before and before[pk] != quantity:
+                    lines[pk].quantity = quantity
+                    changed.append(lines[pk])
+            
+            if removed:
+                CartItem.objects.filter(cart=cart, art_picture_id__in=removed).delete()
+            if created_items:
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.bulk_create(created_items)
+                except IntegrityError:
+                    # A concurrent add_item inserted one of these lines after we read the cart
+                    transaction.set_rollback(True)
+                    return Response(
+                        {'error': 'Cart was modified concurrently, please retry'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+            if changed:
+                CartItem.objects.bulk_update(changed, ['quantity'])
+            
+            if removed or created_items or changed:
+                Cart.objects.filter(pk=cart.pk).refresh_summary()
+        
+        if wants_delta(request):
+            return self.delta_response(
+                cart.pk,
+                changed_pictures=[pk for pk, quantity in after.items() if before.get(pk) != quantity],
+                removed_ids=[lines[pk].pk for pk in removed],
+            )
+        
+        cart = self.get_cart(request.user)
+        serializer = self.get_serializer(cart)
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['post'])
     def clear(self, request):
         """Clear all items from the cart"""
         cart = get_object_or_404(Cart, user=request.user)
-        CartItem.objects.filter(cart=cart).delete()
+        with transaction.atomic():
+            items = CartItem.objects.filter(cart=cart)
+            removed_ids = list(items.values_list('id', flat=True)) if wants_delta(request) else []
+            items.delete()
+            Cart.objects.reset_summary(cart.pk)
+        if wants_delta(request):
+            return self.delta_response(cart.pk, removed_ids=removed_ids)
         return Response(
             {'success': 'Cart cleared'},
             status=status.HTTP_200_OK
         )
 
+class GuestCartViewSet(viewsets.ViewSet):
+    """
+    Carts of anonymous visitors, kept in the cache under a signed cookie.
+    
+    Mirrors the CartViewSet actions without writing to the database; line ids
+    are picture ids. The cart is merged into the user's Cart on login.
+    """
+    permission_classes = [AllowAny]
+    
+    def get_serializer_context(self):
+        return {
+            'request': self.request,
+            'view': self,
+            'art_picture_fields': get_art_picture_fields(self.request),
+        }
+    
+    def get_pictures(self, ids):
+        """Load the pictures of a guest cart in one query, narrowed to the requested fieldset"""
+        pictures = ArtPicture.objects.all()
+        fields = get_art_picture_fields(self.request)
+        if fields is not None:
+            pictures = pictures.only(*get_art_picture_only(fields, required=('id', 'price')))
+        return pictures.in_bulk(list(ids))
+    
+    def build_lines(self, lines):
+        pictures = self.get_pictures(lines)
+        return [
+            {'art_picture': pictures[pk], 'quantity': quantity, 'subtotal': pictures[pk].price * quantity}
+            for pk, quantity in lines.items() if pk in pictures
+        ]
+    
+    def render_cart(self, before, lines, version):
+        items = self.build_lines(lines)
+        cart = {
+            'items': items,
+            'item_count': sum(item['quantity'] for item in items),
+            'total_price': sum((item['subtotal'] for item in items), Decimal('0.00')),
+            'version': version,
+        }
+        return Response(GuestCartSerializer(cart, context=self.get_serializer_context()).data)
+    
+    def render_delta(self, before, lines, version):
+        """Compact mutation result, shaped like CartViewSet.delta_response"""
+        items = self.build_lines(lines)
+        changed = [item for item in items if before.get(item['art_picture'].pk) != item['quantity']]
+        return Response({
+            'items': GuestCartItemSerializer(changed, many=True, context=self.get_serializer_context()).data,
+            'removed': [pk for pk in before if pk not in lines],
+            'item_count': sum(item['quantity'] for item in items),
+            'total_price': f"{sum((item['subtotal'] for item in items), Decimal('0.00')):.2f}",
+            'version': version,
+        })
+    
+    def save_operations(self, request, operations, render):
+        """Validate and apply operations to the visitor's cart, starting one (and its cookie) on the first change"""
+        serializer = CartOperationSerializer(data=operations, many=True)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+        
+        prices, unavailable = unavailable_pictures(operations)
+        if unavailable:
+            return Response(
+                {'error': f'Art pictures not found or not available: {unavailable}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if wants_delta(request):
+            render = self.render_delta
+        
+        guest_id = get_guest_id(request)
+        lines, version = load_guest_cart(guest_id)
+        updated = fold_cart_operations(lines, operations)
+        if updated == lines:
+            return render(lines, lines, version)
+        
+        guest_id = guest_id or new_guest_id()
+        version += 1
+        save_guest_cart(guest_id, updated, version)
+        response = render(lines, updated, version)
+        set_guest_cookie(response, guest_id)
+        return response
+    
+    def get_line_id(self, request):
+        """The picture id of an existing guest cart line named by item_id, or None"""
+        lines, version = load_guest_cart(get_guest_id(request))
+        try:
+            item_id = int(request.data.get('item_id'))
+        except (TypeError, ValueError):
+            return None
+        return item_id if item_id in lines else None
+    
+    @action(detail=False, methods=['get'])
+    def my_cart(self, request):
+        """Get the visitor's guest cart (empty if they have none); 304 when If-None-Match is current"""
+        guest_id = get_guest_id(request)
+        lines, version = load_guest_cart(guest_id)
+        return conditional_cart_response(
+            request, cart_etag(request, f'guest:{guest_id}', version), lambda: self.render_cart(lines, lines, version)
+        )
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Item count, total and version of the visitor's guest cart"""
+        lines, version = load_guest_cart(get_guest_id(request))
+        prices = dict(ArtPicture.objects.filter(pk__in=list(lines)).values_list('id', 'price')) if lines else {}
+        total = sum((prices[pk] * quantity for pk, quantity in lines.items() if pk in prices), Decimal('0.00'))
+        return Response({
+            'id': None,
+            'item_count': sum(quantity for pk, quantity in lines.items() if pk in prices),
+            'total_price': f"{total:.2f}",
+            'version': version,
+        })
+    
+    @action(detail=False, methods=['post'])
+    def add_item(self, request):
+        """Add an item to the guest cart"""
+        operation = {
+            'op': 'add',
+            'art_picture_id': request.data.get('art_picture_id'),
+            'quantity': request.data.get('quantity', 1),
+        }
+        return self.save_operations(request, [operation], self.render_cart)
+    
+    @action(detail=False, methods=['post'])
+    def remove_item(self, request):
+        """Remove an item from the guest cart"""
+        line_id = self.get_line_id(request)
+        if line_id is None:
+            return Response(
+                {'error': 'Item not found in cart'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self.save_operations(
+            request, [{'op': 'remove', 'art_picture_id': line_id}],
+            lambda before, lines, version: Response({'success': 'Item removed from cart'}, status=status.HTTP_200_OK)
+        )
+    
+    @action(detail=False, methods=['post'])
+    def update_item_quantity(self, request):
+        """Update the quantity of an item in the guest cart"""
+        line_id = self.get_line_id(request)
+        if line_id is None:
+            return Response(
+                {'error': 'Item not found in cart'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        operation = {'op': 'set_quantity', 'art_picture_id': line_id, 'quantity': request.data.get('quantity', 1)}
+        
+        def render_line(before, lines, version):
+            line = self.build_lines({line_id: lines[line_id]})
+            if not line:
+                return Response({'error': 'Item not found in cart'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(GuestCartItemSerializer(line[0], context=self.get_serializer_context()).data)
+        
+        return self.save_operations(request, [operation], render_line)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply an ordered list of add/set_quantity/remove/clear operations to the guest cart"""
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.save_operations(request, serializer.validated_data['operations'], self.render_cart)
+    
+    @action(detail=False, methods=['post'])
+    def clear(self, request):
+        """Clear all items from the guest cart"""
+        return self.save_operations(
+            request, [{'op': 'clear'}],
+            lambda before, lines, version: Response({'success': 'Cart cleared'}, status=status.HTTP_200_OK)
+        )
+
+class GuestCartTokenObtainPairView(TokenObtainPairView):
+    """JWT login that merges the visitor's guest cart into their cart"""
+    
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        
+        response = Response(serializer.validated_data, status=status.HTTP_200_OK)
+        guest_id = get_guest_id(request)
+        if guest_id is not None:
+            merge_guest_cart(serializer.user, guest_id)
+            clear_guest_cookie(response)
+        return response
+
+# Upper bound on orders moved by one bulk_transition request
+MAX_BULK_TRANSITION = 1000
+
 class OrderViewSet(viewsets.ModelViewSet):
     """API endpoint for orders"""
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
     
     def get_permissions(self):
         """Set permissions based on action"""
@@ -198,97 +759,162 @@ class OrderViewSet(viewsets.ModelViewSet):
             return [IsAdminUser()]
         return [IsAuthenticated()]
     
-    def get_queryset(self):
+    def get_orders(self):
         """Admins/superusers can see all orders, users can only see their own"""
         if self.request.user.is_staff or self.request.user.is_superuser:
-            return Order.objects.all().order_by('-created_at')
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+            return Order.objects.all()
+        return Order.objects.filter(user=self.request.user)
+    
+    def get_queryset(self):
+        # Everything the serializer reads is joined or prefetched: a page costs two queries
+        return (
+            self.get_orders()
+            .select_related('user', 'shipping_address_obj', 'billing_address_obj')
+            .prefetch_related(self.get_items_prefetch())
+            .order_by('-created_at', '-id')
+        )
+    
+    def get_art_picture_fields(self):
+        """Sparse fieldset for the nested pictures; order lists default to a compact summary"""
+        fields = get_art_picture_fields(self.request)
+        if fields is None and self.action == 'list':
+            fields = ART_PICTURE_VIEWS['summary']
+        return fields
+    
+    def get_serializer_context(self):
+        """Pass the sparse fieldset for the nested art pictures (?fields= / ?view=)"""
+        context = super().get_serializer_context()
+        context['art_picture_fields'] = self.get_art_picture_fields()
+        return context
+    
+    def get_items_prefetch(self):
+        """Prefetch order lines with their pictures, narrowed to the requested fieldset"""
+        items = OrderItem.objects.select_related('art_picture')
+        fields = self.get_art_picture_fields()
+        if fields is not None:
+            items = items.only(
+                'id', 'order', 'art_picture', 'price', 'quantity',
+                *get_art_picture_only(fields, prefix='art_picture__', required=('id',))
+            )
+        return Prefetch('orderitem_set', queryset=items)
+    
+    def get_order_address(self, user, data, kind):
+        """The address for one side of an order: a saved one by id, or the given fields, deduplicated"""
+        address_id = data.get(f'{kind}_address_id')
+        if address_id is not None:
+            return Address.objects.get(pk=address_id, user=user)
+        return Address.objects.for_user(user, data[f'{kind}_address_data'])
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Order count, revenue and count per status, aggregated by the database"""
+        orders = self.get_orders()
+        totals = orders.aggregate(count=Count('id'), revenue=Coalesce(Sum('total_price'), Value(Decimal('0.00'))))
+        by_status = dict(orders.order_by().values_list('status').annotate(count=Count('id')))
+        return Response({
+            'count': totals['count'],
+            'revenue': f"{totals['revenue']:.2f}",
+            'by_status': {value: by_status.get(value, 0) for value, label in Order.STATUS_CHOICES},
+        })
     
     @action(detail=False, methods=['post'])
+    @idempotent('orders.checkout')
     def checkout(self, request):
-        """Handle checkout process - create order and prepare for payment"""
+        """
+        Turn the user's cart into a pending order in one transaction.
+        
+        The cart row and the pictures in it are locked, so buyers racing for
+        the last copies of a picture serialize here and can't oversell it. The
+        ordered stock is held by reservations until the order is paid or the
+        hold expires (see release_expired_reservations). The query count does
+        not depend on cart size.
+        """
         data = request.data
         user = request.user
         
-        # Create addresses first
-        shipping_address_data = data.get('shipping_address_data')
-        billing_address_data = data.get('billing_address_data')
         same_as_shipping = data.get('same_as_shipping', False)
+        kinds = ['shipping'] if same_as_shipping else ['shipping', 'billing']
         
-        if same_as_shipping:
-            billing_address_data = shipping_address_data
-        
-        shipping_address = None
-        billing_address = None
-        
-        try:
-            # Create shipping address
-            shipping_address = Address.objects.create(
-                street=shipping_address_data.get('street', ''),
-                city=shipping_address_data.get('city', ''),
-                state=shipping_address_data.get('state', ''),
-                zipcode=shipping_address_data.get('zipcode', ''),
-                country=shipping_address_data.get('country', 'United States')
+        # Either a saved address (<kind>_address_id) or its fields (<kind>_address_data)
+        if not all(
+            data.get(f'{kind}_address_id') is not None or isinstance(data.get(f'{kind}_address_data'), dict)
+            for kind in kinds
+        ):
+            return Response(
+                {'error': 'Shipping and billing addresses are required'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        with transaction.atomic():
+            cart, created = Cart.objects.select_for_update().get_or_create(user=user)
+            lines = list(CartItem.objects.filter(cart=cart).values_list('art_picture_id', 'quantity'))
+            if not lines:
+                return Response(
+                    {'error': 'Your cart is empty'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
-            # For backwards compatibility, also create a flat address string
-            shipping_address_str = f"{shipping_address_data.get('street', '')}, {shipping_address_data.get('city', '')}, {shipping_address_data.get('state', '')} {shipping_address_data.get('zipcode', '')}, {shipping_address_data.get('country', 'United States')}"
+            # Lock in primary key order so concurrent checkouts can't deadlock
+            pictures = {
+                picture.pk: picture
+                for picture in ArtPicture.objects.select_for_update()
+                .filter(pk__in=[pk for pk, quantity in lines])
+                .only('id', 'price', 'is_available', 'stock')
+                .order_by('pk')
+            }
+            unavailable = sorted(
+                pk for pk, quantity in lines
+                if not pictures[pk].is_available or pictures[pk].stock < quantity
+            )
+            if unavailable:
+                return Response(
+                    {'error': 'Some art pictures in your cart are no longer available', 'art_picture_ids': unavailable},
+                    status=status.HTTP_409_CONFLICT
+                )
             
-            # Create billing address if not same as shipping
-            if not same_as_shipping:
-                billing_address = Address.objects.create(
-                    street=billing_address_data.get('street', ''),
-                    city=billing_address_data.get('city', ''),
-                    state=billing_address_data.get('state', ''),
-                    zipcode=billing_address_data.get('zipcode', ''),
-                    country=billing_address_data.get('country', 'United States')
+            try:
+                shipping_address = self.get_order_address(user, data, 'shipping')
+                billing_address = shipping_address if same_as_shipping else self.get_order_address(user, data, 'billing')
+            except (Address.DoesNotExist, ValueError, TypeError):
+                return Response(
+                    {'error': 'Address not found in your address book'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                # For backwards compatibility, also create a flat address string
-                billing_address_str = f"{billing_address_data.get('street', '')}, {billing_address_data.get('city', '')}, {billing_address_data.get('state', '')} {billing_address_data.get('zipcode', '')}, {billing_address_data.get('country', 'United States')}"
-            else:
-                billing_address = shipping_address
-                billing_address_str = shipping_address_str
-                
-            # Get or create user's cart
-            cart, created = Cart.objects.get_or_create(user=user)
             
-            # Create order
+            # Priced from the locked rows, so the total always matches the order lines
             order = Order.objects.create(
                 user=user,
-                shipping_address=shipping_address_str,
-                billing_address=billing_address_str,
+                # Flat address strings kept for backwards compatibility
+                shipping_address=shipping_address.full_address,
+                billing_address=billing_address.full_address,
                 shipping_address_obj=shipping_address,
                 billing_address_obj=billing_address,
                 payment_method=data.get('payment_method', 'credit_card'),
                 status='pending',
-                total_price=cart.total_price
+                total_price=sum((pictures[pk].price * quantity for pk, quantity in lines), Decimal('0.00'))
             )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, art_picture_id=pk, price=pictures[pk].price, quantity=quantity)
+                for pk, quantity in lines
+            ])
             
-            # Add cart items to the order
-            for cart_item in cart.cartitem_set.all():
-                OrderItem.objects.create(
-                    order=order,
-                    art_picture=cart_item.art_picture,
-                    price=cart_item.art_picture.price,
-                    quantity=cart_item.quantity
-                )
-            
-            # Clear the cart after creating order
-            cart.cartitem_set.all().delete()
+            # Hold the stock for this order; sold out pictures leave the catalog
+            ArtPicture.objects.adjust_stock({pk: -quantity for pk, quantity in lines})
+            expires_at = timezone.now() + reservation_ttl()
+            Reservation.objects.bulk_create([
+                Reservation(order=order, art_picture_id=pk, quantity=quantity, expires_at=expires_at)
+                for pk, quantity in lines
+            ])
+            transaction.on_commit(bump_generation)
             
-            serializer = self.get_serializer(order)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-            
-        except Exception as e:
-            # Clean up any created objects if the order creation fails
-            if shipping_address:
-                shipping_address.delete()
-            if billing_address and billing_address != shipping_address:
-                billing_address.delete()
-            
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            CartItem.objects.filter(cart=cart).delete()
+            Cart.objects.reset_summary(cart.pk)
+        
+        prefetch_related_objects([order], self.get_items_prefetch())
+        serializer = self.get_serializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @idempotent('orders.create')
     def create(self, request, *args, **kwargs):
         data = request.data
         user = request.user
@@ -300,6 +926,11 @@ class OrderViewSet(viewsets.ModelViewSet):
             except User.DoesNotExist:
                 return Response({'error': 'Specified user not found'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # Only admins restoring an order may choose its status
+        order_status = data.get('status', 'pending') if (request.user.is_staff or request.user.is_superuser) else 'pending'
+        if order_status not in ORDER_TRANSITIONS:
+            return Response({'error': f'Invalid status "{order_status}"'}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Create addresses first
         shipping_address_data = data.get('shipping_address_data')
         billing_address_data = data.get('billing_address_data')
@@ -308,33 +939,19 @@ class OrderViewSet(viewsets.ModelViewSet):
         billing_address = None
         
         if shipping_address_data and isinstance(shipping_address_data, dict):
-            shipping_address = Address.objects.create(
-                street=shipping_address_data.get('street', ''),
-                city=shipping_address_data.get('city', ''),
-                state=shipping_address_data.get('state', ''),
-                zipcode=shipping_address_data.get('zipcode', ''),
-                country=shipping_address_data.get('country', 'United States'),
-                user=user
-            )
+            shipping_address = Address.objects.for_user(user, shipping_address_data)
             
             # For backwards compatibility, also create a flat address string
-            shipping_address_str = f"{shipping_address_data.get('street', '')}, {shipping_address_data.get('city', '')}, {shipping_address_data.get('state', '')} {shipping_address_data.get('zipcode', '')}, {shipping_address_data.get('country', 'United States')}"
+            shipping_address_str = shipping_address.full_address
         else:
             # Legacy format - just a string
             shipping_address_str = data.get('shipping_address', '')
         
         if billing_address_data and isinstance(billing_address_data, dict):
-            billing_address = Address.objects.create(
-                street=billing_address_data.get('street', ''),
-                city=billing_address_data.get('city', ''),
-                state=billing_address_data.get('state', ''),
-                zipcode=billing_address_data.get('zipcode', ''),
-                country=billing_address_data.get('country', 'United States'),
-                user=user
-            )
+            billing_address = Address.objects.for_user(user, billing_address_data)
             
             # For backwards compatibility, also create a flat address string
-            billing_address_str = f"{billing_address_data.get('street', '')}, {billing_address_data.get('city', '')}, {billing_address_data.get('state', '')} {billing_address_data.get('zipcode', '')}, {billing_address_data.get('country', 'United States')}"
+            billing_address_str = billing_address.full_address
         else:
             # Legacy format - just a string
             billing_address_str = data.get('billing_address', '')
@@ -350,7 +967,7 @@ class OrderViewSet(viewsets.ModelViewSet):
                 payment_method=data.get('payment_method', 'credit_card'),
                 payment_id=data.get('payment_id', ''),
                 total_price=data.get('total_price', 0),
-                status=data.get('status', 'pending')
+                status=order_status
             )
             
             # Add items to the order
@@ -374,14 +991,154 @@ class OrderViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(order)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Exception as e:
-            # If any addresses were created, delete them since order creation failed
-            if shipping_address:
-                shipping_address.delete()
-            if billing_address:
-                billing_address.delete()
+            # Addresses stay in the user's address book; other orders may share them
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
+    def update(self, request, *args, **kwargs):
+        """Admin edits; a status change is applied through the transition table"""
+        new_status = request.data.get('status')
+        if new_status is None:
+            return super().update(request, *args, **kwargs)
+        
+        order = self.get_object()
+        if new_status != order.status:
+            if new_status not in ORDER_TRANSITIONS:
+                return Response({'error': f'Invalid status "{new_status}"'}, status=status.HTTP_400_BAD_REQUEST)
+            if not order.transition(new_status, changed_by=request.user, note=request.data.get('status_note', '')):
+                current = Order.objects.values_list('status', flat=True).get(pk=order.pk)
+                return Response(
+                    {'error': f'Cannot move this order from {current} to {new_status}', 'status': current},
+                    status=status.HTTP_409_CONFLICT
+                )
+        
+        if set(request.data) - {'status', 'status_note'}:
+            return super().update(request, *args, **kwargs)
+        prefetch_related_objects([order], self.get_items_prefetch())
+        return Response(self.get_serializer(order).data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        """
+        Move many orders to a new status in one go (admin/superuser only).
+        
+        Orders whose current status doesn't allow the move are reported back
+        unchanged; each moved order gets a status history entry.
+        """
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {'error': 'Only administrators/superusers can change order status'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        new_status = request.data.get('status')
+        order_ids = request.data.get('order_ids')
+        if new_status not in ORDER_TRANSITIONS:
+            return Response({'error': f'Invalid status "{new_status}"'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(order_ids, list) or not order_ids:
+            return Response({'error': 'order_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(order_ids) > MAX_BULK_TRANSITION:
+            return Response(
+                {'error': f'At most {MAX_BULK_TRANSITION} orders can be changed at once'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            order_ids = {int(pk) for pk in order_ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'order_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        moved = Order.objects.filter(pk__in=order_ids).transition(
+            new_status, changed_by=request.user, note=request.data.get('status_note', '')
+        )
+        skipped = dict(
+            Order.objects.filter(pk__in=order_ids - set(moved)).values_list('id', 'status')
+        )
+        return Response({
+            'status': new_status,
+            'moved': sorted(moved),
+            'skipped': [{'id': pk, 'status': skipped[pk]} for pk in sorted(skipped)],
+            'not_found': sorted(order_ids - set(moved) - set(skipped)),
+        })
+    
+    @action(detail=True, methods=['get'])
+    def receipt(self, request, pk=None):
+        """
+        The order's printable receipt (HTML), rendered in the background when
+        the order was paid. Supports If-None-Match; ?download=1 serves it as an
+        attachment.
+        """
+        order = get_object_or_404(self.get_orders().only('id', 'order_number', 'status', 'paid_at', 'receipt'), pk=pk)
+        if not has_receipt(order):
+            return Response(
+                {'error': 'The receipt is available once the order is paid'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        stored = order.receipt or {}
+        content = None
+        if stored.get('status') == order.status:
+            etag = receipt_etag(stored['html'])
+            if etag_matches(request, etag):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+            content = read_receipt(stored['html'])
+        if content is None:
+            # Not rendered yet (restored order, or the render is still queued): render it now
+            name = build_receipt(order.pk)
+            if name is None:
+                # Moved back out of a receipt status while we looked
+                return Response(
+                    {'error': 'The receipt is available once the order is paid'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            etag = receipt_etag(name)
+            content = read_receipt(name)
+        
+        response = HttpResponse(content, content_type='text/html; charset=utf-8')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        if request.query_params.get('download') in ('1', 'true'):
+            response['Content-Disposition'] = f'attachment; filename="receipt-{order.order_number}.html"'
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Status changes of an order, oldest first"""
+        order = self.get_object()
+        changes = order.status_history.select_related('changed_by').order_by('created_at', 'id')
+        return Response(OrderStatusChangeSerializer(changes, many=True).data)
+    
+    def complete_payment(self, order, message, refund=None):
+        """
+        Mark a charged order paid. If it was cancelled or paid while the payment
+        ran, the payment is kept on the order and refunded with `refund()`, which
+        returns the refund id (None if nothing was actually charged). Without a
+        refund, or if it fails, the order is flagged for reconciliation.
+        """
+        if order.mark_as_paid(changed_by=self.request.user):
+            return Response({'success': message}, status=status.HTTP_200_OK)
+        
+        if refund is None:
+            outcome = {'refund_status': 'failed', 'error': 'No automatic refund for this payment method'}
+        else:
+            try:
+                refund_id = refund()
+                outcome = {'refund_status': 'refunded' if refund_id else 'not_charged', 'refund_id': refund_id}
+            except Exception as e:
+                print(f"Refund of payment {order.payment_id} for order {order.pk} failed: {str(e)}")
+                outcome = {'refund_status': 'failed', 'error': str(e)}
+        entry = order.record_unapplied_payment(**outcome)
+        
+        return Response(
+            {
+                'error': 'This order was changed while the payment was being processed',
+                'refund_status': entry['refund_status'],
+            },
+            status=status.HTTP_409_CONFLICT
+        )
+    
     @action(detail=True, methods=['post'])
+    @idempotent('orders.process_payment')
     def process_payment(self, request, pk=None):
         """Process payment for an order"""
         order = self.get_object()
@@ -401,23 +1158,30 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if not Reservation.objects.hold_for_payment(order):
+            return Response(
+                {'error': 'The reservation for this order has expired, please check out again'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
         try:
             if payment_method == 'credit_card':
                 # Process with Stripe
+                idempotency_key = get_idempotency_key(request)
                 charge = stripe.Charge.create(
                     amount=int(order.total_price * 100),  # Convert to cents
                     currency='usd',
                     description=f'Order {order.order_number}',
-                    source=token
+                    source=token,
+                    # Stripe keys are account-wide, so scope the client's key to this order
+                    idempotency_key=f'order-{order.pk}-{idempotency_key}' if idempotency_key else None
                 )
                 
                 # Save payment information
                 order.payment_id = charge.id
-                order.mark_as_paid()
-                
-                return Response(
-                    {'success': 'Payment processed successfully'},
-                    status=status.HTTP_200_OK
+                return self.complete_payment(
+                    order, 'Payment processed successfully',
+                    refund=lambda: stripe.Refund.create(charge=charge.id, idempotency_key=f'refund-{charge.id}').id,
                 )
             
             elif payment_method == 'paypal':
@@ -439,95 +1203,69 @@ class OrderViewSet(viewsets.ModelViewSet):
                         'simulated': True,
                         'verification_skipped': True
                     }
-                    order.mark_as_paid()
-                    
-                    return Response(
-                        {'success': 'PayPal payment simulated successfully'},
-                        status=status.HTTP_200_OK
-                    )
+                    # Nothing was charged, so there is nothing to refund
+                    return self.complete_payment(order, 'PayPal payment simulated successfully', refund=lambda: None)
                 
                 # Real PayPal API integration for non-simulation mode
+                refund = None
                 try:
-                    import requests
-                    
-                    # Get PayPal credentials from settings
-                    paypal_client_id = getattr(settings, 'PAYPAL_CLIENT_ID', 'sb')
-                    paypal_client_secret = getattr(settings, 'PAYPAL_CLIENT_SECRET', '')
-                    paypal_sandbox = getattr(settings, 'PAYPAL_SANDBOX', True)
-                    paypal_base_url = 'https://api-m.sandbox.paypal.com' if paypal_sandbox else 'https://api-m.paypal.com'
-                    
-                    # If client secret is provided, verify the payment with PayPal
-                    if paypal_client_secret:
-                        # Get access token from PayPal
-                        auth_response = requests.post(
-                            f'{paypal_base_url}/v1/oauth2/token',
-                            auth=(paypal_client_id, paypal_client_secret),
-                            data={'grant_type': 'client_credentials'},
-                            headers={
-                                'Accept': 'application/json',
-                                'Accept-Language': 'en_US'
-                            }
-                        )
-                        
-                        if auth_response.status_code != 200:
-                            print(f"PayPal auth error: {auth_response.text}")
-                            raise Exception("Failed to authenticate with PayPal")
-                            
-                        access_token = auth_response.json().get('access_token')
-                        
-                        # Verify the order with PayPal
+                    # Without a client secret (sandbox testing) payments are accepted unverified
+                    if getattr(settings, 'PAYPAL_CLIENT_SECRET', ''):
                         order_id = paypal_details.get('orderID')
                         if not order_id:
-                            raise Exception("PayPal order ID not provided")
-                            
-                        order_response = requests.get(
-                            f'{paypal_base_url}/v2/checkout/orders/{order_id}',
-                            headers={
-                                'Content-Type': 'application/json',
-                                'Authorization': f'Bearer {access_token}'
-                            }
-                        )
-                        
-                        if order_response.status_code != 200:
-                            print(f"PayPal order verification error: {order_response.text}")
-                            raise Exception("Failed to verify PayPal order")
-                            
-                        payment_data = order_response.json()
-                        print(f"Received PayPal verification: {payment_data}")
-                        
+                            return Response(
+                                {'error': 'PayPal order ID not provided'},
+                                status=status.HTTP_400_BAD_REQUEST
+                            )
+
+                        payment_data = get_paypal_client().get_order(order_id)
+
                         # Check if payment was successful - for sandbox we'll accept APPROVED too
                         if payment_data.get('status') not in ['COMPLETED', 'APPROVED']:
                             return Response(
                                 {'error': f"PayPal payment verification failed: {payment_data.get('status')}"},
                                 status=status.HTTP_400_BAD_REQUEST
                             )
-                    else:
-                        # For sandbox testing without client secret, we'll accept all payments
-                        print(f"Sandbox mode without client secret: Accepting PayPal payment without verification")
-                    
-                    # Record payment details
-                    order.payment_id = f"paypal_{token}"
-                    order.payment_details = paypal_details
-                    order.mark_as_paid()
-                    
-                    return Response(
-                        {'success': 'PayPal payment processed successfully'},
-                        status=status.HTTP_200_OK
-                    )
-                    
-                except Exception as e:
+                        
+                        captures = completed_capture_ids(payment_data)
+                        refund = lambda: ','.join(get_paypal_client().refund_capture(capture) for capture in captures) or None
+                except PayPalError as e:
                     print(f"PayPal payment error: {str(e)}")
+                    # PayPal rejecting the order is final; PayPal being unavailable (502) lets a retry run
+                    if not e.transient:
+                        return Response(
+                            {'error': f"PayPal payment error: {str(e)}"},
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
                     return Response(
-                        {'error': f"PayPal payment error: {str(e)}"},
-                        status=status.HTTP_400_BAD_REQUEST
+                        {'error': 'PayPal is unavailable, please try again'},
+                        status=status.HTTP_502_BAD_GATEWAY
                     )
-            
+
+                # Record payment details
+                order.payment_id = f"paypal_{token}"
+                order.payment_details = paypal_details
+                return self.complete_payment(order, 'PayPal payment processed successfully', refund=refund)
+
             else:
                 return Response(
                     {'error': 'Invalid payment method'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-                
+        
+        # Transient Stripe failures are 5xx so the Idempotency-Key is released and a retry
+        # runs again; the retry reuses the Stripe idempotency key, so the card is charged once
+        except (stripe.error.APIConnectionError, stripe.error.APIError) as e:
+            print(f"Stripe error: {str(e)}")
+            return Response(
+                {'error': 'The payment provider could not be reached, please try again'},
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+        except stripe.error.RateLimitError:
+            return Response(
+                {'error': 'The payment provider is busy, please try again'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             return Response(
                 {'error': str(e)},
@@ -535,6 +1273,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=False, methods=['post'])
+    @idempotent('orders.restore_order')
     def restore_order(self, request):
         """Restore a deleted order (admin/superuser only)"""
         if not (request.user.is_staff or request.user.is_superuser):
@@ -543,8 +1282,66 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Use the same create logic but with explicit restoration context
-        return self.create(request)
+        row = request.data
+        if isinstance(row, dict) and row.get('user') in (None, ''):
+            # Orders restored without an owner go to the requesting admin, as they always have
+            row = dict(row.items(), user=request.user.pk)
+        report = restore_orders([(1, row)])
+        if report.errors:
+            return Response({'error': report.errors[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+        order = self.get_queryset().get(pk=report.restored[0]['id'])
+        return Response(self.get_serializer(order).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], parser_classes=[NDJSONParser, JSONParser])
+    def bulk_restore(self, request):
+        """
+        Restore many orders from an NDJSON stream (or a JSON array), one order
+        per line in the restore_order format (admin/superuser only).
+        
+        Rows are written in chunked bulk inserts; the response reports the
+        restored orders and the error for each rejected line.
+        """
+        if not (request.user.is_staff or request.user.is_superuser):
+            return Response(
+                {'error': 'Only administrators/superusers can restore orders'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        rows = request.data
+        if isinstance(rows, list):
+            rows = enumerate(rows, start=1)
+        elif isinstance(rows, dict):
+            return Response(
+                {'error': 'Send one order per line (application/x-ndjson) or a JSON array of orders'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        report = restore_orders(rows)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+class AddressViewSet(viewsets.ModelViewSet):
+    """API endpoint for the user's address book"""
+    serializer_class = AddressSerializer
+    permission_classes = [IsAuthenticated]
+    # Orders point at saved addresses, so they are added and removed but never edited
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+    
+    def get_queryset(self):
+        return Address.objects.filter(user=self.request.user, is_archived=False).order_by('-created_at', '-id')
+    
+    def create(self, request, *args, **kwargs):
+        """Save an address; one the user already has is returned instead of duplicated"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        address = Address.objects.for_user(request.user, serializer.validated_data)
+        if address.is_archived:
+            address.is_archived = False
+            address.save(update_fields=['is_archived'])
+        return Response(self.get_serializer(address).data, status=status.HTTP_201_CREATED)
+    
+    def perform_destroy(self, instance):
+        # Past orders keep the address; it just leaves the address book
+        instance.is_archived = True
+        instance.save(update_fields=['is_archived'])
 
 class MessageViewSet(viewsets.ModelViewSet):
     """API endpoint for messages"""
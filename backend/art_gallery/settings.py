@@ -77,6 +77,51 @@ DATABASES = {
     }
 }
 
+# Caches
+# Catalog responses go to their own cache so they can live on a shared backend
+# (redis/memcached) in production while staying in-process during development.
+# Invalidation works with any backend: the catalog generation lives in the
+# database, so bumps from other workers and management commands reach every process.
+CATALOG_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'locmem')
+CATALOG_CACHE_LOCATION = os.environ.get('CATALOG_CACHE_LOCATION') or (
+    os.path.join(BASE_DIR, 'cache', 'catalog') if CATALOG_CACHE_BACKEND == 'file' else 'catalog'
+)
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', '300'))  # seconds
+CATALOG_CACHE_ALIAS = 'catalog'
+
+# Guest (anonymous) carts live only in the cache, keyed by a signed cookie.
+# Use a shared, persistent backend (redis) in production so carts survive
+# worker restarts and are visible to every worker.
+GUEST_CART_CACHE_BACKEND = os.environ.get('GUEST_CART_CACHE_BACKEND', 'locmem')
+GUEST_CART_CACHE_LOCATION = os.environ.get('GUEST_CART_CACHE_LOCATION') or (
+    os.path.join(BASE_DIR, 'cache', 'guest_carts') if GUEST_CART_CACHE_BACKEND == 'file' else 'guest_carts'
+)
+GUEST_CART_TTL = int(os.environ.get('GUEST_CART_TTL', str(7 * 24 * 3600)))  # seconds since last change
+GUEST_CART_CACHE_ALIAS = 'guest_carts'
+GUEST_CART_COOKIE_NAME = 'guest_cart'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    CATALOG_CACHE_ALIAS: {
+        'BACKEND': CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+        'LOCATION': CATALOG_CACHE_LOCATION,
+        'TIMEOUT': CATALOG_CACHE_TIMEOUT,
+    },
+    GUEST_CART_CACHE_ALIAS: {
+        'BACKEND': CATALOG_CACHE_BACKENDS[GUEST_CART_CACHE_BACKEND],
+        'LOCATION': GUEST_CART_CACHE_LOCATION,
+        'TIMEOUT': GUEST_CART_TTL,
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -116,6 +161,29 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'art_gallery/media')
 # Add to URLs to serve media files during development
 MEDIA_SERVING = True
 
+# Store uploads under the SHA-256 of their content so URLs can be cached forever
+STORAGES = {
+    'default': {
+        'BACKEND': 'art_gallery.api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Let the front proxy stream media instead of a WSGI worker. Set one of:
+# MEDIA_ACCEL_REDIRECT_PREFIX - nginx internal location mapped to MEDIA_ROOT (e.g. /protected-media/)
+# MEDIA_SENDFILE - True to emit X-Sendfile headers (Apache mod_xsendfile, lighttpd)
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', 'False') == 'True'
+
+# Worker processes rendering thumbnails/responsive sizes of uploaded images
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', '2'))
+
+# Rendered order receipts; kept outside MEDIA_ROOT since they hold customer addresses
+RECEIPT_ROOT = os.environ.get('RECEIPT_ROOT', os.path.join(BASE_DIR, 'art_gallery/receipts'))
+RECEIPT_WORKERS = int(os.environ.get('RECEIPT_WORKERS', '2'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -157,6 +225,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -166,10 +235,24 @@ CORS_ALLOW_HEADERS = [
 # Stripe API key
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', '')
 
+# Minutes checkout holds stock for an unpaid order before release_expired_reservations frees it
+RESERVATION_TTL_MINUTES = int(os.environ.get('RESERVATION_TTL_MINUTES', '15'))
+
+# How long the response to a request sent with an Idempotency-Key is replayed to retries
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))  # seconds
+# How long a key stays claimed by a request that never finished (e.g. its worker was killed)
+# before a retry may take it over; keep it above the slowest payment provider call
+IDEMPOTENCY_KEY_LEASE = int(os.environ.get('IDEMPOTENCY_KEY_LEASE', '120'))  # seconds
+
 # PayPal settings
 PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID', 'sb')  # Default to sandbox
 PAYPAL_CLIENT_SECRET = os.environ.get('PAYPAL_CLIENT_SECRET', '')  # For sandbox, can be empty
 PAYPAL_SANDBOX = os.environ.get('PAYPAL_SANDBOX', 'True') == 'True'  # True by default for testing
+# API host override, e.g. a local fake PayPal; defaults to the sandbox or live API
+PAYPAL_API_BASE = os.environ.get('PAYPAL_API_BASE', '')
+PAYPAL_CONNECT_TIMEOUT = float(os.environ.get('PAYPAL_CONNECT_TIMEOUT', '5'))  # seconds
+PAYPAL_READ_TIMEOUT = float(os.environ.get('PAYPAL_READ_TIMEOUT', '15'))  # seconds
+PAYPAL_MAX_RETRIES = int(os.environ.get('PAYPAL_MAX_RETRIES', '2'))  # retries of timeouts, 429s and 5xx
 
 # If True, PayPal API is not actually called but payments are simulated as successful
 # This is for development when you don't want to interact with the PayPal sandbox
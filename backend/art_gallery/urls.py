@@ -1,13 +1,18 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from art_gallery.api.storage import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('art_gallery.api.urls')),
 ]
 
-# Add media serving for development
-if settings.DEBUG and getattr(settings, 'MEDIA_SERVING', False):
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) 
\ No newline at end of file
+# Media serving: Django streams files in development, the front proxy does it
+# when X-Accel-Redirect/X-Sendfile offloading is configured
+media_offloaded = settings.MEDIA_ACCEL_REDIRECT_PREFIX or settings.MEDIA_SENDFILE
+if getattr(settings, 'MEDIA_SERVING', False) and (settings.DEBUG or media_offloaded):
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+    ] 
\ No newline at end of file
@@ -54,13 +54,9 @@ function App() {
         <Route path="register" element={
           user ? <Navigate to="/" replace /> : <RegisterPage />
         } />
+        <Route path="cart" element={<CartPage />} />
         
         {/* Private Routes */}
-        <Route path="cart" element={
-          <PrivateRoute>
-            <CartPage />
-          </PrivateRoute>
-        } />
         <Route path="checkout" element={
           <PrivateRoute>
             <CheckoutPage />
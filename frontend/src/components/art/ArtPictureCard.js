@@ -3,15 +3,21 @@ import { Link } from 'react-router-dom';
 import { Card, Button } from 'react-bootstrap';
 
 const ArtPictureCard = ({ artPicture }) => {
+  // Grid-sized rendition generated on upload; falls back to the original image
+  const thumbnail = artPicture.image_srcset?.thumbnail;
+  
   return (
     <Card className="h-100">
-      <Card.Img 
-        variant="top" 
-        src={artPicture.image} 
-        alt={artPicture.title}
-        className="img-fluid"
-        style={{ height: '200px', objectFit: 'cover' }}
-      />
+      <picture>
+        {thumbnail && <source srcSet={thumbnail.webp} type="image/webp" />}
+        <Card.Img 
+          variant="top" 
+          src={thumbnail ? thumbnail.jpeg : artPicture.image} 
+          alt={artPicture.title}
+          className="img-fluid"
+          style={{ height: '200px', objectFit: 'cover' }}
+        />
+      </picture>
       <Card.Body className="d-flex flex-column">
         <Card.Title>{artPicture.title}</Card.Title>
         <Card.Text>
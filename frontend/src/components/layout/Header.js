@@ -7,7 +7,8 @@ import { resetCart } from '../../store/slices/cartSlice';
 
 const Header = () => {
   const { isAuthenticated, isAdmin, user } = useSelector(state => state.auth);
-  const { cart } = useSelector(state => state.cart);
+  const { cart, summary } = useSelector(state => state.cart);
+  const cartCount = cart?.item_count ?? summary?.item_count ?? 0;
   const dispatch = useDispatch();
   const navigate = useNavigate();
   const location = useLocation();
@@ -65,20 +66,21 @@ const Header = () => {
                 Gallery
               </Nav.Link>
               
+              <Nav.Link 
+                as={Link} 
+                to="/cart" 
+                className={isActive('/cart') ? 'active' : ''}
+              >
+                Cart
+                {cartCount > 0 && (
+                  <Badge pill bg="primary" className="ms-1">
+                    {cartCount}
+                  </Badge>
+                )}
+              </Nav.Link>
+              
               {isAuthenticated && (
                 <>
-                  <Nav.Link 
-                    as={Link} 
-                    to="/cart" 
-                    className={isActive('/cart') ? 'active' : ''}
-                  >
-                    Cart
-                    {cart && cart.items && cart.items.length > 0 && (
-                      <Badge pill bg="primary" className="ms-1">
-                        {cart.items.length}
-                      </Badge>
-                    )}
-                  </Nav.Link>
                   <Nav.Link 
                     as={Link} 
                     to="/orders" 
@@ -11,7 +11,6 @@ const ArtPictureDetailPage = () => {
   const dispatch = useDispatch();
   
   const { currentArtPicture, loading, error } = useSelector(state => state.artPictures);
-  const { isAuthenticated } = useSelector(state => state.auth);
   const { loading: cartLoading, error: cartError } = useSelector(state => state.cart);
   
   const [quantity, setQuantity] = useState(1);
@@ -31,11 +30,6 @@ const ArtPictureDetailPage = () => {
   };
   
   const handleAddToCart = () => {
-    if (!isAuthenticated) {
-      navigate('/login');
-      return;
-    }
-    
     dispatch(addItemToCart({
       art_picture_id: currentArtPicture.id,
       quantity
@@ -106,10 +100,14 @@ const ArtPictureDetailPage = () => {
                   <Form.Control
                     type="number"
                     min="1"
+                    max={currentArtPicture.stock}
                     value={quantity}
                     onChange={handleQuantityChange}
                     style={{ width: '100px' }}
                   />
+                  {currentArtPicture.stock > 1 && (
+                    <Form.Text muted>{currentArtPicture.stock} available</Form.Text>
+                  )}
                 </Form.Group>
               </Form>
               
@@ -4,6 +4,7 @@ import { useDispatch, useSelector } from 'react-redux';
 import { Container, Row, Col, Form, Button, Alert, Card } from 'react-bootstrap';
 import { fetchCart } from '../store/slices/cartSlice';
 import { createOrder } from '../store/slices/ordersSlice';
+import { fetchAddresses } from '../store/slices/addressesSlice';
 
 // Note: Make sure to create a .env file in the frontend directory with:
 // REACT_APP_MY_PHONE=your_whatsapp_phone_number (without +, just digits)
@@ -15,6 +16,7 @@ const CheckoutPage = () => {
   
   const { cart, loading: cartLoading, error: cartError } = useSelector(state => state.cart);
   const { currentOrder, loading, error } = useSelector(state => state.orders);
+  const { addresses } = useSelector(state => state.addresses);
   
   const [checkoutData, setCheckoutData] = useState({
     shipping_address: '',
@@ -57,6 +59,7 @@ const CheckoutPage = () => {
   
   useEffect(() => {
     dispatch(fetchCart());
+    dispatch(fetchAddresses());
   }, [dispatch]);
   
   useEffect(() => {
@@ -92,6 +95,15 @@ const CheckoutPage = () => {
     }
   };
   
+  // Fill a form from the address book; the server matches it to the saved entry
+  const handleSavedAddress = (addressType, addressId) => {
+    const saved = addresses.find(address => address.id === parseInt(addressId, 10));
+    if (!saved) return;
+    ['street', 'city', 'state', 'zipcode', 'country'].forEach(field => {
+      handleAddressChange(addressType, field, saved[field]);
+    });
+  };
+  
   const handleSameAsShipping = (e) => {
     const checked = e.target.checked;
     setCheckoutData(prev => ({
@@ -289,6 +301,22 @@ const CheckoutPage = () => {
               
               <Form onSubmit={handleSubmit}>
                 <h4 className="mb-3">Shipping Address</h4>
+                {addresses.length > 0 && (
+                  <Form.Group controlId="shipping_saved" className="mb-3">
+                    <Form.Label>Saved Addresses</Form.Label>
+                    <Form.Select
+                      defaultValue=""
+                      onChange={(e) => handleSavedAddress('shipping_address', e.target.value)}
+                    >
+                      <option value="" disabled>Use a saved address...</option>
+                      {addresses.map(address => (
+                        <option key={address.id} value={address.id}>
+                          {address.street}, {address.city}, {address.state} {address.zipcode}
+                        </option>
+                      ))}
+                    </Form.Select>
+                  </Form.Group>
+                )}
                 <Row className="mb-3">
                   <Col md={12}>
                     <Form.Group controlId="shipping_street">
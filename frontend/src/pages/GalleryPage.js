@@ -1,12 +1,12 @@
 import React, { useEffect, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { Container, Row, Col, Form, InputGroup } from 'react-bootstrap';
-import { fetchArtPictures } from '../store/slices/artPicturesSlice';
+import { Container, Row, Col, Form, InputGroup, Button } from 'react-bootstrap';
+import { fetchArtPictures, fetchMoreArtPictures, searchArtPictures, clearSearch } from '../store/slices/artPicturesSlice';
 import ArtPictureCard from '../components/art/ArtPictureCard';
 
 const GalleryPage = () => {
   const dispatch = useDispatch();
-  const { artPictures, loading, error } = useSelector(state => state.artPictures);
+  const { artPictures, nextPage, searchResults, loading, error } = useSelector(state => state.artPictures);
   
   const [searchTerm, setSearchTerm] = useState('');
   const [priceRange, setPriceRange] = useState({ min: '', max: '' });
@@ -16,20 +16,35 @@ const GalleryPage = () => {
     dispatch(fetchArtPictures());
   }, [dispatch]);
   
+  // Search on the server once the user stops typing
+  useEffect(() => {
+    const query = searchTerm.trim();
+    if (!query) {
+      dispatch(clearSearch());
+      return undefined;
+    }
+    const timeout = setTimeout(() => {
+      dispatch(searchArtPictures({ q: query, limit: 100 }));
+    }, 300);
+    return () => clearTimeout(timeout);
+  }, [dispatch, searchTerm]);
+  
+  const isSearching = searchTerm.trim() !== '' && searchResults !== null;
+  
   // Filter and sort art pictures
-  const filteredArtPictures = artPictures
+  const filteredArtPictures = (isSearching ? searchResults : artPictures)
     .filter(art => {
-      // Filter by search term
-      const searchMatch = art.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                          art.description.toLowerCase().includes(searchTerm.toLowerCase());
-      
       // Filter by price range
       const minPriceMatch = priceRange.min === '' || Number(art.price) >= Number(priceRange.min);
       const maxPriceMatch = priceRange.max === '' || Number(art.price) <= Number(priceRange.max);
       
-      return searchMatch && minPriceMatch && maxPriceMatch;
+      return minPriceMatch && maxPriceMatch;
     })
     .sort((a, b) => {
+      // Search results keep their relevance ranking unless the user picks another order
+      if (isSearching && sortOption === 'relevance') {
+        return b.relevance - a.relevance;
+      }
       // Sort based on selected option
       switch (sortOption) {
         case 'newest':
@@ -50,7 +65,14 @@ const GalleryPage = () => {
     });
   
   const handleSearchChange = (e) => {
-    setSearchTerm(e.target.value);
+    const value = e.target.value;
+    setSearchTerm(value);
+    // Default to relevance ordering while searching
+    if (value.trim() !== '' && sortOption === 'newest') {
+      setSortOption('relevance');
+    } else if (value.trim() === '' && sortOption === 'relevance') {
+      setSortOption('newest');
+    }
   };
   
   const handleMinPriceChange = (e) => {
@@ -65,6 +87,10 @@ const GalleryPage = () => {
     setSortOption(e.target.value);
   };
   
+  const handleLoadMore = () => {
+    dispatch(fetchMoreArtPictures());
+  };
+  
   return (
     <div className="gallery-page">
       <Container>
@@ -117,6 +143,7 @@ const GalleryPage = () => {
                 value={sortOption}
                 onChange={handleSortChange}
               >
+                {searchTerm.trim() !== '' && <option value="relevance">Relevance</option>}
                 <option value="newest">Newest First</option>
                 <option value="oldest">Oldest First</option>
                 <option value="price-low">Price: Low to High</option>
@@ -129,7 +156,7 @@ const GalleryPage = () => {
         </Row>
         
         {/* Art Pictures Grid */}
-        {loading ? (
+        {loading && artPictures.length === 0 ? (
           <p className="text-center">Loading artwork...</p>
         ) : error ? (
           <p className="text-center text-danger">Error loading artwork: {error}</p>
@@ -144,6 +171,14 @@ const GalleryPage = () => {
             ))}
           </Row>
         )}
+        
+        {nextPage && !isSearching && (
+          <div className="text-center my-4">
+            <Button variant="outline-primary" onClick={handleLoadMore} disabled={loading}>
+              {loading ? 'Loading...' : 'Load More'}
+            </Button>
+          </div>
+        )}
       </Container>
     </div>
   );
@@ -3,6 +3,7 @@ import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux';
 import { Container, Row, Col, Form, Button, Alert, InputGroup } from 'react-bootstrap';
 import { loginUser, clearError } from '../store/slices/authSlice';
+import { fetchCart } from '../store/slices/cartSlice';
 
 const LoginPage = () => {
   const [credentials, setCredentials] = useState({
@@ -43,6 +44,8 @@ const LoginPage = () => {
     dispatch(loginUser(credentials))
       .unwrap()
       .then(() => {
+        // The guest cart was merged into the user's cart on login
+        dispatch(fetchCart());
         navigate(from, { replace: true });
       })
       .catch(err => {
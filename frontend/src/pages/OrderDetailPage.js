@@ -1,7 +1,7 @@
 import React, { useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux';
-import { fetchOrderById } from '../store/slices/ordersSlice';
+import { fetchOrderById, fetchOrderReceipt } from '../store/slices/ordersSlice';
 
 const OrderDetailPage = () => {
   const { id } = useParams();
@@ -14,6 +14,18 @@ const OrderDetailPage = () => {
     }
   }, [dispatch, id]);
 
+  // Open the receipt in a new tab; it's fetched with the auth header, so it can't be a plain link
+  const handleViewReceipt = async () => {
+    try {
+      const html = await dispatch(fetchOrderReceipt(currentOrder.id)).unwrap();
+      const url = URL.createObjectURL(new Blob([html], { type: 'text/html' }));
+      window.open(url, '_blank');
+      setTimeout(() => URL.revokeObjectURL(url), 60000);
+    } catch (error) {
+      alert(error.error || 'Failed to load the receipt');
+    }
+  };
+
   // Safe format for currency - handles undefined or null values
   const formatCurrency = (value) => {
     return value ? `$${parseFloat(value).toFixed(2)}` : '$0.00';
@@ -100,6 +112,11 @@ const OrderDetailPage = () => {
             )}
           </div>
         )}
+        {['paid', 'shipped', 'delivered', 'cancelled'].includes(currentOrder.status) && (
+          <button className="btn btn-outline view-receipt" onClick={handleViewReceipt}>
+            View Receipt
+          </button>
+        )}
       </div>
 
       <div className="order-items">
@@ -1,11 +1,11 @@
 import React, { useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux';
-import { fetchOrders } from '../store/slices/ordersSlice';
+import { fetchOrders, fetchMoreOrders } from '../store/slices/ordersSlice';
 
 const OrdersPage = () => {
   const dispatch = useDispatch();
-  const { orders, loading, error } = useSelector(state => state.orders);
+  const { orders, nextPage, loadingMore, loading, error } = useSelector(state => state.orders);
 
   useEffect(() => {
     dispatch(fetchOrders());
@@ -53,6 +53,15 @@ const OrdersPage = () => {
               </Link>
             </div>
           ))}
+          {nextPage && (
+            <button
+              className="btn btn-outline load-more"
+              onClick={() => dispatch(fetchMoreOrders())}
+              disabled={loadingMore}
+            >
+              {loadingMore ? 'Loading...' : 'Load More'}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { 
   fetchArtPictures,
+  fetchMoreArtPictures,
   createArtPicture,
   updateArtPicture,
   deleteArtPicture
@@ -9,7 +10,7 @@ import {
 
 const ArtPictureManagementPage = () => {
   const dispatch = useDispatch();
-  const { artPictures, loading, error } = useSelector(state => state.artPictures);
+  const { artPictures, nextPage, loading, error } = useSelector(state => state.artPictures);
   
   const [showForm, setShowForm] = useState(false);
   const [editingId, setEditingId] = useState(null);
@@ -24,7 +25,7 @@ const ArtPictureManagementPage = () => {
   });
 
   useEffect(() => {
-    dispatch(fetchArtPictures());
+    dispatch(fetchArtPictures({ page_size: 100 }));
   }, [dispatch]);
 
   const handleInputChange = (e) => {
@@ -276,6 +277,14 @@ const ArtPictureManagementPage = () => {
               ))}
             </tbody>
           </table>
+          {nextPage && (
+            <button
+              className="btn btn-outline-primary"
+              onClick={() => dispatch(fetchMoreArtPictures())}
+            >
+              Load More
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -1,22 +1,23 @@
 import React, { useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux';
-import { fetchOrders } from '../../store/slices/ordersSlice';
+import { fetchOrders, fetchOrderStats } from '../../store/slices/ordersSlice';
 import './DashboardPage.css';
 
 const DashboardPage = () => {
   const dispatch = useDispatch();
-  const { orders, loading, error } = useSelector(state => state.orders);
+  const { orders, stats, loading, error } = useSelector(state => state.orders);
   const { user } = useSelector(state => state.auth);
 
-  // Fetch orders to calculate dashboard stats
+  // Totals are aggregated server-side; only the five most recent orders are loaded
   useEffect(() => {
-    dispatch(fetchOrders());
+    dispatch(fetchOrderStats());
+    dispatch(fetchOrders({ page_size: 5 }));
   }, [dispatch]);
 
-  // Calculate dashboard stats from orders
+  // Build dashboard stats from the aggregate endpoint
   const getDashboardStats = () => {
-    if (!orders || orders.length === 0) {
+    if (!stats) {
       return {
         totalOrders: 0,
         totalArtPictures: 0,
@@ -25,7 +26,7 @@ const DashboardPage = () => {
         recentOrders: [],
         ordersByStatus: {
           pending: 0,
-          processing: 0,
+          paid: 0,
           shipped: 0,
           delivered: 0,
           cancelled: 0
@@ -33,26 +34,19 @@ const DashboardPage = () => {
       };
     }
 
-    const totalRevenue = orders.reduce((sum, order) => sum + parseFloat(order.total_price || 0), 0);
-    const recentOrders = [...orders].sort((a, b) => 
-      new Date(b.created_at) - new Date(a.created_at)
-    ).slice(0, 5);
-
-    // Group orders by status
-    const ordersByStatus = orders.reduce((acc, order) => {
-      const status = (order.status || 'pending').toLowerCase();
-      acc[status] = (acc[status] || 0) + 1;
-      return acc;
-    }, {
+    const totalRevenue = parseFloat(stats.revenue || 0);
+    const recentOrders = (orders || []).slice(0, 5);
+    const ordersByStatus = {
       pending: 0,
-      processing: 0,
+      paid: 0,
       shipped: 0,
       delivered: 0,
-      cancelled: 0
-    });
+      cancelled: 0,
+      ...stats.by_status
+    };
 
     return {
-      totalOrders: orders.length,
+      totalOrders: stats.count,
       totalArtPictures: 0, // This would typically come from another API call
       unreadMessages: 0, // This would typically come from another API call
       totalRevenue,
@@ -111,8 +105,8 @@ const DashboardPage = () => {
             <div className="status-count">{dashboardStats.ordersByStatus.pending}</div>
           </div>
           <div className="status-card processing">
-            <h4>Processing</h4>
-            <div className="status-count">{dashboardStats.ordersByStatus.processing}</div>
+            <h4>Paid</h4>
+            <div className="status-count">{dashboardStats.ordersByStatus.paid}</div>
           </div>
           <div className="status-card shipped">
             <h4>Shipped</h4>
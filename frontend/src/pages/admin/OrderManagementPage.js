@@ -1,12 +1,12 @@
 import React, { useEffect, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { Link } from 'react-router-dom';
-import { fetchOrders, deleteOrder, updateOrderStatus, restoreOrder } from '../../store/slices/ordersSlice';
+import { fetchOrders, fetchMoreOrders, deleteOrder, updateOrderStatus, bulkTransitionOrders, restoreOrder } from '../../store/slices/ordersSlice';
 import './OrderManagementPage.css';
 
 const OrderManagementPage = () => {
   const dispatch = useDispatch();
-  const { orders, loading, error } = useSelector(state => state.orders);
+  const { orders, nextPage, loadingMore, loading, error } = useSelector(state => state.orders);
   const [statusFilter, setStatusFilter] = useState('all');
   const [expandedOrderId, setExpandedOrderId] = useState(null);
   const [localOrders, setLocalOrders] = useState([]);
@@ -50,8 +50,26 @@ const OrderManagementPage = () => {
       )
     );
     
-    // Dispatch action to update backend
-    dispatch(updateOrderStatus({ orderId, status: newStatus }));
+    // Dispatch action to update backend; a refused transition puts the stored status back
+    dispatch(updateOrderStatus({ orderId, status: newStatus }))
+      .unwrap()
+      .catch(error => {
+        setLocalOrders(orders.map(order => ({ ...order })));
+        alert(error.error || 'Failed to update order status');
+      });
+  };
+
+  // Move every selected order that allows it to the new status
+  const handleBulkStatusChange = async (newStatus) => {
+    try {
+      const result = await dispatch(bulkTransitionOrders({ orderIds: [...selectedOrders], status: newStatus })).unwrap();
+      if (result.skipped.length > 0) {
+        alert(`${result.moved.length} orders marked ${newStatus}, ${result.skipped.length} skipped (status does not allow it)`);
+      }
+      setSelectedOrders(new Set());
+    } catch (error) {
+      alert(error.error || 'Failed to update orders');
+    }
   };
 
   // New admin functions
@@ -154,6 +172,11 @@ const OrderManagementPage = () => {
         // Create proper order data structure for backend
         const restoreData = {
           user: orderToRestore.user,
+          // Keep the deleted order's identity and dates
+          order_number: orderToRestore.order_number,
+          created_at: orderToRestore.created_at,
+          paid_at: orderToRestore.paid_at,
+          payment_id: orderToRestore.payment_id,
           shipping_address: orderToRestore.shipping_address,
           billing_address: orderToRestore.billing_address,
           shipping_address_data: orderToRestore.shipping_address_structured || {
@@ -419,6 +442,18 @@ const OrderManagementPage = () => {
           >
             🗑️ Remove Selected
           </button>
+          <button 
+            className="btn btn-primary btn-sm"
+            onClick={() => handleBulkStatusChange('shipped')}
+          >
+            Mark Shipped
+          </button>
+          <button 
+            className="btn btn-success btn-sm"
+            onClick={() => handleBulkStatusChange('delivered')}
+          >
+            Mark Delivered
+          </button>
           <button 
             className="btn btn-secondary btn-sm"
             onClick={() => setSelectedOrders(new Set())}
@@ -505,7 +540,7 @@ const OrderManagementPage = () => {
           >
             <option value="all">All Orders</option>
             <option value="pending">Pending</option>
-            <option value="processing">Processing</option>
+            <option value="paid">Paid</option>
             <option value="shipped">Shipped</option>
             <option value="delivered">Delivered</option>
             <option value="cancelled">Cancelled</option>
@@ -633,15 +668,20 @@ const OrderManagementPage = () => {
                         <td>{formatCurrency(order.total_price || order.total)}</td>
                         <td>
                           <select
-                            value={order.status || 'Pending'}
+                            value={order.status || 'pending'}
                             onChange={(e) => handleStatusChange(order.id, e.target.value)}
                             className={`status-select status-${(order.status || 'pending').toLowerCase()}`}
                           >
-                            <option value="Pending">Pending</option>
-                            <option value="Processing">Processing</option>
-                            <option value="Shipped">Shipped</option>
-                            <option value="Delivered">Delivered</option>
-                            <option value="Cancelled">Cancelled</option>
+                            {/* Only the moves the order's current status allows */}
+                            {['pending', 'paid', 'shipped', 'delivered', 'cancelled'].map(value => (
+                              <option
+                                key={value}
+                                value={value}
+                                disabled={value !== order.status && !(order.next_statuses || []).includes(value)}
+                              >
+                                {value.charAt(0).toUpperCase() + value.slice(1)}
+                              </option>
+                            ))}
                           </select>
                         </td>
                         <td>
@@ -731,6 +771,15 @@ const OrderManagementPage = () => {
               </table>
             </div>
           ))}
+          {nextPage && (
+            <button
+              className="btn btn-outline load-more"
+              onClick={() => dispatch(fetchMoreOrders())}
+              disabled={loadingMore}
+            >
+              {loadingMore ? 'Loading...' : 'Load More Orders'}
+            </button>
+          )}
         </div>
       )}
     </div>
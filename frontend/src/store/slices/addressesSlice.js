@@ -0,0 +1,66 @@
+import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
+import api from '../../utils/api';
+
+// Fetch the user's saved addresses
+export const fetchAddresses = createAsyncThunk(
+  'addresses/fetchAddresses',
+  async (_, { rejectWithValue }) => {
+    try {
+      const response = await api.get('/api/addresses/');
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch addresses');
+    }
+  }
+);
+
+// Remove an address from the address book (past orders keep it)
+export const deleteAddress = createAsyncThunk(
+  'addresses/deleteAddress',
+  async (addressId, { rejectWithValue }) => {
+    try {
+      await api.delete(`/api/addresses/${addressId}/`);
+      return addressId;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to delete address');
+    }
+  }
+);
+
+const initialState = {
+  addresses: [],
+  loading: false,
+  error: null
+};
+
+const addressesSlice = createSlice({
+  name: 'addresses',
+  initialState,
+  reducers: {},
+  extraReducers: (builder) => {
+    builder
+      // Fetch addresses
+      .addCase(fetchAddresses.pending, (state) => {
+        state.loading = true;
+      })
+      .addCase(fetchAddresses.fulfilled, (state, action) => {
+        state.loading = false;
+        state.addresses = action.payload;
+        state.error = null;
+      })
+      .addCase(fetchAddresses.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
+      })
+      
+      // Delete address
+      .addCase(deleteAddress.fulfilled, (state, action) => {
+        state.addresses = state.addresses.filter(address => address.id !== action.payload);
+      })
+      .addCase(deleteAddress.rejected, (state, action) => {
+        state.error = action.payload;
+      });
+  },
+});
+
+export default addressesSlice.reducer;
@@ -1,12 +1,12 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
 import api from '../../utils/api';
 
-// Fetch all art pictures
+// Fetch the first page of art pictures
 export const fetchArtPictures = createAsyncThunk(
   'artPictures/fetchAll',
-  async (_, { rejectWithValue }) => {
+  async (params = {}, { rejectWithValue }) => {
     try {
-      const response = await api.get('/api/art-pictures/');
+      const response = await api.get('/api/art-pictures/', { params });
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to fetch art pictures');
@@ -14,6 +14,36 @@ export const fetchArtPictures = createAsyncThunk(
   }
 );
 
+// Fetch the next page of art pictures by following the opaque cursor URL
+export const fetchMoreArtPictures = createAsyncThunk(
+  'artPictures/fetchMore',
+  async (_, { getState, rejectWithValue }) => {
+    const { nextPage } = getState().artPictures;
+    if (!nextPage) {
+      return rejectWithValue('No more art pictures to load');
+    }
+    try {
+      const response = await api.get(nextPage);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch art pictures');
+    }
+  }
+);
+
+// Server-side full-text search with price/availability facets
+export const searchArtPictures = createAsyncThunk(
+  'artPictures/search',
+  async (params, { rejectWithValue }) => {
+    try {
+      const response = await api.get('/api/art-pictures/search/', { params });
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to search art pictures');
+    }
+  }
+);
+
 // Fetch a single art picture by ID
 export const fetchArtPictureById = createAsyncThunk(
   'artPictures/fetchById',
@@ -75,6 +105,19 @@ export const updateArtPicture = createAsyncThunk(
   }
 );
 
+// Update price/availability of many art pictures in one request (admin only)
+export const bulkUpdateArtPictures = createAsyncThunk(
+  'artPictures/bulkUpdate',
+  async (updates, { rejectWithValue }) => {
+    try {
+      await api.post('/api/art-pictures/bulk_update/', updates);
+      return updates;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to update art pictures');
+    }
+  }
+);
+
 // Delete an art picture (admin only)
 export const deleteArtPicture = createAsyncThunk(
   'artPictures/delete',
@@ -90,6 +133,9 @@ export const deleteArtPicture = createAsyncThunk(
 
 const initialState = {
   artPictures: [],
+  nextPage: null,
+  searchResults: null,
+  facets: null,
   currentArtPicture: null,
   loading: false,
   error: null,
@@ -105,6 +151,10 @@ const artPicturesSlice = createSlice({
     clearError: (state) => {
       state.error = null;
     },
+    clearSearch: (state) => {
+      state.searchResults = null;
+      state.facets = null;
+    },
   },
   extraReducers: (builder) => {
     builder
@@ -114,7 +164,8 @@ const artPicturesSlice = createSlice({
       })
       .addCase(fetchArtPictures.fulfilled, (state, action) => {
         state.loading = false;
-        state.artPictures = action.payload;
+        state.artPictures = action.payload.results;
+        state.nextPage = action.payload.next;
         state.error = null;
       })
       .addCase(fetchArtPictures.rejected, (state, action) => {
@@ -122,6 +173,36 @@ const artPicturesSlice = createSlice({
         state.error = action.payload;
       })
       
+      // Fetch next page
+      .addCase(fetchMoreArtPictures.pending, (state) => {
+        state.loading = true;
+      })
+      .addCase(fetchMoreArtPictures.fulfilled, (state, action) => {
+        state.loading = false;
+        state.artPictures = state.artPictures.concat(action.payload.results);
+        state.nextPage = action.payload.next;
+        state.error = null;
+      })
+      .addCase(fetchMoreArtPictures.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
+      })
+      
+      // Search
+      .addCase(searchArtPictures.pending, (state) => {
+        state.loading = true;
+      })
+      .addCase(searchArtPictures.fulfilled, (state, action) => {
+        state.loading = false;
+        state.searchResults = action.payload.results;
+        state.facets = action.payload.facets;
+        state.error = null;
+      })
+      .addCase(searchArtPictures.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
+      })
+      
       // Fetch by ID
       .addCase(fetchArtPictureById.pending, (state) => {
         state.loading = true;
@@ -170,6 +251,25 @@ const artPicturesSlice = createSlice({
         state.error = action.payload;
       })
       
+      // Bulk update
+      .addCase(bulkUpdateArtPictures.pending, (state) => {
+        state.loading = true;
+      })
+      .addCase(bulkUpdateArtPictures.fulfilled, (state, action) => {
+        state.loading = false;
+        action.payload.forEach(({ id, ...changes }) => {
+          const index = state.artPictures.findIndex(pic => pic.id === id);
+          if (index !== -1) {
+            state.artPictures[index] = { ...state.artPictures[index], ...changes };
+          }
+        });
+        state.error = null;
+      })
+      .addCase(bulkUpdateArtPictures.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
+      })
+      
       // Delete
       .addCase(deleteArtPicture.pending, (state) => {
         state.loading = true;
@@ -189,5 +289,5 @@ const artPicturesSlice = createSlice({
   },
 });
 
-export const { clearCurrentArtPicture, clearError } = artPicturesSlice.actions;
+export const { clearCurrentArtPicture, clearError, clearSearch } = artPicturesSlice.actions;
 export default artPicturesSlice.reducer; 
\ No newline at end of file
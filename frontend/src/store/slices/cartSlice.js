@@ -1,12 +1,47 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
 import api from '../../utils/api';
 
+// Visitors who aren't logged in get a cache-backed guest cart with the same actions
+const cartUrl = (action) => {
+  const base = localStorage.getItem('access_token') ? '/api/carts' : '/api/guest-cart';
+  return `${base}/${action}/`;
+};
+
+// Mutations ask for a compact delta (changed lines, removed ids, new totals)
+// instead of the whole cart
+const deltaParams = { params: { delta: 1 } };
+
+const applyCartDelta = (state, delta) => {
+  state.summary = {
+    item_count: delta.item_count,
+    total_price: delta.total_price,
+    version: delta.version,
+  };
+  if (!state.cart) {
+    return;
+  }
+  const removed = new Set(delta.removed);
+  const items = state.cart.items.filter(item => !removed.has(item.id));
+  delta.items.forEach(changed => {
+    const index = items.findIndex(item => item.id === changed.id);
+    if (index !== -1) {
+      items[index] = changed;
+    } else {
+      items.push(changed);
+    }
+  });
+  state.cart.items = items;
+  state.cart.item_count = delta.item_count;
+  state.cart.total_price = delta.total_price;
+  state.cart.version = delta.version;
+};
+
 // Fetch the cart
 export const fetchCart = createAsyncThunk(
   'cart/fetchCart',
   async (_, { rejectWithValue }) => {
     try {
-      const response = await api.get('/api/carts/my_cart/');
+      const response = await api.get(cartUrl('my_cart'));
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to fetch cart');
@@ -14,15 +49,28 @@ export const fetchCart = createAsyncThunk(
   }
 );
 
+// Fetch just the cart's item count, total and version (cheap single-row read)
+export const fetchCartSummary = createAsyncThunk(
+  'cart/fetchSummary',
+  async (_, { rejectWithValue }) => {
+    try {
+      const response = await api.get(cartUrl('summary'));
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch cart summary');
+    }
+  }
+);
+
 // Add item to cart
 export const addItemToCart = createAsyncThunk(
   'cart/addItem',
   async ({ art_picture_id, quantity }, { rejectWithValue }) => {
     try {
-      const response = await api.post('/api/carts/add_item/', {
+      const response = await api.post(cartUrl('add_item'), {
         art_picture_id,
         quantity,
-      });
+      }, deltaParams);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to add item to cart');
@@ -35,8 +83,8 @@ export const removeItemFromCart = createAsyncThunk(
   'cart/removeItem',
   async (item_id, { rejectWithValue }) => {
     try {
-      await api.post('/api/carts/remove_item/', { item_id });
-      return item_id;
+      const response = await api.post(cartUrl('remove_item'), { item_id }, deltaParams);
+      return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to remove item from cart');
     }
@@ -48,10 +96,10 @@ export const updateItemQuantity = createAsyncThunk(
   'cart/updateItemQuantity',
   async ({ item_id, quantity }, { rejectWithValue }) => {
     try {
-      const response = await api.post('/api/carts/update_item_quantity/', {
+      const response = await api.post(cartUrl('update_item_quantity'), {
         item_id,
         quantity,
-      });
+      }, deltaParams);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to update item quantity');
@@ -59,13 +107,27 @@ export const updateItemQuantity = createAsyncThunk(
   }
 );
 
+// Apply several cart changes in one request, e.g.
+// [{ op: 'add', art_picture_id: 1, quantity: 2 }, { op: 'remove', art_picture_id: 3 }]
+export const batchCartOperations = createAsyncThunk(
+  'cart/batch',
+  async (operations, { rejectWithValue }) => {
+    try {
+      const response = await api.post(cartUrl('batch'), { operations }, deltaParams);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to update cart');
+    }
+  }
+);
+
 // Clear cart
 export const clearCart = createAsyncThunk(
   'cart/clearCart',
   async (_, { rejectWithValue }) => {
     try {
-      await api.post('/api/carts/clear/');
-      return null;
+      const response = await api.post(cartUrl('clear'), null, deltaParams);
+      return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to clear cart');
     }
@@ -74,6 +136,7 @@ export const clearCart = createAsyncThunk(
 
 const initialState = {
   cart: null,
+  summary: null,
   loading: false,
   error: null,
 };
@@ -87,6 +150,7 @@ const cartSlice = createSlice({
     },
     resetCart: (state) => {
       state.cart = null;
+      state.summary = null;
       state.loading = false;
       state.error = null;
     },
@@ -100,6 +164,11 @@ const cartSlice = createSlice({
       .addCase(fetchCart.fulfilled, (state, action) => {
         state.loading = false;
         state.cart = action.payload;
+        state.summary = {
+          item_count: action.payload.item_count,
+          total_price: action.payload.total_price,
+          version: action.payload.version,
+        };
         state.error = null;
       })
       .addCase(fetchCart.rejected, (state, action) => {
@@ -107,13 +176,18 @@ const cartSlice = createSlice({
         state.error = action.payload;
       })
       
+      // Fetch summary
+      .addCase(fetchCartSummary.fulfilled, (state, action) => {
+        state.summary = action.payload;
+      })
+      
       // Add item
       .addCase(addItemToCart.pending, (state) => {
         state.loading = true;
       })
       .addCase(addItemToCart.fulfilled, (state, action) => {
         state.loading = false;
-        state.cart = action.payload;
+        applyCartDelta(state, action.payload);
         state.error = null;
       })
       .addCase(addItemToCart.rejected, (state, action) => {
@@ -127,9 +201,7 @@ const cartSlice = createSlice({
       })
       .addCase(removeItemFromCart.fulfilled, (state, action) => {
         state.loading = false;
-        if (state.cart) {
-          state.cart.items = state.cart.items.filter(item => item.id !== action.payload);
-        }
+        applyCartDelta(state, action.payload);
         state.error = null;
       })
       .addCase(removeItemFromCart.rejected, (state, action) => {
@@ -143,12 +215,7 @@ const cartSlice = createSlice({
       })
       .addCase(updateItemQuantity.fulfilled, (state, action) => {
         state.loading = false;
-        if (state.cart) {
-          const index = state.cart.items.findIndex(item => item.id === action.payload.id);
-          if (index !== -1) {
-            state.cart.items[index] = action.payload;
-          }
-        }
+        applyCartDelta(state, action.payload);
         state.error = null;
       })
       .addCase(updateItemQuantity.rejected, (state, action) => {
@@ -160,17 +227,28 @@ const cartSlice = createSlice({
       .addCase(clearCart.pending, (state) => {
         state.loading = true;
       })
-      .addCase(clearCart.fulfilled, (state) => {
+      .addCase(clearCart.fulfilled, (state, action) => {
         state.loading = false;
-        if (state.cart) {
-          state.cart.items = [];
-          state.cart.total_price = 0;
-        }
+        applyCartDelta(state, action.payload);
         state.error = null;
       })
       .addCase(clearCart.rejected, (state, action) => {
         state.loading = false;
         state.error = action.payload;
+      })
+      
+      // Batch operations
+      .addCase(batchCartOperations.pending, (state) => {
+        state.loading = true;
+      })
+      .addCase(batchCartOperations.fulfilled, (state, action) => {
+        state.loading = false;
+        applyCartDelta(state, action.payload);
+        state.error = null;
+      })
+      .addCase(batchCartOperations.rejected, (state, action) => {
+        state.loading = false;
+        state.error = action.payload;
       });
   },
 });
@@ -1,12 +1,12 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
-import api from '../../utils/api';
+import api, { postIdempotent } from '../../utils/api';
 
-// Fetch user orders
+// Fetch the first page of user orders (newest first)
 export const fetchOrders = createAsyncThunk(
   'orders/fetchOrders',
-  async (_, { rejectWithValue }) => {
+  async (params = {}, { rejectWithValue }) => {
     try {
-      const response = await api.get('/api/orders/');
+      const response = await api.get('/api/orders/', { params });
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to fetch orders');
@@ -14,6 +14,32 @@ export const fetchOrders = createAsyncThunk(
   }
 );
 
+// Fetch the next page of orders using the cursor link from the last page
+export const fetchMoreOrders = createAsyncThunk(
+  'orders/fetchMoreOrders',
+  async (_, { getState, rejectWithValue }) => {
+    try {
+      const response = await api.get(getState().orders.nextPage);
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch more orders');
+    }
+  }
+);
+
+// Fetch order totals (count, revenue, per status) without loading every order
+export const fetchOrderStats = createAsyncThunk(
+  'orders/fetchOrderStats',
+  async (_, { rejectWithValue }) => {
+    try {
+      const response = await api.get('/api/orders/stats/');
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch order stats');
+    }
+  }
+);
+
 // Fetch single order
 export const fetchOrderById = createAsyncThunk(
   'orders/fetchOrderById',
@@ -27,12 +53,25 @@ export const fetchOrderById = createAsyncThunk(
   }
 );
 
+// Fetch the printable HTML receipt of a paid order
+export const fetchOrderReceipt = createAsyncThunk(
+  'orders/fetchOrderReceipt',
+  async (orderId, { rejectWithValue }) => {
+    try {
+      const response = await api.get(`/api/orders/${orderId}/receipt/`, { responseType: 'text' });
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to fetch receipt');
+    }
+  }
+);
+
 // Create order (checkout)
 export const createOrder = createAsyncThunk(
   'orders/createOrder',
   async (orderData, { rejectWithValue }) => {
     try {
-      const response = await api.post('/api/orders/checkout/', orderData);
+      const response = await postIdempotent('/api/orders/checkout/', orderData);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to create order');
@@ -45,7 +84,7 @@ export const processPayment = createAsyncThunk(
   'orders/processPayment',
   async ({ orderId, paymentData }, { rejectWithValue }) => {
     try {
-      const response = await api.post(`/api/orders/${orderId}/process_payment/`, paymentData);
+      const response = await postIdempotent(`/api/orders/${orderId}/process_payment/`, paymentData);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to process payment');
@@ -79,12 +118,25 @@ export const updateOrderStatus = createAsyncThunk(
   }
 );
 
+// Move many orders to a new status at once (admin only)
+export const bulkTransitionOrders = createAsyncThunk(
+  'orders/bulkTransitionOrders',
+  async ({ orderIds, status }, { rejectWithValue }) => {
+    try {
+      const response = await api.post('/api/orders/bulk_transition/', { order_ids: orderIds, status });
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || 'Failed to update orders');
+    }
+  }
+);
+
 // Restore order (admin only - recreate a deleted order)
 export const restoreOrder = createAsyncThunk(
   'orders/restoreOrder',
   async (orderData, { rejectWithValue }) => {
     try {
-      const response = await api.post('/api/orders/restore_order/', orderData);
+      const response = await postIdempotent('/api/orders/restore_order/', orderData);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || 'Failed to restore order');
@@ -94,6 +146,9 @@ export const restoreOrder = createAsyncThunk(
 
 const initialState = {
   orders: [],
+  nextPage: null,
+  loadingMore: false,
+  stats: null,
   currentOrder: null,
   loading: false,
   paymentLoading: false,
@@ -126,7 +181,8 @@ const ordersSlice = createSlice({
       })
       .addCase(fetchOrders.fulfilled, (state, action) => {
         state.loading = false;
-        state.orders = action.payload;
+        state.orders = action.payload.results;
+        state.nextPage = action.payload.next;
         state.error = null;
       })
       .addCase(fetchOrders.rejected, (state, action) => {
@@ -134,6 +190,29 @@ const ordersSlice = createSlice({
         state.error = action.payload;
       })
       
+      // Fetch more orders
+      .addCase(fetchMoreOrders.pending, (state) => {
+        state.loadingMore = true;
+      })
+      .addCase(fetchMoreOrders.fulfilled, (state, action) => {
+        state.loadingMore = false;
+        state.orders.push(...action.payload.results);
+        state.nextPage = action.payload.next;
+        state.error = null;
+      })
+      .addCase(fetchMoreOrders.rejected, (state, action) => {
+        state.loadingMore = false;
+        state.error = action.payload;
+      })
+      
+      // Fetch order stats
+      .addCase(fetchOrderStats.fulfilled, (state, action) => {
+        state.stats = action.payload;
+      })
+      .addCase(fetchOrderStats.rejected, (state, action) => {
+        state.error = action.payload;
+      })
+      
       // Fetch order by ID
       .addCase(fetchOrderById.pending, (state) => {
         state.loading = true;
@@ -154,7 +233,7 @@ const ordersSlice = createSlice({
       })
       .addCase(createOrder.fulfilled, (state, action) => {
         state.loading = false;
-        state.orders.push(action.payload);
+        state.orders.unshift(action.payload);
         state.currentOrder = action.payload;
         state.error = null;
       })
@@ -226,13 +305,28 @@ const ordersSlice = createSlice({
         state.error = action.payload;
       })
       
+      // Bulk status change
+      .addCase(bulkTransitionOrders.fulfilled, (state, action) => {
+        const { moved, status } = action.payload;
+        const movedIds = new Set(moved);
+        state.orders.forEach(order => {
+          if (movedIds.has(order.id)) {
+            order.status = status;
+          }
+        });
+        state.error = null;
+      })
+      .addCase(bulkTransitionOrders.rejected, (state, action) => {
+        state.error = action.payload;
+      })
+      
       // Restore order
       .addCase(restoreOrder.pending, (state) => {
         state.loading = true;
       })
       .addCase(restoreOrder.fulfilled, (state, action) => {
         state.loading = false;
-        state.orders.push(action.payload);
+        state.orders.unshift(action.payload);
         state.error = null;
       })
       .addCase(restoreOrder.rejected, (state, action) => {
@@ -8,6 +8,7 @@ import cartReducer from './slices/cartSlice';
 import ordersReducer from './slices/ordersSlice';
 import orderUserViewReducer from './slices/orderUserViewSlice';
 import messagesReducer from './slices/messagesSlice';
+import addressesReducer from './slices/addressesSlice';
 
 // Persist configuration
 const persistConfig = {
@@ -24,6 +25,7 @@ const rootReducer = combineReducers({
   orders: ordersReducer,
   orderUserView: orderUserViewReducer,
   messages: messagesReducer,
+  addresses: addressesReducer,
 });
 
 // Create persisted reducer
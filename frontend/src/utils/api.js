@@ -3,6 +3,8 @@ import axios from 'axios';
 // Create axios instance
 const api = axios.create({
   baseURL: process.env.REACT_APP_API_URL || '',
+  // Send the signed guest cart cookie to the API
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
@@ -66,4 +68,25 @@ api.interceptors.response.use(
   }
 );
 
-export default api; 
\ No newline at end of file
+// POST that is safe to retry: every attempt carries the same Idempotency-Key,
+// so the server replays the first response instead of creating a second
+// order or charging twice when only the response got lost
+const newIdempotencyKey = () => (
+  window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+);
+
+export const postIdempotent = async (url, data, retries = 2) => {
+  const headers = { 'Idempotency-Key': newIdempotencyKey() };
+  for (let attempt = 0; ; attempt += 1) {
+    try {
+      return await api.post(url, data, { headers });
+    } catch (error) {
+      // Only network failures (no response at all) are retried
+      if (error.response || attempt >= retries) {
+        throw error;
+      }
+    }
+  }
+};
+
+export default api;